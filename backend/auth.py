@@ -0,0 +1,85 @@
+"""Verification of HS256 access tokens, with a cache of decoded claims.
+
+Dashboards poll the read endpoints with the same token for its whole
+lifetime, so verified claims are kept in a bounded LRU keyed by the SHA-256
+of the token: a repeat request costs one hash and a dict lookup instead of a
+signature check and JSON decode.  An entry never outlives the token's
+``exp``, and only tokens that verified are cached.
+
+Several keys can be active at once for rotation.  The first key signs new
+tokens and every key verifies; tokens carry a ``kid`` header (a digest of
+the key, not the key itself) so verification picks the right key directly.
+Tokens without ``kid`` are tried against each key in turn.  Replacing the
+keys drops the cache, so a retired key stops working immediately.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import jwt
+
+ALGORITHM = "HS256"
+
+
+def key_id(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+class TokenVerifier:
+    def __init__(self, keys: List[str], max_entries: int = 10000, clock=time.time):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._cache: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.set_keys(keys)
+
+    def set_keys(self, keys: List[str]):
+        """Replace the active keys; the first one signs new tokens."""
+        keys = [key for key in keys if key]
+        if not keys:
+            raise ValueError("at least one signing key is required")
+        self._signing_key = keys[0]
+        self._keys: Dict[str, str] = {key_id(key): key for key in keys}
+        self._cache.clear()
+
+    def issue(self, claims: dict, expires_delta: Optional[timedelta] = None) -> str:
+        payload = dict(claims)
+        payload["exp"] = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
+        return jwt.encode(payload, self._signing_key, algorithm=ALGORITHM,
+                          headers={"kid": key_id(self._signing_key)})
+
+    def verify(self, token: str) -> dict:
+        """Return the token's claims or raise ``jwt.InvalidTokenError``."""
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        entry = self._cache.get(digest)
+        if entry is not None:
+            claims, expires_at = entry
+            if expires_at > self._clock():
+                self._cache.move_to_end(digest)
+                self.hits += 1
+                return claims
+            del self._cache[digest]
+
+        self.misses += 1
+        claims = self.decode(token)
+        self._cache[digest] = (claims, float(claims["exp"]))
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return claims
+
+    def decode(self, token: str) -> dict:
+        """Full signature check, bypassing the cache."""
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is not None:
+            candidates = [self._keys[kid]] if kid in self._keys else []
+        else:
+            candidates = list(self._keys.values())
+        for key in candidates:
+            try:
+                return jwt.decode(token, key, algorithms=[ALGORITHM], options={"require": ["exp"]})
+            except jwt.InvalidSignatureError:
+                continue
+        raise jwt.InvalidSignatureError("no active key matches the token signature")
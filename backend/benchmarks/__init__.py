@@ -0,0 +1,12 @@
+"""Micro-benchmarks for the Webmatic backend.
+
+Run from the ``backend`` directory, e.g. ``python -m benchmarks.bench_rate_limit``.
+"""
+import sys
+from pathlib import Path
+
+# Benchmarks import backend modules (server, rate_limit, ...) the same way
+# uvicorn does when started from the backend directory.
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
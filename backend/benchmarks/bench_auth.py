@@ -0,0 +1,92 @@
+"""Cost of bearer token verification, cached and uncached.
+
+    python -m benchmarks.bench_auth [--tokens 1 100 10000] [--verifications 200000]
+                                    [--requests 20000] [--concurrency 50]
+
+Two measurements:
+
+* per verification: ``TokenVerifier.verify`` (cache) against
+  ``TokenVerifier.decode`` (signature check and JSON decode every time), with
+  requests spread round-robin over ``--tokens`` distinct tokens, as if that
+  many dashboards were polling.  With more tokens than the cache holds
+  (``--cache-size``) every lookup misses and the cache only adds overhead.
+* end to end: GET /api/analytics/summary through the ASGI app with the
+  server's verifier caching and with caching disabled.
+"""
+import argparse
+import asyncio
+import itertools
+import time
+from datetime import timedelta
+
+from benchmarks import common
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+import httpx
+
+from auth import TokenVerifier
+
+KEYS = ["current-signing-key-for-the-benchmark-0001", "previous-signing-key-for-the-benchmark-0000"]
+
+
+def per_verification(function, tokens, count: int) -> float:
+    cycle = itertools.cycle(tokens)
+    start = time.perf_counter()
+    for _ in range(count):
+        function(next(cycle))
+    return (time.perf_counter() - start) / count
+
+
+async def poll(server, headers: dict, requests: int, concurrency: int):
+    transport = httpx.ASGITransport(app=server.app)
+    latencies = []
+    counter = iter(range(requests))
+
+    async def client():
+        async with httpx.AsyncClient(transport=transport, base_url="http://webmatic.fr", headers=headers) as http:
+            for _ in counter:
+                start = time.perf_counter()
+                response = await http.get("/api/analytics/summary")
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+                await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, nargs="+", default=[1, 100, 10_000, 20_000])
+    parser.add_argument("--verifications", type=int, default=200_000)
+    parser.add_argument("--cache-size", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    common.add_mongo_arguments(parser)
+    args = parser.parse_args()
+
+    # Tokens signed with the current key (kid lookup) and the previous one.
+    print("per verification")
+    for count in args.tokens:
+        verifier = TokenVerifier(KEYS, max_entries=args.cache_size)
+        signers = [TokenVerifier([key]) for key in KEYS]
+        tokens = [signers[index % 2].issue({"sub": f"dashboard-{index}"}, timedelta(hours=1))
+                  for index in range(count)]
+        uncached = per_verification(verifier.decode, tokens, args.verifications)
+        cached = per_verification(verifier.verify, tokens, args.verifications)
+        print(f"  {count:>6,} tokens  uncached {uncached * 1e6:6.2f} us  cached {cached * 1e6:6.2f} us  "
+              f"hit rate {verifier.hits / (verifier.hits + verifier.misses):6.1%}")
+
+    client = common.connect(args)
+    server = common.use_database(client[args.db_name])
+    headers = common.auth_headers()
+    print("GET /api/analytics/summary")
+    for name, cache_size in (("uncached", 0), ("cached", args.cache_size)):
+        server.token_verifier.max_entries = cache_size
+        latencies, elapsed = await poll(server, headers, args.requests, args.concurrency)
+        print(f"  {name:<9} {common.summarize(latencies, elapsed)}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""Draining a contact backlog with competing workers.
+
+    python -m benchmarks.bench_contact_worker [--contacts 2000] [--workers 1 4]
+                                              [--concurrency 4] [--sink-delay 0.01]
+                                              [--failure-rate 0.1] [--mongo-url URL]
+
+Seeds ``--contacts`` unprocessed contacts, then runs ``--workers``
+ContactWorker instances side by side (each as separate processes would:
+its own id, leases and concurrency) until the backlog is empty.  The sink
+takes ``--sink-delay`` seconds per delivery and fails ``--failure-rate`` of
+the time, so retries and backoff are exercised.  Reports throughput, the
+backlog as it drains, and checks every contact was delivered exactly once.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+from benchmarks import common
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+
+from contact_worker import ContactWorker
+
+
+class FlakySink:
+    def __init__(self, delay: float, failure_rate: float, rng: random.Random):
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.rng = rng
+        self.deliveries = Counter()
+
+    async def deliver(self, contact: dict):
+        await asyncio.sleep(self.delay)
+        if self.rng.random() < self.failure_rate:
+            raise ConnectionError("sink unavailable")
+        self.deliveries[contact["id"]] += 1
+
+
+async def seed(collection, count: int):
+    await collection.delete_many({})
+    start = datetime.utcnow() - timedelta(seconds=count)
+    await collection.insert_many([{
+        "id": str(uuid.uuid4()),
+        "name": "Jean Dupont",
+        "email": f"jean.dupont.{index}@example.com",
+        "phone": None,
+        "service": "Autre",
+        "message": f"Demande de devis numéro {index}.",
+        "timestamp": start + timedelta(seconds=index),
+        "processed": False,
+    } for index in range(count)])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--contacts", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--sink-delay", type=float, default=0.01)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    common.add_mongo_arguments(parser)
+    args = parser.parse_args()
+
+    logging.getLogger("contact_worker").setLevel(logging.ERROR)  # one warning per injected failure
+    client = common.connect(args)
+    collection = client[args.db_name].contacts
+    rng = random.Random(42)
+    for count in args.workers:
+        await seed(collection, args.contacts)
+        sink = FlakySink(args.sink_delay, args.failure_rate, rng)
+        # Short backoff so retries land within the run
+        workers = [ContactWorker(collection, sink, concurrency=args.concurrency, poll_interval=0.05,
+                                 backoff_base=0.05, backoff_max=0.5, max_attempts=10)
+                   for _ in range(count)]
+        await workers[0].setup()
+
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(worker.run(report_interval=3600)) for worker in workers]
+        samples = []
+        while True:
+            backlog = await workers[0].backlog()
+            samples.append((time.perf_counter() - start, backlog["ready"] + backlog["leased"]))
+            if backlog["ready"] + backlog["leased"] == 0:
+                break
+            await asyncio.sleep(0.25)
+        elapsed = time.perf_counter() - start
+        for worker in workers:
+            worker.stop()
+        await asyncio.gather(*tasks)
+
+        duplicates = sum(1 for hits in sink.deliveries.values() if hits > 1)
+        processed = await collection.count_documents({"processed": True})
+        retried = sum(worker.retried for worker in workers)
+        failed = sum(worker.failed for worker in workers)
+        print(f"{count} worker(s) x {args.concurrency}: {processed:,} delivered in {elapsed:.2f} s "
+              f"({processed / elapsed:,.0f}/s), {retried} retries, {failed} failed, "
+              f"{duplicates} delivered twice")
+        middle = samples[len(samples) // 2]
+        print(f"  backlog {samples[0][1]:,} at start, {middle[1]:,} after {middle[0]:.1f} s, 0 after {elapsed:.1f} s")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""POST /api/contact latency and throughput with and without write-behind.
+
+    python -m benchmarks.bench_contact_writer [--requests 5000] [--concurrency 100]
+                                              [--latency 0.002] [--mongo-url URL]
+
+Submissions go through the full ASGI app.  ``direct`` awaits one insert_one
+per request; ``batched`` spools the record and lets ContactWriter flush it
+with insert_many.
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+from benchmarks import common
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+import httpx
+
+from contact_writer import ContactWriter
+
+CONTACT = {
+    "name": "Jean Dupont",
+    "email": "jean.dupont@example.com",
+    "phone": "0756913061",
+    "service": "Création de site web",
+    "message": "Bonjour, je souhaiterais créer un site web pour mon entreprise.",
+}
+
+
+async def drive(server, requests: int, concurrency: int, label: str):
+    transport = httpx.ASGITransport(app=server.app)
+    latencies = []
+    counter = iter(range(requests))
+
+    async def client(number: int):
+        headers = {"X-Forwarded-For": f"198.51.100.{number % 250}"}
+        async with httpx.AsyncClient(transport=transport, base_url="http://webmatic.fr") as http:
+            for index in counter:
+                # Distinct messages: identical ones would be answered by deduplication
+                body = dict(CONTACT, message=f"{CONTACT['message']} ({label} {index})")
+                start = time.perf_counter()
+                response = await http.post("/api/contact", json=body, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    common.add_mongo_arguments(parser)
+    args = parser.parse_args()
+
+    client = common.connect(args)
+    database = client[args.db_name]
+    server = common.use_database(database)
+
+    server.contact_writer = None
+    await database.contacts.delete_many({})
+    latencies, elapsed = await drive(server, args.requests, args.concurrency, "direct")
+    print(f"direct   {common.summarize(latencies, elapsed)}")
+
+    with tempfile.TemporaryDirectory() as spool:
+        writer = ContactWriter(database.contacts, spool, batch_size=args.batch_size,
+                               flush_interval=args.flush_interval)
+        await writer.start()
+        server.contact_writer = writer
+        latencies, elapsed = await drive(server, args.requests, args.concurrency, "batched")
+        await writer.stop()
+    print(f"batched  {common.summarize(latencies, elapsed)}")
+
+    stored = await database.contacts.count_documents({})
+    print(f"stored {stored:,} contacts ({2 * args.requests:,} expected)")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+"""Throughput of a mixed workload under different Mongo client profiles.
+
+    python -m benchmarks.bench_db_profiles [--requests 3000] [--concurrency 100]
+                                           [--pool-sizes 4 16] [--latency 0.01]
+                                           [--replication-latency 0.02]
+                                           [--mongo-url mongodb://localhost:27017/?replicaSet=rs0]
+
+Drives status check writes (POST /api/status), status reads
+(GET /api/status, past the response cache) and status check time series
+(GET /api/analytics/timeseries) in a 2:2:1 mix through the app, with the
+response cache middleware removed, for each pool size and profile set:
+
+* ``single``: every endpoint on the client defaults, as before: writes
+  acknowledged by a majority and every read on the primary
+* ``configured``: the server's profiles (``MONGO_PROFILE_*``): status
+  writes with ``w=1``, analytics reads on secondaries.  The status reads
+  here are first pages, which stay on the primary (a first page cached from
+  a lagging secondary would be stale for its whole TTL); only later pages
+  and exports use the ``status_reads`` profile
+
+By default it runs against a three-member replica set stand-in: a pool of
+``--pool-sizes`` connections per member, ``--latency`` per round trip and
+``--replication-latency`` more for majority writes.  With ``--mongo-url``
+(a replica set) the pool size is Motor's ``maxPoolSize``.
+
+The difference shows while the primary's pool is the bottleneck: with the
+defaults, ``single`` manages a little over half the requests per second
+of ``configured`` at 4 connections per member, and both reach the same
+in-process ceiling (the app's own CPU time) at 16.
+"""
+import argparse
+import asyncio
+import itertools
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import common
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+
+import httpx
+
+from database import Profile
+from response_cache import ResponseCacheMiddleware
+
+MIX = ("write", "read", "write", "read", "analytics")
+
+
+def connect(args, pool_size: int):
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        return AsyncIOMotorClient(args.mongo_url, maxPoolSize=pool_size)
+    from benchmarks.mongo_standin import StandinClient
+    return StandinClient(latency=args.latency, pool_size=pool_size, members=3,
+                         replication_latency=args.replication_latency)
+
+
+async def run(http, requests: int, concurrency: int):
+    headers = common.auth_headers()
+    since = (datetime.utcnow() - timedelta(hours=24)).isoformat()
+    latencies = {kind: [] for kind in MIX}
+    counter = itertools.count()
+
+    async def worker():
+        while (index := next(counter)) < requests:
+            kind = MIX[index % len(MIX)]
+            start = time.perf_counter()
+            if kind == "write":
+                response = await http.post("/api/status", json={"client_name": f"benchmark-{index}"})
+            elif kind == "read":
+                response = await http.get("/api/status", params={"limit": 20, "stream": "false"}, headers=headers)
+            else:
+                response = await http.get("/api/analytics/timeseries", headers=headers, params={
+                    "source": "status_checks", "granularity": "hour", "start": since})
+            latencies[kind].append(time.perf_counter() - start)
+            assert response.status_code == 200, f"{kind}: {response.status_code} {response.text[:200]}"
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[4, 16])
+    parser.add_argument("--replication-latency", type=float, default=0.02,
+                        help="stand-in extra latency of a majority write in seconds")
+    common.add_mongo_arguments(parser)
+    parser.set_defaults(latency=0.01)
+    args = parser.parse_args()
+
+    import server
+    configured = dict(server.db_profiles.profiles)
+    profile_sets = {
+        "single": {name: Profile() for name in configured},
+        "configured": configured,
+    }
+    server.app.user_middleware = [m for m in server.app.user_middleware if m.cls is not ResponseCacheMiddleware]
+    server.app.middleware_stack = None
+    print(f"{args.requests:,} requests, {args.concurrency} concurrent, "
+          f"{'stand-in replica set' if not args.mongo_url else args.mongo_url}")
+    for name, profile in configured.items():
+        print(f"  {name:<14} {profile.describe()}")
+
+    for pool_size in args.pool_sizes:
+        print(f"pool size {pool_size}")
+        for label, profiles in profile_sets.items():
+            client = connect(args, pool_size)
+            database = client[args.db_name]
+            server.db_profiles.profiles = profiles
+            common.use_database(database)
+            await database.status_checks.create_index([("timestamp", 1), ("id", 1)])
+            await server.time_series.clear()
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as http:
+                await run(http, 200, args.concurrency)  # warm up: indexes, cached buckets
+                if not args.mongo_url:
+                    client.member_round_trips = [0] * len(client.member_round_trips)
+                elapsed, latencies = await run(http, args.requests, args.concurrency)
+            routing = ""
+            if not args.mongo_url:
+                total = sum(client.member_round_trips)
+                routing = f"  primary {client.member_round_trips[0] / total:.0%} of round trips"
+            print(f"  {label:<11} {args.requests / elapsed:8,.0f} req/s{routing}")
+            for kind in ("write", "read", "analytics"):
+                samples = latencies[kind]
+                print(f"    {kind:<10} p50 {common.percentile(samples, 0.5) * 1e3:7.2f} ms  "
+                      f"p99 {common.percentile(samples, 0.99) * 1e3:7.2f} ms")
+            if args.mongo_url:
+                await database.status_checks.drop()
+            client.close()
+    server.db_profiles.profiles = configured
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""Replay storm: many identical POST /api/contact submissions.
+
+    python -m benchmarks.bench_dedup [--requests 10000] [--concurrency 50]
+                                     [--latency 0.002] [--mongo-url URL]
+
+Runs the storm through the full ASGI app with deduplication disabled, then
+enabled, and reports throughput, latency, stored contacts and database round
+trips (round trips are only counted by the stand-in).
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks import common
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+import httpx
+
+from dedup import ContactDeduplicator
+
+CONTACT = {
+    "name": "Jean Dupont",
+    "email": "jean.dupont@example.com",
+    "service": "Autre",
+    "message": "Bonjour, je voudrais un devis pour la réparation de ma console.",
+}
+
+
+async def storm(server, requests: int, concurrency: int):
+    transport = httpx.ASGITransport(app=server.app)
+    latencies = []
+    references = set()
+    counter = iter(range(requests))
+
+    async def client():
+        async with httpx.AsyncClient(transport=transport, base_url="http://webmatic.fr") as http:
+            for _ in counter:
+                start = time.perf_counter()
+                response = await http.post("/api/contact", json=CONTACT)
+                latencies.append(time.perf_counter() - start)
+                references.add(response.json()["reference"])
+                # Cache hits never block: yield like a real socket would so
+                # one client cannot starve the others.
+                await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start, references
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    common.add_mongo_arguments(parser)
+    args = parser.parse_args()
+
+    client = common.connect(args)
+    database = client[args.db_name]
+    server = common.use_database(database)
+
+    deduplicator = ContactDeduplicator(database.contact_fingerprints)
+    for name, dedup in (("no dedup", None), ("dedup", deduplicator)):
+        await database.contacts.delete_many({})
+        await database.contact_fingerprints.delete_many({})
+        server.contact_dedup = dedup
+        round_trips = getattr(client, "round_trips", 0)
+        latencies, elapsed, references = await storm(server, args.requests, args.concurrency)
+        stored = await database.contacts.count_documents({})
+        round_trips = getattr(client, "round_trips", 0) - round_trips
+        print(f"{name:<9} {common.summarize(latencies, elapsed)}  "
+              f"stored {stored:>6,}  references {len(references):>6,}  round trips {round_trips:>6,}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+"""IP reputation lists: load time, memory footprint and lookup throughput.
+
+    python -m benchmarks.bench_ip_reputation [--prefixes 10000 300000] [--ipv6-share 0.1]
+                                             [--lookups 200000]
+
+Writes a synthetic blocklist of random IPv4 prefixes (/16 to /32, mostly
+/24) and IPv6 prefixes (/29 to /64, some /128), then for each size reports:
+
+* ``load``: IPReputation.reload from disk, parsing and compiling, and the
+  memory held by the compiled index and the peak while building it
+  (tracemalloc, on a second load), next to the size of its array columns
+* ``lookup``: ReputationLists.is_blocked on addresses half inside a blocked
+  range, half random, per call and per second; ``cached`` when the same
+  clients come back
+* ``ipaddress``: the straightforward alternative, one ``ip_network`` set
+  probe per prefix length, on a sample of the same addresses
+* ``middleware``: a request through IPReputationMiddleware to a no-op app
+"""
+import argparse
+import asyncio
+import ipaddress
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+from ip_reputation import IPReputation, IPReputationMiddleware
+
+
+def random_prefixes(count: int, ipv6_share: float, rng: random.Random):
+    lines = []
+    for _ in range(count):
+        if rng.random() < ipv6_share:
+            length = rng.choice((29, 32, 40, 48, 48, 56, 64, 128))
+            value = (0x2000 << 112) | rng.getrandbits(125) >> (128 - length) << (128 - length)
+            lines.append(f"{ipaddress.IPv6Address(value)}/{length}")
+        else:
+            length = rng.choice((16, 20, 22, 24, 24, 24, 24, 32))
+            value = rng.getrandbits(32) >> (32 - length) << (32 - length)
+            lines.append(f"{ipaddress.IPv4Address(value)}/{length} ; SBL{rng.randrange(10 ** 6):06d}")
+    return lines
+
+
+def sample_addresses(lines, count: int, rng: random.Random):
+    addresses = []
+    for index in range(count):
+        if index % 2:
+            network = ipaddress.ip_network(rng.choice(lines).split()[0])
+            offset = rng.randrange(min(network.num_addresses, 1 << 32))
+            addresses.append(str(network.network_address + offset))
+        elif rng.random() < 0.9:
+            addresses.append(str(ipaddress.IPv4Address(rng.getrandbits(32))))
+        else:
+            addresses.append(str(ipaddress.IPv6Address((0x2000 << 112) | rng.getrandbits(125))))
+    return addresses
+
+
+class NetworkSets:
+    """One set of networks per prefix length: the obvious ipaddress version."""
+
+    def __init__(self, lines):
+        self.sets = {}
+        for line in lines:
+            network = ipaddress.ip_network(line.split()[0])
+            self.sets.setdefault((network.version, network.prefixlen), set()).add(network)
+
+    def is_blocked(self, address: str) -> bool:
+        ip = ipaddress.ip_address(address)
+        for (version, length), networks in self.sets.items():
+            if version == ip.version and ipaddress.ip_network((ip, length), strict=False) in networks:
+                return True
+        return False
+
+
+def per_call(function, addresses, repeat: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for address in addresses:
+            function(address)
+    return (time.perf_counter() - start) / (repeat * len(addresses))
+
+
+async def middleware_cost(reputation: IPReputation, addresses) -> float:
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    middleware = IPReputationMiddleware(app, reputation, client_ip=lambda scope: scope["client"][0])
+    scopes = [{"type": "http", "path": "/api/contact", "client": (address, 50000)} for address in addresses]
+    start = time.perf_counter()
+    for scope in scopes:
+        await middleware(scope, None, send)
+    return (time.perf_counter() - start) / len(scopes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prefixes", type=int, nargs="+", default=[10_000, 300_000])
+    parser.add_argument("--ipv6-share", type=float, default=0.1)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory(prefix="webmatic-iprep-") as workdir:
+        for count in args.prefixes:
+            lines = random_prefixes(count, args.ipv6_share, rng)
+            path = Path(workdir) / f"drop-{count}.txt"
+            path.write_text("; synthetic blocklist\n" + "\n".join(lines) + "\n")
+
+            reputation = IPReputation([path], check_interval=3600)
+            start = time.perf_counter()
+            reputation.reload()
+            load_time = time.perf_counter() - start
+            tracemalloc.start()
+            index = IPReputation._load([path])
+            held, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del index
+            snapshot = reputation.snapshot()
+            print(f"{count:,} prefixes ({path.stat().st_size / 1e6:.1f} MB file)")
+            print(f"  load        {load_time:6.2f} s, {snapshot['ranges']:,} ranges, "
+                  f"{snapshot['bytes'] / 1e6:.2f} MB of columns, {held / 1e6:.2f} MB held, {peak / 1e6:.1f} MB peak")
+
+            addresses = sample_addresses(lines, args.lookups, rng)
+            lists = reputation.lists
+            blocked = sum(map(lists._is_blocked, addresses))
+            lookup = per_call(lists._is_blocked, addresses, repeat=3)
+            print(f"  lookup      {lookup * 1e9:6.0f} ns/call  {1 / lookup:12,.0f}/s  "
+                  f"({blocked / len(addresses):.0%} blocked, every address new)")
+            cached = per_call(lists.is_blocked, addresses[:1000], repeat=args.lookups // 1000)
+            print(f"  cached      {cached * 1e9:6.0f} ns/call  {1 / cached:12,.0f}/s  (1,000 returning clients)")
+
+            sample = addresses[:2000]
+            start = time.perf_counter()
+            sets = NetworkSets(lines)
+            sets_load = time.perf_counter() - start
+            baseline = per_call(sets.is_blocked, sample)
+            assert [sets.is_blocked(a) for a in sample] == [lists.is_blocked(a) for a in sample]
+            print(f"  ipaddress   {baseline * 1e9:6.0f} ns/call  {1 / baseline:12,.0f}/s  "
+                  f"(load {sets_load:.2f} s, {baseline / lookup:.0f}x slower)")
+
+            cost = asyncio.run(middleware_cost(reputation, addresses[:50_000]))
+            print(f"  middleware  {cost * 1e9:6.0f} ns/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Concurrent load test of the public endpoints, with saved baselines.
+
+    python -m benchmarks.bench_load [--scenarios health status ...]
+                                    [--duration 5] [--concurrency 50]
+                                    [--save baseline.json] [--compare baseline.json]
+                                    [--latency 0.002] [--mongo-url URL [--uvicorn]]
+
+By default the app runs in-process behind httpx's ASGI transport against the
+in-memory Mongo stand-in, so results measure the application itself and are
+comparable between machines of the same kind.  With ``--mongo-url`` it uses a
+real MongoDB, and ``--uvicorn`` additionally serves the app from a uvicorn
+process on localhost so the HTTP server and sockets are included.
+
+Each scenario runs ``--concurrency`` clients in a closed loop for
+``--duration`` seconds and reports requests per second, p50/p95/p99 latency,
+mean bytes on the wire and status codes:
+
+* ``health``: GET /health
+* ``contact``: POST /api/contact, a distinct message every time
+* ``status``: GET /api/status, one default page of 50
+* ``status_500`` / ``status_500_gzip``: 500 status checks per page, sent
+  uncompressed and gzipped, to show what compression costs and saves
+* ``analytics``: GET /api/analytics/summary
+
+The read endpoints are called with one bearer token per scenario, as a
+polling dashboard would.
+* ``rate_limit``: GET /api/ from four addresses against a limit of
+  ``--rate-limit`` requests per minute, so nearly everything is a 429
+
+``--save`` writes the results as JSON.  ``--compare`` reads such a file and
+flags every scenario whose throughput fell, or whose p95/p99 rose, by more
+than ``--tolerance``; the exit status is 1 when anything regressed.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from benchmarks import common
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+import httpx
+
+STATUS_DOCUMENTS = 1000
+SATURATION_ADDRESSES = ["198.51.100.1", "198.51.100.2", "198.51.100.3", "198.51.100.4"]
+
+
+def contact_body(sequence: int) -> dict:
+    return {
+        "name": "Jean Dupont",
+        "email": f"jean.dupont.{sequence}@example.com",
+        "service": "Réparation console",
+        "message": f"Bonjour, ma console ne s'allume plus depuis hier (demande {sequence}).",
+    }
+
+
+SCENARIOS = {
+    "health": {"method": "GET", "path": "/health"},
+    "contact": {"method": "POST", "path": "/api/contact", "body": contact_body},
+    "status": {"method": "GET", "path": "/api/status", "auth": True},
+    "status_500": {"method": "GET", "path": "/api/status", "params": {"limit": 500}, "auth": True,
+                   "headers": {"Accept-Encoding": "identity"}},
+    "status_500_gzip": {"method": "GET", "path": "/api/status", "params": {"limit": 500}, "auth": True,
+                        "headers": {"Accept-Encoding": "gzip"}},
+    "analytics": {"method": "GET", "path": "/api/analytics/summary", "auth": True},
+    "rate_limit": {"method": "GET", "path": "/api/", "addresses": SATURATION_ADDRESSES},
+}
+
+
+async def generate_load(http: httpx.AsyncClient, scenario: dict, duration: float, concurrency: int) -> dict:
+    """Run ``concurrency`` closed-loop clients for ``duration`` seconds."""
+    sequence = itertools.count()
+    latencies = []
+    statuses = Counter()
+    received = 0
+    errors = 0
+    addresses = itertools.cycle(scenario.get("addresses", [None]))
+    base_headers = dict(scenario.get("headers", {}))
+    if scenario.get("auth"):
+        base_headers.update(common.auth_headers())
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal received, errors
+        while time.perf_counter() < deadline:
+            number = next(sequence)
+            headers = dict(base_headers)
+            address = next(addresses)
+            if address:
+                headers["X-Forwarded-For"] = address
+            body = scenario.get("body")
+            start = time.perf_counter()
+            try:
+                response = await http.request(
+                    scenario["method"], scenario["path"], params=scenario.get("params"),
+                    json=body(number) if body else None, headers=headers)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+            received += response.num_bytes_downloaded
+            # In-process responses can complete without ever suspending: yield
+            # like a socket would so one client cannot starve the others.
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    count = len(latencies)
+    return {
+        "requests": count,
+        "rps": count / elapsed,
+        "p50_ms": common.percentile(latencies, 0.50) * 1e3,
+        "p95_ms": common.percentile(latencies, 0.95) * 1e3,
+        "p99_ms": common.percentile(latencies, 0.99) * 1e3,
+        "mean_bytes": received / count if count else 0,
+        "errors": errors,
+        "statuses": {str(code): hits for code, hits in sorted(statuses.items())},
+    }
+
+
+async def seed_status_checks(collection, documents: int):
+    await collection.delete_many({})
+    start = datetime.utcnow() - timedelta(seconds=documents)
+    await collection.insert_many([{
+        "id": f"{index:08d}-0000-4000-8000-000000000000",
+        "client_name": f"client_{index}",
+        "timestamp": start + timedelta(seconds=index),
+        "ip_address": f"10.0.{(index >> 8) & 255}.{index & 255}",
+    } for index in range(documents)])
+
+
+async def run_inprocess(args, names):
+    from rate_limit import MemoryRateLimitBackend
+
+    client = common.connect(args)
+    database = client[args.db_name]
+    server = common.use_database(database)
+    await seed_status_checks(database.status_checks, STATUS_DOCUMENTS)
+    await database.contacts.delete_many({})
+
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://webmatic.fr", timeout=None) as http:
+        for name in names:
+            previous = None
+            if name == "rate_limit":
+                previous = common.use_rate_limit(server, MemoryRateLimitBackend(calls=args.rate_limit, period=60))
+            try:
+                results[name] = await generate_load(http, SCENARIOS[name], args.duration, args.concurrency)
+            finally:
+                if previous is not None:
+                    common.use_rate_limit(server, previous)
+            report(name, results[name])
+    if server.contact_writer:
+        await server.contact_writer.flush()
+    client.close()
+    return results
+
+
+async def run_uvicorn(args, names):
+    from pymongo import MongoClient
+    from benchmarks.bench_status_export import seed, start_server
+
+    mongo = MongoClient(args.mongo_url)
+    seed(mongo[args.db_name].status_checks, STATUS_DOCUMENTS)
+    mongo.close()
+
+    results = {}
+    for name in names:
+        env = {"RATE_LIMIT_CALLS": str(args.rate_limit)} if name == "rate_limit" else {}
+        process = start_server(args, **env)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=None,
+                                         limits=httpx.Limits(max_connections=args.concurrency)) as http:
+                results[name] = await generate_load(http, SCENARIOS[name], args.duration, args.concurrency)
+        finally:
+            process.terminate()
+            process.wait()
+        report(name, results[name])
+    return results
+
+
+def report(name: str, result: dict):
+    statuses = " ".join(f"{code}:{hits}" for code, hits in result["statuses"].items())
+    print(f"  {name:<16} {result['rps']:9,.0f} req/s  p50 {result['p50_ms']:7.2f}  "
+          f"p95 {result['p95_ms']:7.2f}  p99 {result['p99_ms']:7.2f} ms  "
+          f"{result['mean_bytes']:8,.0f} B  [{statuses}]"
+          + (f"  errors {result['errors']}" if result["errors"] else ""))
+
+
+def compare(baseline: dict, results: dict, tolerance: float) -> bool:
+    """Print the change against ``baseline``; True when something regressed."""
+    regressed = False
+    print(f"\nCompared with {baseline.get('created', 'baseline')} (tolerance {tolerance:.0%}):")
+    for name, result in results.items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            print(f"  {name:<16} no baseline")
+            continue
+        changes = []
+        flagged = []
+        # Higher is better for throughput, lower is better for latency.
+        for key, higher_is_better in (("rps", True), ("p95_ms", False), ("p99_ms", False)):
+            change = (result[key] - before[key]) / before[key] if before[key] else 0.0
+            changes.append(f"{key} {change:+7.1%}")
+            if (-change if higher_is_better else change) > tolerance:
+                flagged.append(key)
+        regressed = regressed or bool(flagged)
+        print(f"  {name:<16} {'  '.join(changes)}" + (f"  REGRESSION ({', '.join(flagged)})" if flagged else ""))
+    return regressed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rate-limit", type=int, default=100,
+                        help="requests per minute per address in the rate_limit scenario")
+    parser.add_argument("--save", metavar="FILE", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative change counted as a regression (default 0.10)")
+    parser.add_argument("--uvicorn", action="store_true", help="serve the app from uvicorn (needs --mongo-url)")
+    parser.add_argument("--port", type=int, default=8099)
+    common.add_mongo_arguments(parser)
+    args = parser.parse_args()
+    if args.uvicorn and not args.mongo_url:
+        parser.error("--uvicorn needs --mongo-url: the stand-in only lives in this process")
+
+    mode = "uvicorn" if args.uvicorn else "in-process"
+    backend = args.mongo_url or f"stand-in ({args.latency * 1e3:g} ms)"
+    print(f"{mode}, {backend}, {args.concurrency} clients, {args.duration:g} s per scenario")
+    run = run_uvicorn if args.uvicorn else run_inprocess
+    results = await run(args, args.scenarios)
+
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump({
+                "created": datetime.utcnow().isoformat(timespec="seconds"),
+                "config": {
+                    "mode": mode,
+                    "mongo": "real" if args.mongo_url else "stand-in",
+                    "latency": args.latency,
+                    "concurrency": args.concurrency,
+                    "duration": args.duration,
+                    "python": platform.python_version(),
+                },
+                "scenarios": results,
+            }, output, indent=2)
+        print(f"\nSaved {args.save}")
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            if compare(json.load(baseline), results, args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
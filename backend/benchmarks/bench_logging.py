@@ -0,0 +1,108 @@
+"""Event loop latency while logging heavily to a slow sink.
+
+    python -m benchmarks.bench_logging [--rate 10000] [--sink-delay 0.0005]
+                                       [--duration 3] [--queue-size 10000]
+
+A producer task logs ``--rate`` records per second (in 1 ms ticks) with the
+same lazy ``%s`` call the contact handler makes, while a probe task sleeps
+1 ms at a time and records how late it wakes up: that lag is what every
+in-flight request would see.  The sink sleeps ``--sink-delay`` seconds per
+write, standing in for a slow disk or a blocked pipe to a collector.
+
+* ``direct``: a StreamHandler on the logger, as ``logging.basicConfig`` sets up
+* ``queue/drop``: log_pipeline's bounded queue, dropping when full
+* ``queue/sample``: the same, thinning INFO records from 3/4 full
+"""
+import argparse
+import asyncio
+import io
+import logging
+import time
+
+from benchmarks import common
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+
+from log_pipeline import TEXT_FORMAT, BoundedQueueHandler, LogListener
+
+
+class SlowSink(io.StringIO):
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.writes = 0
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        self.writes += 1
+        return len(text)
+
+
+async def run(logger: logging.Logger, rate: int, duration: float):
+    lags = []
+    emitted = 0
+    deadline = time.perf_counter() + duration
+
+    async def probe():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    async def produce():
+        nonlocal emitted
+        per_tick = max(1, rate // 1000)
+        next_tick = time.perf_counter()
+        while time.perf_counter() < deadline:
+            for _ in range(per_tick):
+                logger.info("Contact form submission from %s", "203.0.113.7")
+                emitted += 1
+            next_tick += 0.001
+            await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+
+    start = time.perf_counter()
+    await asyncio.gather(probe(), produce())
+    return lags, emitted, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=int, default=10_000, help="records per second")
+    parser.add_argument("--sink-delay", type=float, default=0.0005, help="seconds per sink write")
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--queue-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f"{args.rate:,} records/s for {args.duration:g} s, sink {args.sink_delay * 1e3:g} ms per write")
+    for name in ("direct", "queue/drop", "queue/sample"):
+        sink = SlowSink(args.sink_delay)
+        stream_handler = logging.StreamHandler(sink)
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        logger = logging.getLogger(f"bench_logging.{name}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+
+        listener = None
+        if name == "direct":
+            logger.addHandler(stream_handler)
+        else:
+            handler = BoundedQueueHandler(args.queue_size, overflow=name.split("/")[1])
+            listener = LogListener(handler, stream_handler)
+            listener.start()
+            logger.addHandler(handler)
+
+        lags, emitted, elapsed = await run(logger, args.rate, args.duration)
+        written = sink.writes
+        line = (f"  {name:<13} loop lag p50 {common.percentile(lags, 0.5) * 1e3:6.2f} ms  "
+                f"p99 {common.percentile(lags, 0.99) * 1e3:7.2f} ms  max {max(lags) * 1e3:7.2f} ms  "
+                f"emitted {emitted / elapsed:7,.0f}/s  written {written / elapsed:6,.0f}/s")
+        if listener:
+            stats = handler.stats()
+            line += f"  dropped {sum(stats['dropped'].values()):,}  sampled out {stats['sampled_out']:,}"
+            sink.delay = 0  # drain the backlog quickly
+            listener.stop()
+        print(line)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
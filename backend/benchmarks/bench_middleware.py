@@ -0,0 +1,141 @@
+"""Per-request cost of the middleware stack on /health and /api/.
+
+    python -m benchmarks.bench_middleware [--requests 20000]
+
+Requests are driven straight through the ASGI callable, without a server or
+socket, so the numbers isolate the framework and middleware overhead.  Four
+stacks are compared around the same routes:
+
+* ``none``: no user middleware at all
+* ``legacy``: the previous BaseHTTPMiddleware classes in their old order
+* ``current``: the pure-ASGI stack configured in server.py
+* ``no-metrics``: the current stack without the metrics and profiling
+  middlewares, to show what request instrumentation costs
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("RATE_LIMIT_CALLS", str(10 ** 9))
+
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+
+import server
+from metrics import HandlerTimer, MetricsMiddleware
+from profiling import ProfilingMiddleware
+
+# The stack configured in server.py, outermost first.
+CURRENT_STACK = list(server.app.user_middleware)
+UNINSTRUMENTED_STACK = [m for m in CURRENT_STACK if m.cls not in (MetricsMiddleware, HandlerTimer, ProfilingMiddleware)]
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        for name, value in server.SECURITY_HEADERS:
+            response.headers[name.decode("latin-1")] = value.decode("latin-1")
+        return response
+
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, backend):
+        super().__init__(app)
+        self.backend = backend
+
+    async def dispatch(self, request, call_next):
+        if not await self.backend.hit(server.get_client_ip(request)):
+            return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded."})
+        return await call_next(request)
+
+
+def legacy_stack():
+    # user_middleware is outermost first.
+    return [
+        Middleware(CORSMiddleware, allow_credentials=True, allow_origins=["*"],
+                   allow_methods=["GET", "POST"], allow_headers=["*"]),
+        Middleware(TrustedHostMiddleware, allowed_hosts=["*"]),
+        Middleware(GZipMiddleware, minimum_size=1000),
+        Middleware(LegacyRateLimitMiddleware, backend=server.rate_limit_backend),
+        Middleware(LegacySecurityHeadersMiddleware),
+    ]
+
+
+def build(user_middleware):
+    server.app.user_middleware = list(user_middleware)
+    return server.app.build_middleware_stack()
+
+
+async def request(app, path: str):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"webmatic.fr"),
+            (b"accept-encoding", b"gzip"),
+            (b"origin", b"https://webmatic.fr"),
+        ],
+        "client": ("203.0.113.7", 50000),
+        "server": ("webmatic.fr", 80),
+    }
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def measure(app, path: str, count: int) -> float:
+    for _ in range(min(count, 500)):
+        await request(app, path)
+    start = time.perf_counter()
+    for _ in range(count):
+        status = await request(app, path)
+    elapsed = time.perf_counter() - start
+    assert status == 200, f"{path} returned {status}"
+    return elapsed / count
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--paths", nargs="+", default=["/health", "/api/"])
+    args = parser.parse_args()
+
+    stacks = {
+        "none": build([]),
+        "legacy": build(legacy_stack()),
+        "current": build(CURRENT_STACK),
+        "no-metrics": build(UNINSTRUMENTED_STACK),
+    }
+    for path in args.paths:
+        baseline = await measure(stacks["none"], path, args.requests)
+        print(f"{path}")
+        for name, app in stacks.items():
+            per_request = baseline if name == "none" else await measure(app, path, args.requests)
+            print(f"  {name:<10} {per_request * 1e6:7.1f} us/request  "
+                  f"middleware {max(per_request - baseline, 0) * 1e6:6.1f} us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
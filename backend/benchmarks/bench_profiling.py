@@ -0,0 +1,108 @@
+"""Per-request cost of the profiling hooks, off and on.
+
+    python -m benchmarks.bench_profiling [--requests 5000]
+
+Drives GET /api/ and POST /api/contact straight through the ASGI app, as
+bench_middleware does, against the Mongo stand-in with no latency:
+
+* ``absent``: ProfilingMiddleware removed and no DatabaseGuard observer
+* ``off``: the configured stack with the profiler inactive (the default)
+* ``slow``: slow-request capture armed (1 s threshold, nothing captured)
+* ``sampled 1%`` / ``sampled 100%``: stack sampling on that share of requests
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from benchmarks import common
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+
+from profiling import ProfilingMiddleware, record_database
+
+
+async def request(app, method: str, path: str, body: bytes = b""):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"webmatic.fr"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())],
+        "client": ("203.0.113.7", 50000), "server": ("webmatic.fr", 80),
+    }
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def measure(app, method: str, path: str, count: int, counter) -> float:
+    def body():
+        if method != "POST":
+            return b""
+        index = next(counter)
+        return json.dumps({
+            "name": "Jean Dupont",
+            "email": f"jean.dupont.{index}@example.com",
+            "service": "Autre",
+            "message": f"Demande de devis numéro {index} pour un site vitrine.",
+        }).encode()
+
+    for _ in range(min(count, 200)):
+        await request(app, method, path, body())
+    bodies = [body() for _ in range(count)]
+    start = time.perf_counter()
+    for payload in bodies:
+        status = await request(app, method, path, payload)
+    elapsed = time.perf_counter() - start
+    assert status == 200, f"{method} {path} returned {status}"
+    return elapsed / count
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    from benchmarks.mongo_standin import StandinClient
+    server = common.use_database(StandinClient(latency=0)["webmatic_benchmark"])
+    profiler = server.profiler
+    configured = list(server.app.user_middleware)
+
+    def build(user_middleware):
+        server.app.user_middleware = list(user_middleware)
+        return server.app.build_middleware_stack()
+
+    absent = build([m for m in configured if m.cls is not ProfilingMiddleware])
+    current = build(configured)
+    modes = [
+        ("absent", absent, None, dict(slow_threshold=0, sample_rate=0)),
+        ("off", current, record_database, dict(slow_threshold=0, sample_rate=0)),
+        ("slow", current, record_database, dict(slow_threshold=1.0, sample_rate=0)),
+        ("sampled 1%", current, record_database, dict(slow_threshold=1.0, sample_rate=0.01)),
+        ("sampled 100%", current, record_database, dict(slow_threshold=1.0, sample_rate=1.0)),
+    ]
+    counter = itertools.count()
+    for method, path in (("GET", "/api/"), ("POST", "/api/contact")):
+        print(f"{method} {path}")
+        baseline = None
+        for name, app, observer, settings in modes:
+            server.db_guard.observer = observer
+            profiler.configure(**settings)
+            per_request = await measure(app, method, path, args.requests, counter)
+            baseline = baseline or per_request
+            print(f"  {name:<13} {per_request * 1e6:7.1f} us/request  "
+                  f"{(per_request - baseline) * 1e6:+6.1f} us")
+    print(f"{profiler.captured} profiles captured")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""Compare the sliding-window limiter with the old per-IP timestamp lists.
+
+    python -m benchmarks.bench_rate_limit [--ips 10000 1000000] [--hits 20]
+
+Every distinct IP sends ``--hits`` requests, interleaved round-robin, while a
+fake clock advances through one rate-limit period, so the legacy lists hold up
+to ``--hits`` timestamps each when they are filtered.
+"""
+import argparse
+import time
+import tracemalloc
+from collections import defaultdict
+
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+from rate_limit import SlidingWindowLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LegacyLimiter:
+    """The list-filtering algorithm previously inlined in RateLimitMiddleware."""
+
+    def __init__(self, calls: int, period: int, clock):
+        self.calls = calls
+        self.period = period
+        self.storage = defaultdict(list)
+        self._clock = clock
+
+    def hit(self, key: str) -> bool:
+        now = self._clock()
+        self.storage[key] = [t for t in self.storage[key] if now - t < self.period]
+        if len(self.storage[key]) >= self.calls:
+            return False
+        self.storage[key].append(now)
+        return True
+
+    def __len__(self):
+        return len(self.storage)
+
+
+def make_ips(count: int):
+    return [f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" for i in range(count)]
+
+
+def run(limiter, clock, ips, hits: int, step: float):
+    start = time.perf_counter()
+    for _ in range(hits):
+        for ip in ips:
+            clock.now += step
+            limiter.hit(ip)
+    return time.perf_counter() - start
+
+
+def measure(name, factory, ips, hits, step, trace_memory):
+    clock = FakeClock()
+    limiter = factory(clock)
+    elapsed = run(limiter, clock, ips, hits, step)
+
+    peak = None
+    if trace_memory:
+        clock = FakeClock()
+        tracemalloc.start()
+        limiter = factory(clock)
+        run(limiter, clock, ips, hits, step)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    ops = len(ips) * hits
+    memory = f"{peak / 2**20:8.1f} MiB" if peak is not None else "       n/a"
+    print(f"  {name:<16} {elapsed / ops * 1e9:8.0f} ns/op  {ops / elapsed:>11,.0f} ops/s  "
+          f"tracked={len(limiter):>9,}  peak={memory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ips", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--hits", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--period", type=int, default=60)
+    parser.add_argument("--max-clients", type=int, default=100_000)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    args = parser.parse_args()
+
+    for count in args.ips:
+        ips = make_ips(count)
+        # Spread all hits over one period so the legacy lists fill up.
+        step = args.period / (count * args.hits)
+        print(f"{count:,} distinct IPs x {args.hits} hits")
+        measure("legacy lists",
+                lambda clock: LegacyLimiter(args.calls, args.period, clock),
+                ips, args.hits, step, not args.no_memory)
+        measure("sliding window",
+                lambda clock: SlidingWindowLimiter(args.calls, args.period, args.max_clients, clock=clock),
+                ips, args.hits, step, not args.no_memory)
+
+
+if __name__ == "__main__":
+    main()
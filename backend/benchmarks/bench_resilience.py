@@ -0,0 +1,123 @@
+"""Contact submissions through a MongoDB slowdown, with and without the guard.
+
+    python -m benchmarks.bench_resilience [--concurrency 50] [--phase 4]
+                                          [--delay 3] [--timeout 0.5] [--open-seconds 2]
+                                          [--latency 0.002]
+
+Drives POST /api/contact in-process against the Mongo stand-in in three
+phases of ``--phase`` seconds: healthy, every round trip ``--delay`` seconds
+slower, healthy again.  Runs twice:
+
+* ``guarded``: the server's DatabaseGuard with an ``--timeout`` deadline and
+  a breaker that stays open ``--open-seconds``
+* ``unguarded``: the same guard with no deadline, no queue limit and a
+  breaker that never opens, as before it existed
+
+Reports, per phase, throughput, status codes, p50/p99 latency and the
+largest number of requests in flight; then the breaker's transitions.
+"""
+import argparse
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+from benchmarks import common
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+
+import httpx
+
+from resilience import CircuitBreaker, ConcurrencyLimiter
+
+
+async def run_phase(http, counter, concurrency: int, duration: float, state):
+    statuses = Counter()
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            index = next(counter)
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+            start = time.perf_counter()
+            try:
+                response = await http.post("/api/contact", json={
+                    "name": "Jean Dupont",
+                    "email": f"jean.dupont.{index}@example.com",
+                    "service": "Autre",
+                    "message": f"Demande de devis numéro {index} pour un site vitrine.",
+                })
+                statuses[response.status_code] += 1
+                if response.status_code == 503:
+                    await asyncio.sleep(0.05)  # a client backing off briefly
+            finally:
+                state["in_flight"] -= 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return statuses, latencies, time.perf_counter() - start
+
+
+async def scenario(name: str, server, standin, args):
+    guard = server.db_guard
+    if name == "guarded":
+        guard.breaker = CircuitBreaker(window=50, min_calls=20, slow_call=args.timeout,
+                                       open_seconds=args.open_seconds)
+        guard.limiter = ConcurrencyLimiter(max_concurrent=50, max_waiting=200)
+        guard.timeout = args.timeout
+    else:
+        guard.breaker = CircuitBreaker(min_calls=10 ** 9)
+        guard.limiter = ConcurrencyLimiter(max_concurrent=10 ** 6, max_waiting=10 ** 6)
+        guard.timeout = None
+    guard.rejected.clear()
+
+    transitions = []
+
+    async def watch():
+        last = None
+        start = time.perf_counter()
+        while True:
+            if guard.breaker.state != last:
+                last = guard.breaker.state
+                transitions.append(f"{time.perf_counter() - start:.1f}s {last}")
+            await asyncio.sleep(0.01)
+
+    watcher = asyncio.create_task(watch())
+    counter = itertools.count()
+    print(name)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost", timeout=None) as http:
+        for phase, delay in (("healthy", 0.0), (f"+{args.delay:g}s", args.delay), ("recovered", 0.0)):
+            standin.delay = delay
+            state = {"in_flight": 0, "peak": 0}
+            statuses, latencies, elapsed = await run_phase(http, counter, args.concurrency, args.phase, state)
+            codes = " ".join(f"{code}:{count}" for code, count in sorted(statuses.items()))
+            print(f"  {phase:<10} {len(latencies) / elapsed:7,.0f} req/s  "
+                  f"p50 {common.percentile(latencies, 0.5) * 1e3:8.1f} ms  "
+                  f"p99 {common.percentile(latencies, 0.99) * 1e3:8.1f} ms  "
+                  f"peak in flight {state['peak']:>3}  [{codes}]")
+    watcher.cancel()
+    print(f"  breaker: {', '.join(transitions)}; rejected {dict(guard.rejected)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--phase", type=float, default=4.0, help="seconds per phase")
+    parser.add_argument("--delay", type=float, default=3.0, help="extra seconds per round trip while slow")
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--open-seconds", type=float, default=2.0)
+    parser.add_argument("--latency", type=float, default=0.002)
+    args = parser.parse_args()
+
+    from benchmarks.mongo_standin import StandinClient
+    standin = StandinClient(latency=args.latency)
+    server = common.use_database(standin["webmatic_benchmark"])
+    for name in ("guarded", "unguarded"):
+        await scenario(name, server, standin, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""Archiving expired status checks and exporting them back.
+
+    python -m benchmarks.bench_retention [--rows 20000] [--days 120] [--keep 30]
+                                         [--batch-size 1000] [--latency 0.002]
+                                         [--mongo-url URL]
+
+Seeds ``--rows`` status checks spread over the last ``--days`` days, then runs
+one archive pass keeping ``--keep`` days: reports documents archived per
+second, archive size against the NDJSON it holds, and the peak memory the
+pass allocated (it should track ``--batch-size``, not the backlog).  Then
+streams ``GET /api/admin/export/status_checks`` for the whole period through
+the app and checks every seeded document comes back exactly once.
+"""
+import argparse
+import asyncio
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from benchmarks import common
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+
+import httpx
+
+
+async def seed(collection, rows: int, days: int):
+    await collection.delete_many({})
+    now = datetime.utcnow()
+    step = timedelta(days=days) / rows
+    for start in range(0, rows, 10_000):
+        await collection.insert_many([{
+            "id": str(uuid.uuid4()),
+            "client_name": f"client_{index}",
+            "timestamp": now - step * (rows - index),
+            "ip_address": f"10.0.{(index >> 8) & 255}.{index & 255}",
+        } for index in range(start, min(rows, start + 10_000))])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--keep", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    common.add_mongo_arguments(parser)
+    args = parser.parse_args()
+
+    client = common.connect(args)
+    database = client[args.db_name]
+    server = common.use_database(database)
+    archive_dir = Path(tempfile.mkdtemp(prefix="webmatic-archive-"))
+    retention = server.retention
+    retention.archive_dir = archive_dir
+    retention.batch_size = args.batch_size
+    retention.policies["status_checks"].days = args.keep
+    retention.policies["contacts"].days = 0
+    try:
+        await seed(database.status_checks, args.rows, args.days)
+        await database.retention_locks.delete_many({})
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        removed = await retention.run_once()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        archived = removed.get("status_checks", 0)
+        files = list(archive_dir.rglob("*.ndjson.gz"))
+        compressed = sum(path.stat().st_size for path in files)
+        live = await database.status_checks.count_documents({})
+        print(f"archive pass: {archived:,} archived in {elapsed:.2f} s ({archived / elapsed:,.0f}/s), "
+              f"{live:,} kept, peak {peak / 2**20:.1f} MiB allocated")
+
+        exported = 0
+        raw = 0
+        ids = set()
+        since = (datetime.utcnow() - timedelta(days=args.days + 1)).date().isoformat()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as http:
+            start = time.perf_counter()
+            async with http.stream("GET", "/api/admin/export/status_checks", params={"since": since},
+                                   headers=common.auth_headers("admin")) as response:
+                assert response.status_code == 200, response.status_code
+                async for line in response.aiter_lines():
+                    if line:
+                        raw += len(line) + 1
+                        ids.add(json.loads(line)["id"])
+                        exported += 1
+            elapsed = time.perf_counter() - start
+        print(f"  {len(files):,} archive files, {compressed / 2**20:.1f} MiB for "
+              f"{raw * archived / max(exported, 1) / 2**20:.1f} MiB of NDJSON")
+        print(f"export: {exported:,} documents in {elapsed:.2f} s ({exported / elapsed:,.0f}/s)")
+        assert exported == len(ids) == args.rows, f"exported {exported} ({len(ids)} distinct) of {args.rows}"
+    finally:
+        shutil.rmtree(archive_dir, ignore_errors=True)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
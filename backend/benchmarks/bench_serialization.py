@@ -0,0 +1,87 @@
+"""Cost of serializing status check pages, per response_model and direct.
+
+    python -m benchmarks.bench_serialization [--rows 50 1000 10000] [--repeat 20]
+
+Starts from the documents Motor returns and ends with the response body:
+
+* ``model``: ``StatusCheck(**doc)`` per row, then FastAPI validates the list
+  against ``response_model`` again and encodes it with ``json``
+* ``fast``: the stored documents encoded directly (``serialization.dumps``,
+  orjson when installed)
+* ``fast/json``: the same direct path with the standard library encoder, for
+  installs without orjson
+
+Both paths produce byte-identical bodies; the benchmark checks that first.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+import serialization
+import server
+
+
+def documents(count: int):
+    start = datetime(2025, 1, 1)
+    return [{
+        "id": str(uuid.uuid4()),
+        "client_name": f"client_{index}",
+        "timestamp": start + timedelta(seconds=index, milliseconds=index % 1000),
+        "ip_address": f"10.0.{(index >> 8) & 255}.{index & 255}",
+    } for index in range(count)]
+
+
+def status_route():
+    return next(route for route in server.app.routes
+                if getattr(route, "path", None) == "/api/status" and "GET" in route.methods)
+
+
+async def model_body(field, rows) -> bytes:
+    checks = [server.StatusCheck(**row) for row in rows]
+    content = await serialize_response(field=field, response_content=checks, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+def stdlib_body(rows) -> bytes:
+    return json.dumps(rows, default=serialization._default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+async def timed(function, rows, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = function(rows)
+        if asyncio.iscoroutine(body):
+            await body
+    return (time.perf_counter() - start) / repeat
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[50, 1000, 10_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    field = status_route().response_field
+    print(f"orjson {'installed' if serialization.FAST_JSON else 'not installed'}")
+    for count in args.rows:
+        rows = documents(count)
+        expected = await model_body(field, rows)
+        assert serialization.dumps(rows) == expected == stdlib_body(rows), "bodies differ"
+
+        model = await timed(lambda r: model_body(field, r), rows, args.repeat)
+        fast = await timed(serialization.dumps, rows, args.repeat)
+        fallback = await timed(stdlib_body, rows, args.repeat)
+        print(f"  {count:>6,} rows  model {model * 1e3:8.2f} ms  fast {fast * 1e3:7.2f} ms "
+              f"({model / fast:5.1f}x)  fast/json {fallback * 1e3:7.2f} ms ({model / fallback:4.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
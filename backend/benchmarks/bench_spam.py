@@ -0,0 +1,69 @@
+"""Per-message spam scoring cost as the rule set grows.
+
+    python -m benchmarks.bench_spam [--rules 6 100 1000 10000] [--length 1000]
+
+Compares the old ``any(word in message.lower() ...)`` scan with the
+compiled SpamRules on clean messages, which are the worst case for both:
+every rule has to be ruled out.
+"""
+import argparse
+import random
+import string
+import time
+
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+from spam import SpamRules
+
+BASE_WORDS = ['casino', 'lottery', 'winner', 'bitcoin', 'crypto', 'investment']
+TEXT = ("Bonjour, je souhaiterais créer un site web pour mon entreprise de réparation "
+        "de consoles. Pouvez-vous me faire un devis détaillé avec la maintenance ? ")
+
+
+def make_terms(count: int, rng: random.Random):
+    terms = list(BASE_WORDS[:count])
+    while len(terms) < count:
+        length = rng.randint(5, 14)
+        terms.append("".join(rng.choice(string.ascii_lowercase) for _ in range(length)))
+    return terms
+
+
+def legacy_is_spam(words, message: str) -> bool:
+    message_lower = message.lower()
+    return any(word in message_lower for word in words)
+
+
+def timed(function, messages, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            function(message)
+    return (time.perf_counter() - start) / (repeat * len(messages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, nargs="+", default=[6, 100, 1000, 10_000])
+    parser.add_argument("--length", type=int, default=1000, help="message length in characters")
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    messages = []
+    for _ in range(args.messages):
+        start = rng.randrange(len(TEXT))
+        messages.append((TEXT[start:] + TEXT * (args.length // len(TEXT) + 1))[:args.length])
+
+    for count in args.rules:
+        terms = make_terms(count, rng)
+        start = time.perf_counter()
+        rules = SpamRules([(1.0, term) for term in terms])
+        compile_time = time.perf_counter() - start
+        repeat = max(1, 2000 // count)
+        legacy = timed(lambda message: legacy_is_spam(terms, message), messages, repeat)
+        compiled = timed(rules.score, messages, repeat)
+        print(f"{count:>6} rules  legacy {legacy * 1e6:9.1f} us/msg  compiled {compiled * 1e6:7.1f} us/msg  "
+              f"(compiled in {compile_time * 1e3:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
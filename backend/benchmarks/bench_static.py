@@ -0,0 +1,123 @@
+"""Serving the frontend build: per-request gzip against precompressed files.
+
+    python -m benchmarks.bench_static [--build ../frontend/build] [--requests 2000]
+
+Without ``--build`` a synthetic build is generated (an index.html, a 600 KB
+bundle, a stylesheet and an image).  Each file is requested repeatedly with
+``Accept-Encoding: gzip, br`` through two bare ASGI apps:
+
+* ``gzip9``: Starlette's StaticFiles behind GZipMiddleware at its default
+  level 9, compressing every response again, as a stock setup would
+* ``static_site``: StaticSite over the same files after ``precompress``
+
+Also times the dynamic gzip on a 50 row status page at levels 9 and 5.
+"""
+import argparse
+import asyncio
+import gzip
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.staticfiles import StaticFiles
+
+from benchmarks.bench_serialization import documents
+from compression import ENCODINGS, precompress
+from serialization import dumps
+from static_site import StaticSite
+
+
+def synthetic_build(root: Path):
+    rng = random.Random(7)
+    (root / "static" / "js").mkdir(parents=True)
+    (root / "static" / "css").mkdir(parents=True)
+    (root / "static" / "media").mkdir(parents=True)
+    (root / "index.html").write_text(
+        "<!doctype html><html lang=\"fr\"><head><meta charset=\"utf-8\"><title>Webmatic</title>"
+        "<script defer src=\"/static/js/main.3f2a1b4c.js\"></script>"
+        "<link href=\"/static/css/main.8c1d2e3f.css\" rel=\"stylesheet\"></head>"
+        "<body><noscript>Activez JavaScript.</noscript><div id=\"root\"></div></body></html>")
+    (root / "static" / "js" / "main.3f2a1b4c.js").write_text(";".join(
+        f"function c{index}(e,t){{return e.createElement(\"div\",{{className:\"card-{index % 97}\"}},t)}}"
+        for index in range(8000)))
+    (root / "static" / "css" / "main.8c1d2e3f.css").write_text("\n".join(
+        f".card-{index}{{margin:{index % 7}px;padding:{index % 5}rem;color:#{index * 2654435761 % 16777216:06x}}}"
+        for index in range(1500)))
+    (root / "static" / "media" / "hero.5d5d9eef.jpg").write_bytes(rng.randbytes(150_000))
+
+
+async def fetch(app, path: str):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"webmatic.fr"), (b"accept-encoding", b"gzip, br")],
+        "client": ("203.0.113.7", 50000), "server": ("webmatic.fr", 80),
+    }
+    size = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return size
+
+
+async def measure(app, path: str, count: int):
+    size = await fetch(app, path)
+    start = time.perf_counter()
+    for _ in range(count):
+        await fetch(app, path)
+    return count / (time.perf_counter() - start), size
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--build", help="an existing frontend build directory (copied, not modified)")
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="webmatic-build-"))
+    root = workdir / "build"
+    try:
+        if args.build:
+            shutil.copytree(args.build, root)
+        else:
+            synthetic_build(root)
+        paths = sorted("/" + path.relative_to(root).as_posix() for path in root.rglob("*") if path.is_file())
+
+        stock = GZipMiddleware(StaticFiles(directory=root))
+        counts = precompress(root)
+        site = StaticSite(root, not_found=stock)
+        site.load()
+        print(f"precompressed {counts['files']} files ({', '.join(ENCODINGS)}), "
+              f"{site.memory_used // 1024} KiB held in memory")
+
+        for path in paths:
+            stock_rate, stock_size = await measure(stock, path, args.requests)
+            site_rate, site_size = await measure(site, path, args.requests)
+            print(f"  {path:<36} gzip9 {stock_rate:8,.0f} req/s {stock_size:>8,} B   "
+                  f"static_site {site_rate:8,.0f} req/s {site_size:>8,} B  ({site_rate / stock_rate:5.1f}x)")
+
+        body = dumps(documents(50))
+        for level in (9, 5):
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                compressed = gzip.compress(body, compresslevel=level)
+            elapsed = (time.perf_counter() - start) / args.requests
+            print(f"  status page {len(body):,} B at gzip level {level}: "
+                  f"{elapsed * 1e6:6.1f} µs, {len(compressed):,} B")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
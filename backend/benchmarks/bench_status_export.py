@@ -0,0 +1,119 @@
+"""Time to first byte and peak RSS when exporting status checks.
+
+    python -m benchmarks.bench_status_export [--documents 1000000]
+                                             [--mongo-url mongodb://localhost:27017]
+
+Needs a real MongoDB: memory use is the point, and an in-memory stand-in
+would hold the whole collection itself.  The collection is seeded once, then
+each mode runs against a fresh uvicorn process so its peak RSS (VmHWM) is
+measured in isolation:
+
+* ``page``: one JSON page holding every document (the old to_list approach)
+* ``stream``: the NDJSON export, read from the Motor cursor in batches
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks import BACKEND_DIR, common
+import httpx
+from pymongo import MongoClient
+
+
+def seed(collection, documents: int):
+    existing = collection.estimated_document_count()
+    if existing >= documents:
+        return existing
+    start = datetime.utcnow() - timedelta(seconds=documents)
+    batch = []
+    for index in range(existing, documents):
+        batch.append({
+            "id": str(uuid.uuid4()),
+            "client_name": f"client_{index}",
+            "timestamp": start + timedelta(seconds=index),
+            "ip_address": f"10.0.{(index >> 8) & 255}.{index & 255}",
+        })
+        if len(batch) == 10_000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    collection.create_index([("timestamp", 1), ("id", 1)])
+    return collection.estimated_document_count()
+
+
+def start_server(args, **env_overrides):
+    env = dict(os.environ, MONGO_URL=args.mongo_url, DB_NAME=args.db_name,
+               RATE_LIMIT_CALLS=str(10 ** 9))
+    env.update(env_overrides)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{args.port}/health", timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+def peak_rss(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def run(args, name: str, params: dict):
+    process = start_server(args)
+    try:
+        baseline = peak_rss(process.pid)
+        start = time.perf_counter()
+        first_byte = None
+        size = 0
+        with httpx.stream("GET", f"http://127.0.0.1:{args.port}/api/status", params=params,
+                          headers={"Accept-Encoding": "identity", **common.auth_headers()},
+                          timeout=None) as response:
+            response.raise_for_status()
+            for chunk in response.iter_raw():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+                size += len(chunk)
+        total = time.perf_counter() - start
+        peak = peak_rss(process.pid)
+    finally:
+        process.terminate()
+        process.wait()
+    print(f"  {name:<7} ttfb {first_byte * 1e3:9.1f} ms  total {total:7.2f} s  "
+          f"{size / 2**20:8.1f} MiB sent  peak RSS {peak / 2**20:7.1f} MiB "
+          f"(+{(peak - baseline) / 2**20:.1f} after startup)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=1_000_000)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="webmatic_benchmark")
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_url)
+    count = seed(client[args.db_name].status_checks, args.documents)
+    client.close()
+    print(f"{count:,} status checks")
+
+    run(args, "page", {"limit": count})
+    run(args, "stream", {"stream": "true"})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Time series analytics: response time as ``contacts`` grows.
+
+    python -m benchmarks.bench_timeseries [--sizes 10000 100000 1000000] [--per-hour 100]
+                                          [--requests 50] [--latency 0.002]
+                                          [--mongo-url URL]
+
+Seeds ``contacts`` at a steady ``--per-hour`` rate up to now, so a bigger
+collection holds a longer history, not busier days, then requests
+``GET /api/analytics/timeseries`` through the app (response cache cleared
+before each request) for 48 hours by hour, 90 days by day and two years by
+week:
+
+* ``cold``: the first request, no bucket cached yet: one pipeline over the
+  whole range, so it grows with the documents in the range
+* ``warm``: the following requests while a contact arrives before each one;
+  closed buckets come from the cache and only the open bucket is aggregated
+
+The stand-in keeps every document in memory (about 1 GB for 1M contacts);
+run 10M against a real server::
+
+    python -m benchmarks.bench_timeseries --sizes 10000 1000000 10000000 --mongo-url mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import common
+from benchmarks import BACKEND_DIR  # noqa: F401  (puts backend on sys.path)
+
+import httpx
+
+SERVICES = ("Création de site web", "Maintenance informatique", "Réparation console", "Support mobile", "Autre")
+QUERIES = (
+    ("48 hours by hour", "hour", timedelta(hours=48)),
+    ("90 days by day", "day", timedelta(days=90)),
+    ("2 years by week", "week", timedelta(weeks=104)),
+)
+
+
+def contact(index: int, timestamp: datetime) -> dict:
+    return {
+        "id": f"benchmark-{index}",
+        "name": "Jean Dupont",
+        "email": f"jean.dupont.{index}@example.com",
+        "service": SERVICES[index % len(SERVICES)],
+        "timestamp": timestamp,
+    }
+
+
+async def seed(collection, size: int, per_hour: int):
+    """``size`` contacts, oldest first, ending now."""
+    await collection.create_index("timestamp")
+    step = timedelta(hours=1) / per_hour
+    start = datetime.utcnow() - step * size
+    for first in range(0, size, 10_000):
+        await collection.insert_many([contact(index, start + step * index)
+                                      for index in range(first, min(size, first + 10_000))], ordered=False)
+
+
+async def measure(server, http, database, granularity: str, span: timedelta, requests: int):
+    headers = common.auth_headers()
+    timings = []
+    for attempt in range(requests + 1):
+        if attempt:
+            await database.contacts.insert_one(contact(-attempt, datetime.utcnow()))
+        server.response_cache.clear()
+        params = {"granularity": granularity, "start": (datetime.utcnow() - span).isoformat()}
+        start = time.perf_counter()
+        response = await http.get("/api/analytics/timeseries", params=params, headers=headers)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return timings[0], timings[1:], response.json()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--per-hour", type=int, default=100, help="contacts per hour of history")
+    parser.add_argument("--requests", type=int, default=50, help="warm requests per query")
+    common.add_mongo_arguments(parser)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        client = common.connect(args)
+        name = f"{args.db_name}_timeseries_{size}"
+        if args.mongo_url:
+            await client.drop_database(name)
+        database = client[name]
+        start = time.perf_counter()
+        await seed(database.contacts, size, args.per_hour)
+        print(f"{size:,} contacts, {size / args.per_hour / 24 / 365:.1f} years of history "
+              f"(seeded in {time.perf_counter() - start:.1f} s)")
+
+        server = common.use_database(database)
+        await server.time_series.clear()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as http:
+            for label, granularity, span in QUERIES:
+                aggregations = server.time_series.aggregations
+                cold, warm, body = await measure(server, http, database, granularity, span, args.requests)
+                per_request = (server.time_series.aggregations - aggregations - 1) / args.requests
+                print(f"  {label:<17} cold {cold * 1e3:8.1f} ms   warm p50 {common.percentile(warm, 0.5) * 1e3:6.2f} ms"
+                      f"  p99 {common.percentile(warm, 0.99) * 1e3:6.2f} ms  "
+                      f"({len(body['buckets'])} buckets, {body['total']:,} contacts, "
+                      f"{per_request:.0f} pipeline/request)")
+        if args.mongo_url:
+            await client.drop_database(name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
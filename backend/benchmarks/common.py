@@ -0,0 +1,81 @@
+"""Helpers shared by the benchmarks."""
+import os
+
+# Benchmarks drive many requests from few addresses: keep the rate limiter
+# out of the way unless a scenario configures it explicitly.
+os.environ.setdefault("RATE_LIMIT_CALLS", str(10 ** 9))
+# In-process clients connect from 127.0.0.1 and pose as many clients with
+# X-Forwarded-For, as a load balancer in front of the app would
+os.environ.setdefault("TRUSTED_PROXIES", "127.0.0.1")
+# A fixed signing key, shared with servers the benchmarks start themselves
+os.environ.setdefault("JWT_SECRET_KEY", "webmatic-benchmark-signing-key-not-for-production")
+
+
+def auth_headers(scope: str = "") -> dict:
+    """Bearer token for the authenticated read endpoints (``scope="admin"`` for exports)."""
+    from datetime import timedelta
+    from auth import TokenVerifier
+    claims = {"sub": "benchmark", "scope": scope} if scope else {"sub": "benchmark"}
+    token = TokenVerifier([os.environ["JWT_SECRET_KEY"]]).issue(claims, timedelta(hours=1))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def add_mongo_arguments(parser):
+    parser.add_argument("--mongo-url", help="benchmark against this MongoDB server instead of the stand-in")
+    parser.add_argument("--db-name", default="webmatic_benchmark")
+    parser.add_argument("--latency", type=float, default=0.002,
+                        help="stand-in round-trip latency in seconds")
+
+
+def connect(args):
+    """Return a Motor client for ``--mongo-url`` or an in-memory stand-in."""
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        return AsyncIOMotorClient(args.mongo_url)
+    from benchmarks.mongo_standin import StandinClient
+    return StandinClient(latency=args.latency)
+
+
+def use_database(database):
+    """Point the server module at ``database`` instead of the configured one."""
+    import server
+    from resilience import GuardedDatabase
+    profiles = server.db_profiles.bind(database.client, database.name)
+    database = GuardedDatabase(database, server.db_guard)
+    server.db = database
+    server.contact_rollups.collection = database.contact_rollups
+    server.contact_rollups.reads = profiles["analytics"].contact_rollups
+    server.contact_rollups.contacts = profiles["analytics"].contacts
+    if server.contact_dedup:
+        server.contact_dedup.collection = database.contact_fingerprints
+    server.retention.database = database
+    server.time_series.database = profiles["analytics"]
+    if server.contact_writer:
+        server.contact_writer.collection = profiles["contacts"].contacts
+    server.response_cache.clear()
+    return server
+
+
+def use_rate_limit(server, backend):
+    """Swap the rate limiter behind ``server.app``; returns the previous one."""
+    from server import RateLimitMiddleware
+    previous = server.rate_limit_backend
+    for middleware in server.app.user_middleware:
+        if middleware.cls is RateLimitMiddleware:
+            middleware.kwargs["backend"] = backend
+    server.rate_limit_backend = backend
+    server.app.middleware_stack = None  # rebuilt on the next request
+    return previous
+
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(latencies, elapsed: float) -> str:
+    return (f"{len(latencies) / elapsed:9,.0f} req/s  "
+            f"p50 {percentile(latencies, 0.50) * 1e3:7.2f} ms  "
+            f"p99 {percentile(latencies, 0.99) * 1e3:7.2f} ms")
@@ -0,0 +1,579 @@
+"""In-memory stand-in for the subset of the Motor API the backend uses.
+
+Benchmarks run against it by default so they need no MongoDB server.  Every
+operation costs one simulated round trip (``latency`` seconds plus
+``per_document`` seconds per document written or returned) and holds one of
+``pool_size`` connections while it waits, like a Motor connection pool.
+``delay`` can be changed at runtime to inject extra latency, and ``fail``
+to make every operation raise.
+
+With ``members`` > 1 it stands in for a replica set: each member has its
+own pool, writes go to the primary and wait ``replication_latency`` more
+unless the write concern is ``w=1`` (``majority`` is the default, as on
+MongoDB 5.0+), ``j=True`` adds ``journal_latency``, and reads with a
+secondary read preference take turns on the secondaries.  Secondaries never
+lag.  Options set with ``get_database``, ``get_collection`` and
+``with_options`` apply to the handle they return.
+
+The leading field of each index keeps a sorted column, so ``$gt``/``$lt``
+range filters on it read only the matching documents, as a MongoDB index
+scan would; indexed fields are assumed not to change after insertion.
+``aggregate`` runs ``$match``, ``$group`` (``$sum``), ``$sort`` and
+``$limit`` stages with field paths, ``$subtract``, ``$mod`` and
+``$dateToString`` expressions.
+
+Pass ``--mongo-url`` to a benchmark to use a real server instead.
+"""
+import asyncio
+import copy
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, ServerSelectionTimeoutError
+from pymongo.results import DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+
+# pymongo read preference modes that may read from a secondary
+SECONDARY_MODES = (2, 3, 4)  # secondary, secondaryPreferred, nearest
+
+
+class StandinClient:
+    def __init__(self, latency: float = 0.001, per_document: float = 0.00001, pool_size: int = 100,
+                 members: int = 1, replication_latency: float = 0.002, journal_latency: float = 0.001):
+        self.latency = latency
+        self.per_document = per_document
+        self.replication_latency = replication_latency
+        self.journal_latency = journal_latency
+        self.delay = 0.0
+        self.fail = False
+        self.pools = [asyncio.Semaphore(pool_size) for _ in range(members)]
+        self.pool = self.pools[0]
+        self.round_trips = 0
+        self.member_round_trips = [0] * members
+        self._next_secondary = 0
+        self._databases = {}
+
+    def __getitem__(self, name: str) -> "StandinDatabase":
+        if name not in self._databases:
+            self._databases[name] = StandinDatabase(self, name)
+        return self._databases[name]
+
+    def get_database(self, name: str, **options) -> "StandinDatabase":
+        return self[name].with_options(**options)
+
+    async def round_trip(self, documents: int = 0, options: Optional[dict] = None, write: bool = False):
+        options = options or {}
+        member = 0
+        extra = 0.0
+        if write:
+            concern = options.get("write_concern")
+            document = concern.document if concern is not None else {}
+            if len(self.pools) > 1 and document.get("w", "majority") not in (0, 1):
+                extra += self.replication_latency
+            if document.get("j"):
+                extra += self.journal_latency
+        elif len(self.pools) > 1 and getattr(options.get("read_preference"), "mode", 0) in SECONDARY_MODES:
+            self._next_secondary += 1
+            member = 1 + self._next_secondary % (len(self.pools) - 1)
+        async with self.pools[member]:
+            self.round_trips += 1
+            self.member_round_trips[member] += 1
+            await asyncio.sleep(self.latency + self.delay + documents * self.per_document + extra)
+            if self.fail:
+                raise ServerSelectionTimeoutError("stand-in failure injected")
+
+    async def admin_command(self, command):
+        await self.round_trip()
+        return {"ok": 1.0}
+
+    @property
+    def admin(self):
+        return _Admin(self)
+
+    def close(self):
+        pass
+
+
+class _Admin:
+    def __init__(self, client):
+        self.client = client
+
+    async def command(self, command, *args, **kwargs):
+        return await self.client.admin_command(command)
+
+
+class StandinDatabase:
+    def __init__(self, client: StandinClient, name: str):
+        self.client = client
+        self.name = name
+        self.options = {}
+        self._collections = {}
+        self._views = {}
+
+    def __getitem__(self, name: str) -> "StandinCollection":
+        if name not in self._collections:
+            self._collections[name] = StandinCollection(self, name)
+        if not self.options:
+            return self._collections[name]
+        if name not in self._views:
+            self._views[name] = self._collections[name].with_options(**self.options)
+        return self._views[name]
+
+    def with_options(self, **options) -> "StandinDatabase":
+        view = copy.copy(self)  # shares the collections
+        view.options = {**self.options, **{key: value for key, value in options.items() if value is not None}}
+        view._views = {}
+        return view
+
+    def __getattr__(self, name: str) -> "StandinCollection":
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **options) -> "StandinCollection":
+        return self[name].with_options(**options)
+
+    async def command(self, command, *args, **kwargs):
+        return await self.client.admin_command(command)
+
+
+class StandinCollection:
+    def __init__(self, database: StandinDatabase, name: str):
+        self.database = database
+        self.name = name
+        self.options = {}
+        self.documents = {}
+        self.indexes = {}
+        self._unique = {}  # fields -> set of keys already stored
+        self._ranges = {}  # leading index field -> (sorted values, matching _ids)
+
+    def with_options(self, **options) -> "StandinCollection":
+        view = copy.copy(self)  # shares the documents and indexes
+        view.options = {**self.options, **{key: value for key, value in options.items() if value is not None}}
+        return view
+
+    async def _round_trip(self, documents: int = 0, write: bool = False):
+        await self.database.client.round_trip(documents, self.options, write)
+
+    # Indexes -------------------------------------------------------------
+
+    async def create_index(self, keys, unique: bool = False, **options):
+        await self.database.client.round_trip()
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        name = "_".join(f"{field}_{direction}" for field, direction in keys)
+        self.indexes[name] = {"key": list(keys), "unique": unique, **options}
+        if unique:
+            fields = tuple(field for field, _ in keys)
+            self._unique[fields] = {tuple(_get(d, f) for f in fields) for d in self.documents.values()}
+        field = keys[0][0]
+        if field != "_id" and field not in self._ranges:
+            entries = sorted((value, key) for key, value in
+                             ((key, _get(d, field)) for key, d in self.documents.items()) if value is not None)
+            self._ranges[field] = ([value for value, _ in entries], [key for _, key in entries])
+        return name
+
+    async def index_information(self):
+        await self.database.client.round_trip()
+        return dict(self.indexes)
+
+    async def drop_index(self, name: str):
+        await self.database.client.round_trip()
+        self.indexes.pop(name, None)
+
+    # Writes --------------------------------------------------------------
+
+    def _store(self, document: dict):
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError("duplicate _id", 11000)
+        keys = {fields: tuple(_get(document, f) for f in fields) for fields in self._unique}
+        for fields, key in keys.items():
+            if key in self._unique[fields]:
+                raise DuplicateKeyError(f"duplicate key {dict(zip(fields, key))}", 11000)
+        for fields, key in keys.items():
+            self._unique[fields].add(key)
+        self.documents[document["_id"]] = copy.deepcopy(document)
+        for field, (values, ids) in self._ranges.items():
+            value = _get(document, field)
+            if value is not None:
+                position = bisect_right(values, value)
+                values.insert(position, value)
+                ids.insert(position, document["_id"])
+
+    def _remove(self, key):
+        document = self.documents.pop(key)
+        for fields, keys in self._unique.items():
+            keys.discard(tuple(_get(document, f) for f in fields))
+        for field, (values, ids) in self._ranges.items():
+            value = _get(document, field)
+            if value is not None:
+                position = ids.index(key, bisect_left(values, value))
+                del values[position]
+                del ids[position]
+
+    async def insert_one(self, document: dict, **kwargs):
+        await self._round_trip(1, write=True)
+        self._store(document)
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents, ordered: bool = True, **kwargs):
+        documents = list(documents)
+        await self._round_trip(len(documents), write=True)
+        errors = []
+        for index, document in enumerate(documents):
+            try:
+                self._store(document)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [],
+                                  "nInserted": len(documents) - len(errors)})
+        return InsertManyResult([document["_id"] for document in documents], True)
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs):
+        await self._round_trip(1, write=True)
+        document = self._find_first(filter)
+        if document is None:
+            if not upsert:
+                return UpdateResult({"n": 0, "nModified": 0}, True)
+            document = self._upsert(filter, update)
+            return UpdateResult({"n": 1, "nModified": 0, "upserted": document["_id"]}, True)
+        _apply(document, update, inserting=False)
+        return UpdateResult({"n": 1, "nModified": 1}, True)
+
+    async def replace_one(self, filter: dict, replacement: dict, **kwargs):
+        await self._round_trip(1, write=True)
+        document = self._find_first(filter)
+        if document is None:
+            return UpdateResult({"n": 0, "nModified": 0}, True)
+        self._remove(document["_id"])
+        self._store({**copy.deepcopy(replacement), "_id": document["_id"]})
+        return UpdateResult({"n": 1, "nModified": 1}, True)
+
+    async def update_many(self, filter: dict, update: dict, **kwargs):
+        matched = [d for d in self.documents.values() if _matches(d, filter)]
+        await self._round_trip(len(matched), write=True)
+        for document in matched:
+            _apply(document, update, inserting=False)
+        return UpdateResult({"n": len(matched), "nModified": len(matched)}, True)
+
+    async def find_one_and_update(self, filter: dict, update: dict, upsert: bool = False,
+                                  return_document=ReturnDocument.BEFORE, sort=None,
+                                  projection=None, **kwargs):
+        await self._round_trip(1, write=True)
+        if sort:
+            candidates = _sorted([d for d in self.documents.values() if _matches(d, filter)], sort)
+            document = candidates[0] if candidates else None
+        else:
+            document = self._find_first(filter)
+        if document is None:
+            if not upsert:
+                return None
+            document = self._upsert(filter, update)
+            return _project(document, projection) if return_document == ReturnDocument.AFTER else None
+        before = copy.deepcopy(document)
+        _apply(document, update, inserting=False)
+        return _project(document if return_document == ReturnDocument.AFTER else before, projection)
+
+    async def bulk_write(self, requests, ordered: bool = True, **kwargs):
+        requests = list(requests)
+        await self._round_trip(len(requests), write=True)
+        for request in requests:
+            # pymongo.UpdateOne keeps its arguments in private attributes.
+            document = self._find_first(request._filter)
+            if document is None:
+                if request._upsert:
+                    self._upsert(request._filter, request._doc)
+            else:
+                _apply(document, request._doc, inserting=False)
+
+    async def delete_many(self, filter: dict, **kwargs):
+        matched = [d["_id"] for d in self._candidates(filter) if _matches(d, filter)]
+        await self._round_trip(len(matched), write=True)
+        for key in matched:
+            self._remove(key)
+        return DeleteResult({"n": len(matched)}, True)
+
+    async def delete_one(self, filter: dict, **kwargs):
+        await self._round_trip(1, write=True)
+        document = self._find_first(filter)
+        if document is not None:
+            self._remove(document["_id"])
+        return DeleteResult({"n": int(document is not None)}, True)
+
+    def _upsert(self, filter: dict, update: dict) -> dict:
+        document = {key: value for key, value in filter.items() if not key.startswith("$")
+                    and not isinstance(value, dict)}
+        _apply(document, update, inserting=True)
+        self._store(document)
+        return self.documents[document["_id"]]
+
+    # Reads ---------------------------------------------------------------
+
+    def _candidates(self, filter: dict):
+        """Documents that may match ``filter``: a range of an index when one applies."""
+        for field, condition in filter.items():
+            if field not in self._ranges or not isinstance(condition, dict):
+                continue
+            if not {"$gt", "$gte", "$lt", "$lte"} & set(condition):
+                continue
+            values, ids = self._ranges[field]
+            low, high = 0, len(values)
+            if "$gte" in condition:
+                low = max(low, bisect_left(values, condition["$gte"]))
+            if "$gt" in condition:
+                low = max(low, bisect_right(values, condition["$gt"]))
+            if "$lte" in condition:
+                high = min(high, bisect_right(values, condition["$lte"]))
+            if "$lt" in condition:
+                high = min(high, bisect_left(values, condition["$lt"]))
+            return [self.documents[key] for key in ids[low:high]]
+        return list(self.documents.values())
+
+    def _find_first(self, filter: dict) -> Optional[dict]:
+        if set(filter) == {"_id"} and not isinstance(filter["_id"], dict):
+            return self.documents.get(filter["_id"])
+        return next((d for d in self.documents.values() if _matches(d, filter)), None)
+
+    async def find_one(self, filter: Optional[dict] = None, projection=None, **kwargs):
+        await self._round_trip(1)
+        document = self._find_first(filter or {})
+        return _project(document, projection) if document is not None else None
+
+    async def count_documents(self, filter: dict, **kwargs):
+        await self._round_trip()
+        return sum(1 for d in self._candidates(filter) if _matches(d, filter))
+
+    async def estimated_document_count(self, **kwargs):
+        await self._round_trip()
+        return len(self.documents)
+
+    def find(self, filter: Optional[dict] = None, projection=None, sort=None, limit: int = 0, **kwargs):
+        return StandinCursor(self, filter or {}, projection, sort, limit)
+
+    def aggregate(self, pipeline, **kwargs):
+        return StandinAggregateCursor(self, list(pipeline))
+
+
+class StandinCursor:
+    def __init__(self, collection: StandinCollection, filter, projection, sort, limit):
+        self.collection = collection
+        self.filter = filter
+        self.projection = projection
+        self._sort = sort
+        self._limit = limit
+        self._batch_size = 101
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size: int):
+        self._batch_size = batch_size
+        return self
+
+    def _evaluate(self):
+        documents = [d for d in self.collection._candidates(self.filter) if _matches(d, self.filter)]
+        if self._sort:
+            documents = _sorted(documents, self._sort)
+        if self._limit:
+            documents = documents[:self._limit]
+        return [_project(d, self.projection) for d in documents]
+
+    async def to_list(self, length=None):
+        results = self._evaluate()
+        if length:
+            results = results[:length]
+        await self.collection._round_trip(len(results))
+        return results
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        results = self._evaluate()
+        for start in range(0, len(results), self._batch_size):
+            batch = results[start:start + self._batch_size]
+            await self.collection._round_trip(len(batch))
+            for document in batch:
+                yield document
+
+
+class StandinAggregateCursor(StandinCursor):
+    def __init__(self, collection: StandinCollection, pipeline):
+        super().__init__(collection, {}, None, None, 0)
+        self.pipeline = pipeline
+
+    def _evaluate(self):
+        stages = self.pipeline
+        if stages and "$match" in stages[0]:
+            documents = [d for d in self.collection._candidates(stages[0]["$match"])
+                         if _matches(d, stages[0]["$match"])]
+            stages = stages[1:]
+        else:
+            documents = list(self.collection.documents.values())
+        for stage in stages:
+            (name, spec), = stage.items()
+            if name == "$match":
+                documents = [d for d in documents if _matches(d, spec)]
+            elif name == "$group":
+                documents = _group(documents, spec)
+            elif name == "$sort":
+                documents = _sorted(documents, spec.items())
+            elif name == "$limit":
+                documents = documents[:spec]
+            else:
+                raise NotImplementedError(f"stand-in aggregate has no {name} stage")
+        return [copy.deepcopy(d) for d in documents]
+
+
+def _group(documents, spec: dict):
+    groups = {}
+    for document in documents:
+        key = _expression(spec["_id"], document)
+        group = groups.get(_hashable(key))
+        if group is None:
+            group = groups[_hashable(key)] = {"_id": key, **{field: 0 for field in spec if field != "_id"}}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (name, operand), = accumulator.items()
+            if name != "$sum":
+                raise NotImplementedError(f"stand-in $group has no {name} accumulator")
+            value = _expression(operand, document)
+            group[field] += value if isinstance(value, (int, float)) else 0
+    return list(groups.values())
+
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return tuple((key, _hashable(item)) for key, item in value.items())
+    return value
+
+
+def _subtract(first, second):
+    if isinstance(first, datetime) and isinstance(second, datetime):
+        return (first - second) / timedelta(milliseconds=1)  # milliseconds, like MongoDB
+    if isinstance(first, datetime):
+        return first - timedelta(milliseconds=second)
+    return first - second
+
+
+_EXPRESSIONS = {
+    "$subtract": lambda args, document: _subtract(*(_expression(arg, document) for arg in args)),
+    "$mod": lambda args, document: _expression(args[0], document) % _expression(args[1], document),
+    "$dateToString": lambda args, document: _expression(args["date"], document).strftime(args["format"]),
+}
+
+
+def _expression(expression, document):
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get(document, expression[1:])
+    if isinstance(expression, dict):
+        if len(expression) == 1 and next(iter(expression)).startswith("$"):
+            (name, args), = expression.items()
+            return _EXPRESSIONS[name](args, document)
+        return {key: _expression(value, document) for key, value in expression.items()}
+    return expression
+
+
+def _get(document: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+def _matches(document: dict, filter: dict) -> bool:
+    for key, condition in filter.items():
+        if key == "$or":
+            if not any(_matches(document, clause) for clause in condition):
+                return False
+            continue
+        if key == "$and":
+            if not all(_matches(document, clause) for clause in condition):
+                return False
+            continue
+        value = _get(document, key)
+        if isinstance(condition, dict) and any(op.startswith("$") for op in condition):
+            for op, operand in condition.items():
+                if not _OPERATORS[op](value, operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _compare(op):
+    def check(value, operand):
+        return value is not None and op(value, operand)
+    return check
+
+
+_OPERATORS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": _compare(lambda a, b: a > b),
+    "$gte": _compare(lambda a, b: a >= b),
+    "$lt": _compare(lambda a, b: a < b),
+    "$lte": _compare(lambda a, b: a <= b),
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+    "$exists": lambda value, operand: (value is not None) == bool(operand),
+}
+
+
+def _apply(document: dict, update: dict, inserting: bool):
+    for op, fields in update.items():
+        for path, value in fields.items():
+            # "a.b" updates field b of the embedded document a, creating it if needed
+            *parents, field = path.split(".")
+            document_at = document
+            for parent in parents:
+                document_at = document_at.setdefault(parent, {})
+            _apply_field(document_at, op, field, value, inserting)
+
+
+def _apply_field(document: dict, op: str, field: str, value, inserting: bool):
+    if op == "$set" or (op == "$setOnInsert" and inserting):
+        document[field] = value
+    elif op == "$inc":
+        document[field] = document.get(field, 0) + value
+    elif op == "$unset":
+        document.pop(field, None)
+    elif op == "$max":
+        document[field] = max(document.get(field, value), value)
+
+
+def _sorted(documents, sort):
+    for field, direction in reversed(list(sort)):
+        documents = sorted(documents, key=lambda d: _get(d, field), reverse=direction == -1)
+    return documents
+
+
+def _project(document: dict, projection) -> dict:
+    document = copy.deepcopy(document)
+    if not projection:
+        return document
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    included = [field for field, flag in projection.items() if flag and field != "_id"]
+    if included:
+        result = {field: document[field] for field in included if field in document}
+        if projection.get("_id", 1) and "_id" in document:
+            result["_id"] = document["_id"]
+        return result
+    return {key: value for key, value in document.items() if projection.get(key, 1)}
+
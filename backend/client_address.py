@@ -0,0 +1,61 @@
+"""Client addresses behind reverse proxies.
+
+``X-Forwarded-For`` is a list each proxy appends the address it saw to, so
+only its right-hand end is trustworthy: a client can put anything on the
+left.  ``TrustedProxies`` walks the chain from the connected peer leftwards
+and returns the first address that is not a trusted proxy:
+
+* ``networks``: proxy prefixes (``TRUSTED_PROXIES``, e.g.
+  ``"10.0.0.0/8,127.0.0.1"``); any hop inside one is skipped
+* ``hops``: the number of proxies in front of the app
+  (``TRUSTED_PROXY_HOPS``); the last ``hops`` hops are skipped wherever
+  they are
+
+With neither set, the header is ignored and the client is the connected
+peer, so a direct client cannot pick its own rate-limit key or get past
+the IP reputation lists.
+"""
+import ipaddress
+from functools import lru_cache
+from typing import Iterable
+
+
+class TrustedProxies:
+    def __init__(self, networks: Iterable[str] = (), hops: int = 0):
+        if hops < 0:
+            raise ValueError("hops must be zero or more")
+        self.networks = tuple(ipaddress.ip_network(entry.strip(), strict=False)
+                              for entry in networks if entry.strip())
+        self.hops = hops
+        self._is_proxy = lru_cache(maxsize=4096)(self._in_networks)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.networks or self.hops)
+
+    def _in_networks(self, address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        return any(ip in network for network in self.networks)
+
+    def client_ip(self, scope) -> str:
+        """Client address of an ASGI scope."""
+        peer = scope["client"][0] if scope.get("client") else "unknown"
+        if not self.enabled:
+            return peer
+        forwarded = [
+            address.strip()
+            for name, value in scope.get("headers", ())
+            if name == b"x-forwarded-for"
+            for address in value.decode("latin-1").split(",")
+        ]
+        chain = [address for address in forwarded if address] + [peer]
+        for distance, address in enumerate(reversed(chain)):
+            if distance >= self.hops and not (self.networks and self._is_proxy(address)):
+                return address
+        # Every hop is a proxy: the leftmost is as close to the client as we get
+        return chain[0]
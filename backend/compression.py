@@ -0,0 +1,133 @@
+"""Response compression: negotiation, precompressed files and dynamic gzip.
+
+Static files are compressed once, ahead of time (``precompress``): gzip at
+level 9 and, when the ``brotli`` package is installed, brotli at quality 11,
+written next to the original as ``.gz`` and ``.br``.  A variant is kept only
+if it saves at least 10%, so requests for it never cost CPU.
+
+Dynamic responses go through ``DynamicGZipMiddleware``, Starlette's gzip
+restricted to where it pays off: paths under the given prefixes, bodies of
+at least ``minimum_size`` bytes, content types that are not already
+compressed, and a middle compression level (Starlette defaults to 9, which
+costs several times the CPU of 5 for a few percent smaller JSON).
+"""
+import gzip
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional, gzip variants only
+    brotli = None
+
+# Preferred first when the client accepts several
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+COMPRESSIBLE_TYPES = re.compile(
+    r"^(text/|application/(json|x-ndjson|javascript|xml|manifest\+json|wasm)|image/svg\+xml|font/(ttf|otf))")
+COMPRESSIBLE_SUFFIXES = frozenset((
+    ".html", ".js", ".mjs", ".css", ".json", ".map", ".svg", ".txt", ".xml", ".ico", ".webmanifest", ".ttf", ".otf"))
+MIN_SAVING = 0.9
+
+
+def accepted_encodings(header: str) -> List[str]:
+    """Codings from an Accept-Encoding value that we can send, best first."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            accepted[coding] = quality
+    wildcard = accepted.get("*", 0.0)
+    return [coding for coding in ENCODINGS if accepted.get(coding, wildcard) > 0]
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # mtime=0: identical input gives identical output on every host
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(root, min_size: int = 1024) -> Dict[str, int]:
+    """Write missing or stale ``.gz``/``.br`` variants under ``root``; returns counts."""
+    written = {"files": 0, "variants": 0, "skipped": 0}
+    for path in _compressible_files(Path(root)):
+        stat = path.stat()
+        if stat.st_size < min_size:
+            continue
+        written["files"] += 1
+        data = None
+        for encoding in ENCODINGS:
+            variant = path.with_name(path.name + SUFFIXES[encoding])
+            if variant.exists() and variant.stat().st_mtime_ns >= stat.st_mtime_ns:
+                continue
+            data = data if data is not None else path.read_bytes()
+            compressed = compress(data, encoding)
+            if len(compressed) > len(data) * MIN_SAVING:
+                variant.unlink(missing_ok=True)
+                written["skipped"] += 1
+                continue
+            _replace(variant, compressed, stat.st_mode)
+            written["variants"] += 1
+    return written
+
+
+def _replace(path: Path, data: bytes, mode: int):
+    """Atomically write ``path``; workers precompressing at once each use their own temp file."""
+    fd, partial = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.chmod(partial, mode & 0o777)  # mkstemp creates it 0600
+        os.replace(partial, path)
+    except BaseException:
+        os.unlink(partial)
+        raise
+
+
+def _compressible_files(root: Path) -> Iterable[Path]:
+    for path in root.rglob("*"):
+        if path.is_file() and path.suffix.lower() in COMPRESSIBLE_SUFFIXES:
+            yield path
+
+
+class _DynamicGZipResponder(GZipResponder):
+    async def send_with_gzip(self, message):
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            await super().send_with_gzip(message)
+            if not COMPRESSIBLE_TYPES.match(content_type):
+                # Pass the body through untouched, as for an encoded response
+                self.content_encoding_set = True
+            return
+        await super().send_with_gzip(message)
+
+
+class DynamicGZipMiddleware(GZipMiddleware):
+    def __init__(self, app, minimum_size: int = 1000, compresslevel: int = 5,
+                 prefixes: Optional[Iterable[str]] = ("/api/",)):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.prefixes = tuple(prefixes) if prefixes else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (self.prefixes is None or scope["path"].startswith(self.prefixes)) \
+                and "gzip" in Headers(scope=scope).get("accept-encoding", ""):
+            responder = _DynamicGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
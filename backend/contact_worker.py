@@ -0,0 +1,332 @@
+"""Background processing of stored contact submissions.
+
+Contacts are stored with ``processed: False``; workers deliver each one to a
+sink (a notification email, a file, later a CRM) and mark it done.  Run one
+or more workers next to the API, on any number of hosts::
+
+    python contact_worker.py run [--sink smtp://relay:25?from=...&to=...]
+    python contact_worker.py report
+
+A worker claims contacts one ``find_one_and_update`` at a time: the update
+sets ``lease_owner`` and ``lease_until`` on a contact whose lease is absent or
+expired, so two workers can never hold the same contact.  A worker runs at
+most ``concurrency`` deliveries and only claims contacts for free delivery
+slots, so a lease starts with its delivery: ``lease_seconds`` must only
+outlast one delivery (the SMTP sink times out after 30 s).  Success sets
+``processed``; failure clears the owner and pushes ``lease_until`` out by an
+exponential backoff, which doubles as the retry schedule, until
+``max_attempts`` marks the contact ``failed``.  Completion only applies while
+the worker still owns the lease, so a worker that stalled past its lease
+cannot overwrite the one that took over.
+
+Delivery is at least once: a worker that dies after delivering but before
+marking the contact done leaves it to be delivered again when the lease
+expires.  Sinks receive the contact ``id`` to deduplicate on if they need to.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import signal
+import smtplib
+import socket
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from pathlib import Path
+from typing import List, Optional, Set
+from urllib.parse import parse_qs, unquote, urlparse
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+class FileSink:
+    """Appends each contact as a JSON line: the local stand-in for tests."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    async def deliver(self, contact: dict):
+        line = json.dumps(contact, default=str, ensure_ascii=False) + "\n"
+        await asyncio.to_thread(self._append, line)
+
+    def _append(self, line: str):
+        with open(self.path, "a", encoding="utf-8") as output:
+            output.write(line)
+
+
+class SmtpSink:
+    """Emails each contact to the team, through any SMTP relay."""
+
+    def __init__(self, host: str, port: int = 25, sender: str = "", recipients: List[str] = (),
+                 username: Optional[str] = None, password: Optional[str] = None,
+                 starttls: bool = False, timeout: float = 30.0):
+        if not sender or not recipients:
+            raise ValueError("SMTP sink needs a sender and at least one recipient")
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def message(self, contact: dict) -> EmailMessage:
+        message = EmailMessage()
+        message["Subject"] = f"Nouveau contact Webmatic : {contact['service']} ({contact['id'][:8]})"
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message["Reply-To"] = contact["email"]
+        message.set_content("\n".join([
+            f"Nom : {contact['name']}",
+            f"Email : {contact['email']}",
+            f"Téléphone : {contact.get('phone') or '-'}",
+            f"Service : {contact['service']}",
+            f"Reçu le : {contact['timestamp']} (UTC)",
+            f"Référence : {contact['id'][:8]}",
+            "",
+            contact["message"],
+        ]))
+        return message
+
+    async def deliver(self, contact: dict):
+        await asyncio.to_thread(self._send, self.message(contact))
+
+    def _send(self, message: EmailMessage):
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            smtp.send_message(message)
+
+
+def create_sink(url: str):
+    """``file:///path/to/file.ndjson`` or ``smtp://[user:pass@]host[:port]?from=...&to=a,b[&starttls=1]``."""
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return FileSink(unquote(parsed.netloc + parsed.path))
+    if parsed.scheme == "smtp":
+        query = parse_qs(parsed.query)
+        return SmtpSink(
+            parsed.hostname or "localhost",
+            parsed.port or 25,
+            sender=query.get("from", [""])[0],
+            recipients=[address for value in query.get("to", []) for address in value.split(",") if address],
+            username=unquote(parsed.username) if parsed.username else None,
+            password=unquote(parsed.password) if parsed.password else None,
+            starttls=query.get("starttls", ["0"])[0] in ("1", "true"),
+        )
+    raise ValueError(f"unknown contact sink: {url!r}")
+
+
+class ContactWorker:
+    def __init__(self, collection, sink, worker_id: Optional[str] = None, batch_size: int = 20,
+                 concurrency: int = 4, lease_seconds: float = 60.0, max_attempts: int = 5,
+                 backoff_base: float = 5.0, backoff_max: float = 900.0, poll_interval: float = 1.0,
+                 clock=datetime.utcnow):
+        self.collection = collection
+        self.sink = sink
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.batch_size = batch_size
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self.concurrency = concurrency
+        self._in_flight: Set[asyncio.Task] = set()
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.lost_leases = 0
+
+    async def setup(self):
+        # Only unprocessed contacts are indexed, so the index stays the size of the backlog
+        await self.collection.create_index(
+            [("timestamp", 1)], name="unprocessed_timestamp",
+            partialFilterExpression={"processed": False}
+        )
+
+    async def claim(self, limit: int) -> List[dict]:
+        """Lease up to ``limit`` ready contacts, oldest first."""
+        claimed = []
+        while len(claimed) < limit:
+            now = self._clock()
+            contact = await self.collection.find_one_and_update(
+                {
+                    "processed": False,
+                    "failed": {"$ne": True},
+                    "$or": [{"lease_until": None}, {"lease_until": {"$lte": now}}],
+                },
+                {"$set": {"lease_owner": self.worker_id, "lease_until": now + self.lease}},
+                sort=[("timestamp", 1)],
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER,
+            )
+            if contact is None:
+                break
+            claimed.append(contact)
+        return claimed
+
+    async def process(self, contact: dict):
+        try:
+            await self.sink.deliver(contact)
+        except Exception as e:
+            await self._retry(contact, e)
+            return
+        result = await self.collection.update_one(
+            {"id": contact["id"], "lease_owner": self.worker_id},
+            {"$set": {"processed": True, "processed_at": self._clock()},
+             "$unset": {"lease_owner": "", "lease_until": "", "last_error": ""}}
+        )
+        if result.modified_count:
+            self.delivered += 1
+        else:
+            self.lost_leases += 1
+            logger.warning(f"Contact {contact['id'][:8]} delivered after its lease was taken over")
+
+    async def _retry(self, contact: dict, error: Exception):
+        attempts = contact.get("attempts", 0) + 1
+        update = {"attempts": attempts, "last_error": f"{type(error).__name__}: {error}"}
+        if attempts >= self.max_attempts:
+            update["failed"] = True
+            self.failed += 1
+            logger.error(f"Contact {contact['id'][:8]} failed after {attempts} attempts: {str(error)}")
+        else:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+            update["lease_until"] = self._clock() + timedelta(seconds=delay * random.uniform(0.5, 1.0))
+            self.retried += 1
+            logger.warning(f"Contact {contact['id'][:8]} delivery failed (attempt {attempts}): {str(error)}")
+        await self.collection.update_one(
+            {"id": contact["id"], "lease_owner": self.worker_id},
+            {"$set": update, "$unset": {"lease_owner": ""}}
+        )
+
+    async def run_once(self) -> int:
+        """Claim contacts for the free delivery slots and start delivering them.
+
+        Returns the number of contacts claimed; ``drain`` waits for their deliveries.
+        """
+        free = min(self.batch_size, self.concurrency - len(self._in_flight))
+        contacts = await self.claim(free) if free > 0 else []
+        for contact in contacts:
+            task = asyncio.create_task(self._deliver(contact))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+        return len(contacts)
+
+    async def _deliver(self, contact: dict):
+        try:
+            await self.process(contact)
+        except Exception as e:
+            # Left leased: retried by any worker once the lease expires
+            logger.error(f"Contact {contact['id'][:8]} not updated: {str(e)}")
+
+    async def drain(self):
+        """Wait for the deliveries in flight."""
+        while self._in_flight:
+            await asyncio.wait(set(self._in_flight))
+
+    async def run(self, report_interval: float = 60.0):
+        started = reported_at = time.monotonic()
+        reported = 0
+        while not self._stopping:
+            try:
+                claimed = await self.run_once()
+            except Exception as e:
+                logger.error(f"Contact worker error: {str(e)}")
+                claimed = 0
+            if len(self._in_flight) >= self.concurrency:
+                # Claim again as soon as a delivery slot frees up
+                await asyncio.wait(set(self._in_flight), return_when=asyncio.FIRST_COMPLETED)
+            elif not claimed:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            now = time.monotonic()
+            if now - reported_at >= report_interval:
+                backlog = await self.backlog()
+                logger.info(
+                    f"Contact worker {self.worker_id}: {self.delivered} delivered "
+                    f"({(self.delivered - reported) / (now - reported_at):.1f}/s, "
+                    f"{self.delivered / (now - started):.1f}/s overall), {self.retried} retried, "
+                    f"{self.failed} failed, backlog {backlog['ready']} ready / {backlog['leased']} leased"
+                )
+                reported, reported_at = self.delivered, now
+        await self.drain()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    async def backlog(self) -> dict:
+        """Depth of the queue: ready, leased or waiting to retry, failed, oldest waiting."""
+        now = self._clock()
+        pending = {"processed": False, "failed": {"$ne": True}}
+        ready = await self.collection.count_documents(
+            {**pending, "$or": [{"lease_until": None}, {"lease_until": {"$lte": now}}]})
+        leased = await self.collection.count_documents({**pending, "lease_until": {"$gt": now}})
+        failed = await self.collection.count_documents({"processed": False, "failed": True})
+        oldest = await self.collection.find_one(pending, {"timestamp": 1}, sort=[("timestamp", 1)])
+        return {
+            "ready": ready,
+            "leased": leased,
+            "failed": failed,
+            "oldest_age_seconds": (now - oldest["timestamp"]).total_seconds() if oldest else 0.0,
+        }
+
+
+async def _main(argv):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Deliver stored contact submissions.")
+    parser.add_argument("command", choices=["run", "report"])
+    parser.add_argument("--sink", default=os.environ.get(
+        'CONTACT_SINK', f"file://{Path(__file__).parent / 'spool' / 'notifications.ndjson'}"))
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get('CONTACT_WORKER_CONCURRENCY', 4)))
+    parser.add_argument("--batch-size", type=int, default=int(os.environ.get('CONTACT_WORKER_BATCH', 20)))
+    parser.add_argument("--lease", type=float, default=float(os.environ.get('CONTACT_WORKER_LEASE', 60)))
+    parser.add_argument("--max-attempts", type=int, default=int(os.environ.get('CONTACT_WORKER_MAX_ATTEMPTS', 5)))
+    parser.add_argument("--report-interval", type=float, default=60.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    worker = ContactWorker(db.contacts, create_sink(args.sink), batch_size=args.batch_size,
+                           concurrency=args.concurrency, lease_seconds=args.lease,
+                           max_attempts=args.max_attempts)
+    try:
+        if args.command == "report":
+            backlog = await worker.backlog()
+            print(f"ready {backlog['ready']}  leased/retrying {backlog['leased']}  failed {backlog['failed']}  "
+                  f"oldest waiting {backlog['oldest_age_seconds']:.0f} s")
+            return
+        await worker.setup()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, worker.stop)
+        sink = urlparse(args.sink)
+        logger.info(f"Contact worker {worker.worker_id} delivering to {sink.scheme}://{sink.hostname or sink.path}")
+        await worker.run(report_interval=args.report_interval)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,301 @@
+"""Write-behind batching for contact submissions.
+
+Submissions are appended to an on-disk spool, queued in memory and written to
+MongoDB with ``insert_many`` once ``batch_size`` records are pending or every
+``flush_interval`` seconds.  The spool is split into segments: the active
+segment is sealed at each flush and deleted once all of its records are in
+MongoDB, so anything left on disk after a crash is replayed at startup.
+Replays are idempotent thanks to the unique index on ``id``.
+
+Several writers can share a spool directory (``uvicorn --workers N``).
+Each one owns the segments named after it, ``<host>.<pid>-<sequence>.ndjson``,
+for as long as it holds an exclusive ``flock`` on ``<host>.<pid>.lock``.
+At startup a writer takes over the segments of owners whose lock is free,
+that is of dead writers, by renaming them into its own name; the segments
+of live writers are left alone.
+
+Spool appends, fsyncs and seals run on one I/O thread per writer, so a
+slow disk does not stall the event loop.  Appends are group commits: the
+submissions that arrive while one write (and fsync) is in progress go to
+disk together in the next one, in submission order.
+"""
+import asyncio
+import fcntl
+import itertools
+import logging
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class ContactWriter:
+    def __init__(self, collection, spool_dir, batch_size: int = 100,
+                 flush_interval: float = 0.5, max_pending: int = 10000, fsync: bool = False,
+                 on_write=None):
+        self.collection = collection
+        self.on_write = on_write  # awaited with the records each insert_many stored
+        self.spool_dir = Path(spool_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+
+        # The active segment and its records belong to the I/O thread
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="contact-spool")
+        self._buffer: List[Tuple[str, dict, asyncio.Future]] = []  # submitted, not spooled yet
+        self._drain: Optional[asyncio.Task] = None
+        self._pending: List[dict] = []  # queued since the last flush, in the active segment
+        self._unflushed: List[dict] = []  # from sealed segments, waiting for a successful write
+        self._sealed: List[Path] = []
+        self._segment = None
+        self._segment_path: Optional[Path] = None
+        self._sequence = 0
+        self._owner: Optional[str] = None
+        self._lock: Optional[int] = None  # descriptor holding the flock on <owner>.lock
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def backlog(self) -> int:
+        return len(self._buffer) + len(self._pending) + len(self._unflushed)
+
+    async def start(self):
+        """Create indexes, replay the spool left by a previous run and start flushing."""
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            await self.collection.create_index("id", unique=True)
+        except Exception as e:
+            # Keep accepting submissions while MongoDB is unavailable.
+            logger.warning(f"Contact writer index warning: {str(e)}")
+
+        self._owner, self._lock = self._claim_owner()
+        leftovers = self._recover()
+        if leftovers:
+            for path in leftovers:
+                self._unflushed.extend(self._read_segment(path))
+            self._sealed.extend(leftovers)
+            logger.info(f"Replaying {len(self._unflushed)} spooled contacts from {len(leftovers)} segments")
+            await self.flush()
+
+        self._task = asyncio.create_task(self._run())
+
+    def _claim_owner(self) -> Tuple[str, int]:
+        base = f"{socket.gethostname()}.{os.getpid()}"
+        for attempt in itertools.count():
+            # Another PID namespace on the same volume can hold our name
+            owner = f"{base}.{attempt}" if attempt else base
+            lock = self._try_lock(self.spool_dir / f"{owner}.lock")
+            if lock is not None:
+                return owner, lock
+
+    @staticmethod
+    def _try_lock(path: Path) -> Optional[int]:
+        """Descriptor holding an exclusive flock on ``path``; None while a live writer holds it."""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # A writer taking over the owner may have unlinked the file meanwhile
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                return fd
+        except (BlockingIOError, FileNotFoundError):
+            pass
+        os.close(fd)
+        return None
+
+    def _recover(self) -> List[Path]:
+        """Our own leftover segments and those of dead owners, renamed to ours, oldest first."""
+        owners: Dict[str, List[Path]] = {path.stem: [] for path in self.spool_dir.glob("*.lock")}
+        for path in self.spool_dir.glob("*.ndjson"):
+            owner, _, sequence = path.stem.rpartition("-")
+            if sequence.isdigit():
+                owners.setdefault(owner, []).append(path)
+
+        # A previous run under the same name died: its segments are ours already
+        mine = sorted(owners.pop(self._owner, []), key=self._sequence_of)
+        if mine:
+            self._sequence = self._sequence_of(mine[-1]) + 1
+
+        for owner, paths in sorted(owners.items()):
+            lock_path = self.spool_dir / f"{owner}.lock"
+            lock = None
+            # Segments without a lock file predate locking: nobody owns them
+            if owner and lock_path.exists():
+                lock = self._try_lock(lock_path)
+                if lock is None:
+                    continue  # a live writer's segments
+            try:
+                for path in sorted(paths, key=self._sequence_of):
+                    target = self._next_segment_path()
+                    try:
+                        os.rename(path, target)  # atomic: only one writer takes a segment over
+                    except FileNotFoundError:
+                        continue
+                    mine.append(target)
+                if lock is not None:
+                    lock_path.unlink(missing_ok=True)
+            finally:
+                if lock is not None:
+                    os.close(lock)
+        return mine
+
+    @staticmethod
+    def _sequence_of(path: Path) -> int:
+        return int(path.stem.rpartition("-")[2])
+
+    def _next_segment_path(self) -> Path:
+        path = self.spool_dir / f"{self._owner}-{self._sequence:012d}.ndjson"
+        self._sequence += 1
+        return path
+
+    async def stop(self):
+        if self._task:
+            # Stop through a flag rather than cancel(): on Python < 3.12 a
+            # cancel racing the wait_for timeout can be swallowed.
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if self._drain:
+            await self._drain
+        await self.flush()
+        path, _ = await self._spool(self._seal)  # a submission that raced the last flush
+        if path is not None:
+            self._sealed.append(path)
+        self._io.shutdown()
+        if self._lock is not None:
+            if not self._sealed:
+                # Nothing left to replay: drop the owner name with the lock still held
+                (self.spool_dir / f"{self._owner}.lock").unlink(missing_ok=True)
+            os.close(self._lock)
+            self._lock = None
+
+    async def submit(self, record: dict):
+        """Durably accept ``record``; it reaches MongoDB on the next flush."""
+        if self.backlog >= self.max_pending:
+            raise RuntimeError("Contact write-behind queue is full")
+
+        spooled = asyncio.get_running_loop().create_future()
+        self._buffer.append((json_util.dumps(record) + "\n", record, spooled))
+        if self._drain is None or self._drain.done():
+            self._drain = asyncio.create_task(self._write_buffer())
+        if await spooled >= self.batch_size:
+            self._wakeup.set()
+
+    def _spool(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(self._io, function, *args)
+
+    async def _write_buffer(self):
+        while self._buffer:
+            batch, self._buffer = self._buffer, []
+            try:
+                pending = await self._spool(self._append, "".join(line for line, _, _ in batch),
+                                            [record for _, record, _ in batch])
+            except Exception as e:
+                for _, _, spooled in batch:
+                    if not spooled.done():
+                        spooled.set_exception(e)
+                continue
+            for _, _, spooled in batch:
+                if not spooled.done():  # the request may be gone; the record is spooled anyway
+                    spooled.set_result(pending)
+
+    def _append(self, lines: str, records: List[dict]) -> int:
+        """On the I/O thread: write ``records`` to the active segment."""
+        if self._segment is None:
+            self._segment_path = self._next_segment_path()
+            self._segment = open(self._segment_path, "a", encoding="utf-8")
+        self._segment.write(lines)
+        self._segment.flush()
+        if self.fsync:
+            os.fsync(self._segment.fileno())
+        # Queued only once spooled, in the segment they were written to
+        self._pending.extend(records)
+        return len(self._pending)
+
+    def _seal(self) -> Tuple[Optional[Path], List[dict]]:
+        """On the I/O thread: close the active segment; new submissions go to a fresh one."""
+        if self._segment is None:
+            return None, []
+        self._segment.close()
+        self._segment = None
+        records, self._pending = self._pending, []
+        return self._segment_path, records
+
+    async def flush(self):
+        async with self._flush_lock:
+            path, records = await self._spool(self._seal)
+            if path is not None:
+                self._sealed.append(path)
+                self._unflushed.extend(records)
+            if not self._unflushed:
+                return
+
+            try:
+                for start in range(0, len(self._unflushed), self.batch_size):
+                    written = await self._insert(self._unflushed[start:start + self.batch_size])
+                    await self._written(written)
+            except Exception as e:
+                # Records stay spooled and queued; the next flush retries them.
+                logger.error(f"Contact batch write error: {str(e)}")
+                return
+
+            self._unflushed = []
+            for path in self._sealed:
+                path.unlink(missing_ok=True)
+            self._sealed = []
+
+    async def _insert(self, records: List[dict]) -> List[dict]:
+        """Insert ``records`` and return those that were not already stored."""
+        # insert_many adds _id to the dicts; copies keep replays identical.
+        try:
+            await self.collection.insert_many([dict(record) for record in records], ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors) \
+                    or e.details.get("writeConcernErrors"):
+                raise
+            # Duplicates were already written before a crash or failed flush.
+            duplicates = {error["index"] for error in errors}
+            return [record for index, record in enumerate(records) if index not in duplicates]
+        return records
+
+    async def _written(self, records: List[dict]):
+        if not self.on_write or not records:
+            return
+        try:
+            await self.on_write(records)
+        except Exception as e:
+            # The contacts are stored; a failing hook must not re-queue them.
+            logger.warning(f"Contact write hook error: {str(e)}")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    @staticmethod
+    def _read_segment(path: Path) -> List[dict]:
+        records = []
+        with open(path, encoding="utf-8") as segment:
+            for line in segment:
+                try:
+                    records.append(json_util.loads(line))
+                except ValueError:
+                    # A torn final line from a crash mid-write was never acknowledged.
+                    logger.warning(f"Skipping corrupt spool line in {path.name}")
+        return records
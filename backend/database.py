@@ -0,0 +1,137 @@
+"""MongoDB client settings and per-endpoint database profiles.
+
+``client_options`` turns ``MONGO_*`` settings into AsyncIOMotorClient
+keyword arguments (``MONGO_MAX_POOL_SIZE`` is ``maxPoolSize``, and so on in
+``CLIENT_SETTINGS``): pool sizes, the wait queue and connection timeouts,
+wire compression.  Settings left unset keep the value given in
+``MONGO_URL`` or the driver default.
+
+A ``Profile`` is a write concern, read preference and read concern, parsed
+from a spec such as ``"w=1"`` or ``"read=secondaryPreferred,max_staleness=90"``
+(keys: ``w``, ``j``, ``wtimeout_ms``, ``read``, ``max_staleness``,
+``read_concern``).  ``DatabaseProfiles`` gives each named profile its own
+database handle on the one client, so endpoints share the connection pools
+but not the durability and routing settings.  Empty options inherit from
+the client (the URL, then the server defaults).
+"""
+from dataclasses import dataclass
+from typing import Callable, Dict, Mapping, Optional
+
+from pymongo import WriteConcern
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+CLIENT_SETTINGS = {
+    'MONGO_MAX_POOL_SIZE': ('maxPoolSize', int),
+    'MONGO_MIN_POOL_SIZE': ('minPoolSize', int),
+    'MONGO_MAX_CONNECTING': ('maxConnecting', int),
+    'MONGO_MAX_IDLE_TIME_MS': ('maxIdleTimeMS', int),
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': ('waitQueueTimeoutMS', int),
+    'MONGO_CONNECT_TIMEOUT_MS': ('connectTimeoutMS', int),
+    'MONGO_SOCKET_TIMEOUT_MS': ('socketTimeoutMS', int),
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': ('serverSelectionTimeoutMS', int),
+    'MONGO_COMPRESSORS': ('compressors', str),
+    'MONGO_ZLIB_COMPRESSION_LEVEL': ('zlibCompressionLevel', int),
+    'MONGO_APP_NAME': ('appname', str),
+}
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def client_options(environ: Mapping[str, str]) -> dict:
+    options = {}
+    for variable, (keyword, convert) in CLIENT_SETTINGS.items():
+        value = environ.get(variable, '').strip()
+        if value:
+            try:
+                options[keyword] = convert(value)
+            except ValueError:
+                raise ValueError(f"{variable}: invalid value {value!r}") from None
+    return options
+
+
+@dataclass(frozen=True)
+class Profile:
+    write_concern: Optional[WriteConcern] = None
+    read_preference: Optional[object] = None
+    read_concern: Optional[ReadConcern] = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "Profile":
+        """'w=1,j=false,read=secondaryPreferred,max_staleness=90' -> Profile"""
+        settings = {}
+        for item in spec.split(','):
+            key, _, value = item.partition('=')
+            if key.strip():
+                settings[key.strip()] = value.strip()
+        unknown = set(settings) - {"w", "j", "wtimeout_ms", "read", "max_staleness", "read_concern"}
+        if unknown:
+            raise ValueError(f"unknown profile setting(s) {', '.join(sorted(unknown))} in {spec!r}")
+
+        write = {}
+        if "w" in settings:
+            write["w"] = int(settings["w"]) if settings["w"].isdigit() else settings["w"]
+        if "j" in settings:
+            write["j"] = settings["j"].lower() == 'true'
+        if "wtimeout_ms" in settings:
+            write["wtimeout"] = int(settings["wtimeout_ms"])
+
+        read_preference = None
+        if "read" in settings:
+            mode = READ_PREFERENCES.get(settings["read"])
+            if mode is None:
+                raise ValueError(f"unknown read preference {settings['read']!r}")
+            if "max_staleness" in settings and mode is not Primary:
+                read_preference = mode(max_staleness=int(settings["max_staleness"]))
+            else:
+                read_preference = mode()
+
+        return cls(
+            write_concern=WriteConcern(**write) if write else None,
+            read_preference=read_preference,
+            read_concern=ReadConcern(settings["read_concern"]) if "read_concern" in settings else None,
+        )
+
+    def options(self) -> dict:
+        """get_database keyword arguments; unset ones inherit from the client."""
+        return {
+            "write_concern": self.write_concern,
+            "read_preference": self.read_preference,
+            "read_concern": self.read_concern,
+        }
+
+    def describe(self) -> dict:
+        return {
+            "write_concern": self.write_concern.document if self.write_concern else "default",
+            "read_preference": self.read_preference.document if self.read_preference else "default",
+            "read_concern": self.read_concern.level if self.read_concern else "default",
+        }
+
+
+class DatabaseProfiles:
+    """One database handle per named profile, all on the same client."""
+
+    def __init__(self, profiles: Dict[str, Profile], wrap: Optional[Callable] = None):
+        self.profiles = profiles
+        self.wrap = wrap or (lambda database: database)  # e.g. GuardedDatabase
+        self._databases = {}
+
+    def bind(self, client, name: str) -> "DatabaseProfiles":
+        """(Re)create the handles on ``client``'s database ``name``."""
+        self._databases = {
+            profile: self.wrap(client.get_database(name, **settings.options()))
+            for profile, settings in self.profiles.items()
+        }
+        return self
+
+    def __getitem__(self, profile: str):
+        return self._databases[profile]
+
+    def describe(self) -> dict:
+        return {profile: settings.describe() for profile, settings in self.profiles.items()}
@@ -0,0 +1,132 @@
+"""Deduplication of repeated contact submissions.
+
+A submission is identified by its ``Idempotency-Key`` header when the client
+sends one, otherwise by a SHA-256 of its normalized (email, service, message).
+The first request claims the key in ``contact_fingerprints`` (the key is the
+``_id``, so the claim is an atomic unique insert) with its reference.  The
+claim is *pending* until the caller has stored the contact and confirms it;
+only a confirmed claim answers later requests within ``ttl`` seconds with
+that reference, without a second write.  A pending claim makes a concurrent
+request fail with ``ClaimPending`` (the client retries), and one older than
+``pending_ttl`` seconds, left by a request whose write and release both
+failed, is free to take over: a contact is never reported as stored when it
+was not.  Recent confirmed keys are also held in a bounded in-process LRU,
+so a replay storm on one worker does not even reach MongoDB.
+"""
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class IdempotencyConflict(Exception):
+    """An Idempotency-Key was reused for a different submission."""
+
+
+class ClaimPending(Exception):
+    """The same submission is being stored by another request."""
+
+
+def contact_fingerprint(email: str, service: str, message: str) -> str:
+    normalized = "\x1f".join([
+        email.strip().lower(),
+        service.strip(),
+        _WHITESPACE.sub(" ", message).strip().casefold(),
+    ])
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class ContactDeduplicator:
+    def __init__(self, collection, ttl: int = 3600, pending_ttl: float = 30, max_entries: int = 10000,
+                 clock=time.monotonic):
+        self.collection = collection
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._cache: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+
+    async def setup(self):
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl)
+
+    @staticmethod
+    def key_for(fingerprint: str, idempotency_key: Optional[str]) -> str:
+        if idempotency_key:
+            return "key:" + hashlib.sha256(idempotency_key.encode("utf-8")).hexdigest()
+        return "content:" + fingerprint
+
+    async def claim(self, key: str, fingerprint: str, reference: str) -> Optional[str]:
+        """Claim ``key`` for a new submission.
+
+        Returns None when the caller should store the submission, then
+        ``confirm`` or ``release`` the claim, or the reference of the earlier,
+        stored submission with the same key.
+        """
+        cached = self._lookup(key)
+        if cached is None:
+            claim = {"fingerprint": fingerprint, "reference": reference, "pending": True}
+            try:
+                await self.collection.insert_one({"_id": key, **claim, "created_at": datetime.utcnow()})
+                return None
+            except DuplicateKeyError:
+                existing = await self.collection.find_one({"_id": key})
+                if existing is None:
+                    # Expired between the insert and the read: claim again.
+                    return await self.claim(key, fingerprint, reference)
+                age = (datetime.utcnow() - existing["created_at"]).total_seconds()
+                pending = existing.get("pending", False)
+                if age >= (self.pending_ttl if pending else self.ttl):
+                    # Expired but not yet removed (the TTL monitor runs about once a
+                    # minute), or abandoned while pending: take it over, unless
+                    # another request just did.
+                    result = await self.collection.replace_one(
+                        {"_id": key, "created_at": existing["created_at"]},
+                        {**claim, "created_at": datetime.utcnow()}
+                    )
+                    if result.matched_count == 0:
+                        return await self.claim(key, fingerprint, reference)
+                    return None
+                if existing["fingerprint"] != fingerprint:
+                    raise IdempotencyConflict(key)
+                if pending:
+                    raise ClaimPending(key)
+                cached = (existing["reference"], existing["fingerprint"])
+                self._remember(key, *cached, age=age)
+
+        existing_reference, existing_fingerprint = cached
+        if existing_fingerprint != fingerprint:
+            raise IdempotencyConflict(key)
+        return existing_reference
+
+    async def confirm(self, key: str, fingerprint: str, reference: str):
+        """Mark our claim on ``key`` as stored: from now on it answers duplicates."""
+        self._remember(key, reference, fingerprint)
+        await self.collection.update_one({"_id": key, "reference": reference}, {"$set": {"pending": False}})
+
+    async def release(self, key: str, reference: str):
+        """Forget our claim on a submission that could not be stored."""
+        self._cache.pop(key, None)
+        await self.collection.delete_one({"_id": key, "reference": reference})
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, str]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        reference, fingerprint, expires_at = entry
+        if expires_at <= self._clock():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return reference, fingerprint
+
+    def _remember(self, key: str, reference: str, fingerprint: str, age: float = 0.0):
+        self._cache[key] = (reference, fingerprint, self._clock() + self.ttl - age)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
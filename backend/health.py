@@ -0,0 +1,190 @@
+"""Dependency health probing for /health and /ready.
+
+A background task pings MongoDB every ``interval`` seconds and renders the
+result once into a JSON body, so health endpoints serve a cached snapshot
+and probe traffic does not depend on how often load balancers poll.
+Connection pool usage comes from PyMongo's CMAP events.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts connections and checkouts across the client's pools, and per server.
+
+    Events arrive on PyMongo's threads; the counters are plain integers
+    updated under the GIL and only read for reporting.  ``observer``, if
+    given, is called with each checkout's wait for a connection in seconds.
+    """
+
+    def __init__(self, observer=None):
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.checkout_failures = 0
+        self.pools_cleared = 0
+        self.checkouts = 0
+        self.checkout_wait = 0.0
+        self.options = {}
+        self.servers: Dict[str, dict] = {}
+        self.observer = observer
+
+    def snapshot(self) -> dict:
+        return {
+            "open": self.open,
+            "in_use": self.checked_out,
+            "available": max(self.open - self.checked_out, 0),
+            "waiting": self.waiting,
+            "checkout_failures": self.checkout_failures,
+            "pools_cleared": self.pools_cleared,
+            "checkouts": self.checkouts,
+            "mean_checkout_wait_ms": round(self.checkout_wait / self.checkouts * 1000, 3) if self.checkouts else None,
+            "options": dict(self.options),
+            "servers": {address: dict(counts) for address, counts in list(self.servers.items())},
+        }
+
+    def _server(self, event) -> dict:
+        address = "%s:%s" % event.address
+        counts = self.servers.get(address)
+        if counts is None:
+            counts = self.servers[address] = {"open": 0, "in_use": 0, "waiting": 0}
+        return counts
+
+    def pool_created(self, event):
+        self.options = event.options  # non-default settings, the same for every server
+        self._server(event)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        self.servers.pop("%s:%s" % event.address, None)
+
+    def connection_created(self, event):
+        self.open += 1
+        self._server(event)["open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.open -= 1
+        self._server(event)["open"] -= 1
+
+    def connection_check_out_started(self, event):
+        self.waiting += 1
+        self._server(event)["waiting"] += 1
+
+    def connection_check_out_failed(self, event):
+        self.waiting -= 1
+        self.checkout_failures += 1
+        self._server(event)["waiting"] -= 1
+
+    def connection_checked_out(self, event):
+        self.waiting -= 1
+        self.checked_out += 1
+        counts = self._server(event)
+        counts["waiting"] -= 1
+        counts["in_use"] += 1
+        duration = getattr(event, "duration", None)  # PyMongo 4.7+
+        if duration is not None:
+            self.checkouts += 1
+            self.checkout_wait += duration
+            if self.observer:
+                self.observer(duration)
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+        self._server(event)["in_use"] -= 1
+
+
+class HealthMonitor:
+    def __init__(self, client, pool: Optional[PoolMonitor] = None, interval: float = 5.0,
+                 timeout: float = 2.0, stale_after: float = 15.0, clock=time.monotonic, guard=None):
+        self.client = client
+        self.pool = pool
+        self.guard = guard  # resilience.DatabaseGuard: breaker state in the body
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self._clock = clock
+        self.probes = 0
+        self.latency_ms: Optional[float] = None
+        self.last_success: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self._last_success_at: Optional[float] = None
+        self._healthy = False
+        self._task: Optional[asyncio.Task] = None
+        self._render()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def probe(self):
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.client.admin.command("ping"), timeout=self.timeout)
+        except Exception as e:
+            self._healthy = False
+            self.last_error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            logger.warning(f"Database health probe failed: {self.last_error}")
+        else:
+            self._healthy = True
+            self.latency_ms = round((time.perf_counter() - start) * 1000, 3)
+            self.last_success = datetime.utcnow()
+            self._last_success_at = self._clock()
+        self.probes += 1
+        self._render()
+
+    @property
+    def ready(self) -> bool:
+        """The last probe succeeded and is recent enough to trust."""
+        return (self._healthy and self._last_success_at is not None
+                and self._clock() - self._last_success_at <= self.stale_after)
+
+    def body(self) -> bytes:
+        return self._body
+
+    def _render(self):
+        database = "connected" if self._healthy else ("unknown" if self.probes == 0 else "disconnected")
+        self._body = json.dumps({
+            "status": "healthy" if self._healthy else "degraded",
+            "timestamp": datetime.utcnow().isoformat(),
+            "services": {
+                "database": database,
+                "api": "running"
+            },
+            "database": {
+                "latency_ms": self.latency_ms,
+                "last_success": self.last_success.isoformat() if self.last_success else None,
+                "last_error": self.last_error,
+                "probes": self.probes,
+                "pool": self.pool.snapshot() if self.pool else None,
+                "circuit": self.guard.snapshot() if self.guard else None,
+            },
+        }).encode()
+
+    async def _run(self):
+        while True:
+            await self.probe()
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,246 @@
+"""Production entrypoint: preforked uvicorn workers behind one listening socket.
+
+    python launcher.py [serve] [--host 0.0.0.0] [--port 8001] [--workers N]
+                               [--graceful-timeout 30] [--ready-timeout 60]
+    python launcher.py migrate
+
+``serve`` binds the socket in this process (the leader), then:
+
+1. runs the migrations once, in a ``migrate`` subprocess so a reload picks up
+   new code: index creation and precompressing the frontend build
+   (``server.run_migrations``);
+2. starts ``--workers`` uvicorn workers (``WEB_CONCURRENCY``, else one per
+   CPU) with ``INDEX_SETUP`` and ``STATIC_PRECOMPRESS`` off, on uvloop and
+   httptools when they are installed;
+3. waits for each worker's startup report and logs its breakdown (imports,
+   MongoDB connection, frontend, background tasks) next to the time from
+   spawn to ready, so cold-start regressions show up in the deploy logs.
+
+Signals, as for uvicorn's supervisor:
+
+* ``SIGHUP``: graceful reload.  Migrations run again, then workers are
+  replaced one at a time: the new worker must report ready before the old
+  one gets ``SIGTERM`` and drains its requests.  A worker that does not come
+  up within ``--ready-timeout`` is killed and the old one kept.
+* ``SIGTTIN``/``SIGTTOU``: one worker more or less.
+* ``SIGINT``/``SIGTERM``: graceful shutdown.
+
+Each worker slot gets its own contact spool directory (``CONTACT_SPOOL_DIR``
+/``worker-<slot>``), alternating between two generations so an old worker and
+its replacement never share one; a crashed worker's spool is replayed by the
+next worker in that directory.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import uvicorn
+from uvicorn.supervisors.multiprocess import Multiprocess, Process
+
+ROOT_DIR = Path(__file__).parent
+logger = logging.getLogger("uvicorn.error")
+
+
+def best_loop() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def best_http() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def default_workers() -> int:
+    return int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+
+
+def run_migrations(timeout: float) -> bool:
+    """Run ``launcher.py migrate`` in a fresh interpreter; True if it succeeded."""
+    start = time.perf_counter()
+    try:
+        result = subprocess.run([sys.executable, str(Path(__file__).resolve()), "migrate"],
+                                cwd=ROOT_DIR, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.error("Migrations did not finish within %g s", timeout)
+        return False
+    if result.returncode != 0:
+        logger.error("Migrations failed with exit code %s", result.returncode)
+        return False
+    logger.info("Migrations done in %.3f s", time.perf_counter() - start)
+    return True
+
+
+def format_timings(timings: dict) -> str:
+    return ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in timings.items() if phase != "pid")
+
+
+class Supervisor(Multiprocess):
+    """uvicorn's supervisor with per-slot environments, readiness and rolling reloads."""
+
+    def __init__(self, config, target, sockets, report_dir: Path, spool_dir: Path,
+                 ready_timeout: float, migration_timeout: float):
+        super().__init__(config, target, sockets)
+        self.report_dir = report_dir
+        self.spool_dir = spool_dir
+        self.ready_timeout = ready_timeout
+        self.migration_timeout = migration_timeout
+        self.generations = {}  # slot -> spool generation of the worker running in it
+
+    def spawn(self, slot: int, generation: int = 0) -> Process:
+        # Spawned children copy the environment as it is when they start
+        os.environ['CONTACT_SPOOL_DIR'] = str(self.spool_dir / f"worker-{slot}" / str(generation))
+        process = Process(self.config, self.target, self.sockets)
+        process.start()
+        process.spawned = time.perf_counter()
+        self.generations[slot] = generation
+        return process
+
+    def wait_ready(self, process: Process) -> bool:
+        report = self.report_dir / f"startup-{process.pid}.json"
+        deadline = process.spawned + self.ready_timeout
+        while time.perf_counter() < deadline:
+            if report.exists():
+                timings = json.loads(report.read_bytes())
+                report.unlink(missing_ok=True)
+                logger.info("Worker [%s] ready in %.3f s (%s)", process.pid,
+                            time.perf_counter() - process.spawned, format_timings(timings))
+                return True
+            if not process.process.is_alive():
+                logger.error("Worker [%s] exited during startup", process.pid)
+                return False
+            time.sleep(0.05)
+        logger.error("Worker [%s] not ready after %g s", process.pid, self.ready_timeout)
+        return False
+
+    def init_processes(self):
+        self.processes = [self.spawn(slot) for slot in range(self.processes_num)]
+        for process in self.processes:
+            self.wait_ready(process)
+
+    def restart_all(self):
+        run_migrations(self.migration_timeout)
+        for slot, old in enumerate(self.processes):
+            if self.should_exit.is_set():
+                return
+            new = self.spawn(slot, 1 - self.generations[slot])
+            if not self.wait_ready(new):
+                new.kill()
+                new.join()
+                self.generations[slot] = 1 - self.generations[slot]
+                logger.error("Keeping worker [%s]", old.pid)
+                continue
+            self.processes[slot] = new
+            old.terminate()
+            old.join()
+
+    def keep_subprocess_alive(self):
+        if self.should_exit.is_set():
+            return
+        for slot, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            process.kill()
+            process.join()
+            if self.should_exit.is_set():
+                return
+            logger.info("Child process [%s] died", process.pid)
+            self.processes[slot] = self.spawn(slot, self.generations[slot])
+
+    def handle_ttin(self):
+        logger.info("Received SIGTTIN, increasing the number of processes.")
+        self.processes_num += 1
+        process = self.spawn(len(self.processes))
+        self.processes.append(process)
+        self.wait_ready(process)
+
+
+def check_rate_limit_lanes(workers: int):
+    """The shared rate limiter needs a lane per worker, plus one during a rolling restart."""
+    if os.environ.get('RATE_LIMIT_BACKEND') != 'shared':
+        return
+    from rate_limit import default_lanes
+    lanes = int(os.environ.get('RATE_LIMIT_SHM_LANES', default_lanes(workers)))
+    if lanes < workers + 1:
+        sys.exit(f"RATE_LIMIT_SHM_LANES={lanes} is too small for {workers} workers: "
+                 f"a rolling restart needs {workers + 1} lanes")
+
+
+def serve(args):
+    workers = max(1, args.workers)
+    check_rate_limit_lanes(workers)
+    # Workers size per-host resources (rate limit lanes) from it
+    os.environ['WEB_CONCURRENCY'] = str(workers)
+    config = uvicorn.Config(
+        "server:app", host=args.host, port=args.port, workers=workers,
+        loop=args.loop, http=args.http, timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    logger.info("Serving with %d workers, %s event loop, %s HTTP parser", workers, args.loop, args.http)
+
+    if not run_migrations(args.migration_timeout):
+        logger.warning("Starting the workers anyway")
+
+    report_dir = Path(tempfile.mkdtemp(prefix="webmatic-startup-"))
+    os.environ['STARTUP_REPORT_DIR'] = str(report_dir)
+    os.environ['INDEX_SETUP'] = 'false'
+    os.environ['STATIC_PRECOMPRESS'] = 'false'
+    spool_dir = Path(os.environ.get('CONTACT_SPOOL_DIR', str(ROOT_DIR / 'spool' / 'contacts')))
+    sock = config.bind_socket()
+    try:
+        Supervisor(config, uvicorn.Server(config=config).run, [sock], report_dir=report_dir,
+                   spool_dir=spool_dir, ready_timeout=args.ready_timeout,
+                   migration_timeout=args.migration_timeout).run()
+    finally:
+        sock.close()
+        shutil.rmtree(report_dir, ignore_errors=True)
+
+
+def migrate():
+    import server
+
+    async def run():
+        try:
+            await server.run_migrations()
+        finally:
+            server.client.close()
+
+    start = time.perf_counter()
+    try:
+        asyncio.run(run())
+    except Exception as e:
+        logger.error("Migrations failed: %s", e)
+        sys.exit(1)
+    print(f"migrate: imports {server.startup_timings['imports']:.3f}s, "
+          f"migrations {time.perf_counter() - start:.3f}s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=("serve", "migrate"), default="serve")
+    parser.add_argument("--host", default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument("--port", type=int, default=int(os.environ.get('PORT', 8001)))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--loop", choices=("uvloop", "asyncio"), default=best_loop())
+    parser.add_argument("--http", choices=("httptools", "h11"), default=best_http())
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.environ.get('GRACEFUL_TIMEOUT', 30)),
+                        help="seconds a stopping worker may take to drain its requests")
+    parser.add_argument("--ready-timeout", type=float, default=float(os.environ.get('READY_TIMEOUT', 60)),
+                        help="seconds a new worker may take to report ready")
+    parser.add_argument("--migration-timeout", type=float, default=float(os.environ.get('MIGRATION_TIMEOUT', 120)))
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate()
+    else:
+        serve(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Logging off the event loop: a bounded queue drained by a listener thread.
+
+``setup_logging`` installs a ``BoundedQueueHandler`` on the root logger (and,
+optionally, on uvicorn's loggers, which do not propagate).  Emitting a record
+only appends it to a queue: the message is not formatted, so
+``logger.info("... %s", value)`` defers the ``%`` interpolation, and the
+formatter and the stream write run on the listener thread.  A slow sink
+(disk, a pipe to a collector) then fills the queue instead of stalling
+requests.
+
+When the queue is full, new records are dropped.  With ``overflow="sample"``
+the handler starts thinning earlier: once the queue is three quarters full
+only one record in ``1 / sample_rate`` below WARNING is kept.  Drops are
+counted per level and reported by the listener as a warning, at most once
+per ``report_interval`` seconds, when the sink has caught up enough to take
+it.
+
+``LOG_FORMAT=json`` writes one JSON object per line: timestamp, level,
+logger, message, any ``extra={...}`` fields and the formatted exception.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came from extra={...}
+# (uvicorn adds an ANSI-coloured copy of its messages, not worth keeping)
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "color_message"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        document = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                document[key] = value
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            document["exception"] = record.exc_text
+        if record.stack_info:
+            document["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(document, default=str, ensure_ascii=False)
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, maxsize: int = 10000, overflow: str = "drop", sample_rate: float = 0.1):
+        if overflow not in ("drop", "sample"):
+            raise ValueError(f"overflow must be 'drop' or 'sample', got {overflow!r}")
+        super().__init__(queue.Queue(maxsize))
+        self.overflow = overflow
+        self.sample_every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.high_water = maxsize * 3 // 4
+        self.dropped = Counter()
+        self.sampled_out = 0
+        self._sample_counter = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock QueueHandler formats here, on the caller's thread. Leave
+        # msg and args alone so the listener does the work.
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.overflow == "sample" and record.levelno < logging.WARNING \
+                and self.queue.qsize() >= self.high_water:
+            self._sample_counter += 1
+            if not self.sample_every or self._sample_counter % self.sample_every:
+                self.sampled_out += 1
+                return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped[record.levelname] += 1
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": dict(self.dropped),
+            "sampled_out": self.sampled_out,
+        }
+
+
+class LogListener(logging.handlers.QueueListener):
+    """Writes queued records and reports what the handler had to drop."""
+
+    def __init__(self, handler: BoundedQueueHandler, *handlers, report_interval: float = 10.0):
+        super().__init__(handler.queue, *handlers, respect_handler_level=True)
+        self.source = handler
+        self.report_interval = report_interval
+        self._reported = (0, 0)
+        self._reported_at = 0.0
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # wait for room rather than raise Full
+
+    def handle(self, record: logging.LogRecord):
+        super().handle(record)
+        now = time.monotonic()
+        if now - self._reported_at >= self.report_interval:
+            self._reported_at = now
+            self.report()
+
+    def report(self):
+        dropped = sum(self.source.dropped.values())
+        sampled = self.source.sampled_out
+        previous_dropped, previous_sampled = self._reported
+        if (dropped, sampled) == self._reported:
+            return
+        self._reported = (dropped, sampled)
+        record = logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0,
+            "Logging backpressure: %d records dropped, %d sampled out since last report",
+            (dropped - previous_dropped, sampled - previous_sampled), None)
+        super().handle(record)
+
+    def stop(self):
+        super().stop()
+        self.report()
+
+
+_listener: Optional[LogListener] = None
+
+
+def setup_logging(level=logging.INFO, fmt: str = "text", queue_size: int = 10000, overflow: str = "drop",
+                  sample_rate: float = 0.1, stream=None, capture=("uvicorn", "uvicorn.error", "uvicorn.access")):
+    """Route the root logger (and ``capture`` loggers) through a queue; returns the handler."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    sink = logging.StreamHandler(stream or sys.stderr)
+    sink.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    handler = BoundedQueueHandler(queue_size, overflow=overflow, sample_rate=sample_rate)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name in capture:
+        captured = logging.getLogger(name)
+        captured.handlers = [handler]
+        captured.propagate = False
+
+    _listener = LogListener(handler, sink)
+    _listener.start()
+    return handler
+
+
+# At exit rather than on app shutdown: uvicorn still logs after the lifespan ends
+@atexit.register
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,275 @@
+"""Request and database metrics in Prometheus text format.
+
+Counters and fixed-bucket histograms record into per-thread shards: the
+event loop and each of Motor's driver threads only ever write to their own
+shard, so recording takes no lock and costs a thread-local lookup, a dict
+lookup and a couple of additions.  Shards are merged when ``/metrics`` is
+scraped.
+
+Label values must come from small, fixed sets (route templates, methods,
+status codes, collection names); requests that match no route are recorded
+under ``<unmatched>`` so scanners cannot grow the series count.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+from pymongo import monitoring
+
+# Seconds; suits both sub-millisecond handlers and slow Mongo commands
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, ...], list]] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict[Tuple[str, ...], list]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._shards_lock:  # once per thread
+                self._shards.append(shard)
+            return shard
+
+    def _merged(self) -> Dict[Tuple[str, ...], list]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged: Dict[Tuple[str, ...], list] = {}
+        for shard in shards:
+            for key, row in list(shard.items()):
+                total = merged.get(key)
+                if total is None:
+                    merged[key] = list(row)
+                else:
+                    for index, value in enumerate(row):
+                        total[index] += value
+        return merged
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        rows = self._merged()
+        if not rows and not self.labels:
+            rows = {(): self._empty_row()}
+        for key, row in sorted(rows.items()):
+            lines.extend(self._samples(key, row))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _empty_row(self):
+        return [0]
+
+    def inc(self, *labels: str, amount: float = 1):
+        shard = self._shard()
+        row = shard.get(labels)
+        if row is None:
+            shard[labels] = [amount]
+        else:
+            row[0] += amount
+
+    def _samples(self, key, row):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(row[0])}"]
+
+
+class Histogram(_Metric):
+    """Row layout: one count per bucket, the +Inf count, then the sum."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _empty_row(self):
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        row = shard.get(labels)
+        if row is None:
+            row = shard[labels] = self._empty_row()
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def _samples(self, key, row):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), row):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+        labels = _format_labels(self.labels, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(row[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Read at scrape time: ``function`` returns a number, or {label values: number}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), function=None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, function, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels, function))
+
+    def _register(self, metric):
+        if any(existing.name == metric.name for existing in self._metrics):
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class RequestMetrics:
+    """The HTTP-side instruments shared by the middlewares below."""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.requests = registry.counter(
+            "webmatic_http_requests_total", "HTTP requests by route and status.",
+            ("method", "route", "status"))
+        self.latency = registry.histogram(
+            "webmatic_http_request_duration_seconds", "Time from the outermost middleware to the last body chunk.",
+            ("method", "route"))
+        self.middleware = registry.histogram(
+            "webmatic_http_middleware_duration_seconds", "Request time spent in middleware rather than in the route.",
+            ("method", "route"))
+        self.rate_limited = registry.counter(
+            "webmatic_rate_limit_rejections_total", "Requests rejected with 429 by the rate limiter.")
+
+
+class MetricsMiddleware:
+    """Outermost middleware: counts requests and times the whole stack."""
+
+    def __init__(self, app, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            route = getattr(route, "path", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            self.metrics.requests.inc(method, route, str(status))
+            self.metrics.latency.observe(elapsed, method, route)
+            self.metrics.middleware.observe(elapsed - scope.get("metrics.handler_time", 0.0), method, route)
+
+
+class HandlerTimer:
+    """Innermost middleware: times the route itself for the middleware metric."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            scope["metrics.handler_time"] = time.perf_counter() - start
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Per-collection MongoDB command latency from PyMongo command events.
+
+    Succeeded events carry the duration but not the target, so the
+    collection is remembered from the started event, keyed by connection and
+    request id.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.latency = registry.histogram(
+            "webmatic_mongo_command_duration_seconds", "MongoDB command round trip time by collection.",
+            ("collection", "command"))
+        self.failures = registry.counter(
+            "webmatic_mongo_command_failures_total", "MongoDB commands that returned an error.",
+            ("collection", "command"))
+        self._pending: Dict[tuple, str] = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            target = event.command.get("collection", "")  # getMore
+        self._pending[(event.connection_id, event.request_id)] = target or event.database_name
+
+    def succeeded(self, event):
+        collection = self._pending.pop((event.connection_id, event.request_id), event.database_name)
+        self.latency.observe(event.duration_micros / 1e6, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._pending.pop((event.connection_id, event.request_id), event.database_name)
+        self.latency.observe(event.duration_micros / 1e6, collection, event.command_name)
+        self.failures.inc(collection, event.command_name)
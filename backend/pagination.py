@@ -0,0 +1,41 @@
+"""Keyset pagination helpers.
+
+Pages are ordered newest first on (``timestamp``, ``id``) and continue from
+an opaque cursor holding the last row's sort key, so every page costs one
+index seek whatever its depth, unlike ``skip``.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+SORT = [("timestamp", -1), ("id", -1)]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(document: dict) -> str:
+    key = [document["timestamp"].isoformat(), document["id"]]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, id_ = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(timestamp), str(id_)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def after_filter(cursor: Optional[str]) -> dict:
+    """Query selecting the rows that sort after ``cursor`` (all rows if None)."""
+    if not cursor:
+        return {}
+    timestamp, id_ = decode_cursor(cursor)
+    return {"$or": [
+        {"timestamp": {"$lt": timestamp}},
+        {"timestamp": timestamp, "id": {"$lt": id_}},
+    ]}
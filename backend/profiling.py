@@ -0,0 +1,272 @@
+"""On-demand request profiling: phase breakdowns, sampled stacks, slow requests.
+
+``ProfilingMiddleware`` sits just inside ``MetricsMiddleware`` and, while the
+profiler is active, follows each request through a ``RequestProfile`` in a
+context variable:
+
+* ``database``: awaited MongoDB operations, reported by ``DatabaseGuard``
+  through ``record_database`` (time and a per-operation list);
+* named phases such as ``validation``, recorded by functions decorated with
+  ``timed`` (the ``ContactForm`` validators);
+* ``handler``: the route's own time (``HandlerTimer``) minus the above;
+* ``middleware``: everything outside the route.
+
+A request slower than ``slow_threshold`` seconds is kept, with that
+breakdown, in a ring buffer of the last ``capacity`` profiles and logged.
+
+Stacks are sampled for a ``sample_rate`` fraction of requests, and for any
+request carrying ``X-Profile: <token>``.  While such requests are in flight
+a thread reads the event loop thread's stack every ``interval`` seconds and
+charges it to the request whose task is running, so time spent awaiting I/O
+is not sampled (it shows up under ``database``).  ``collapsed`` exports the
+samples as collapsed stacks (``frame;frame;frame count``) for flamegraph.pl,
+speedscope or inferno.
+
+The profiler is off when no threshold, sample rate or token is set: the
+middleware then checks one attribute and the hooks one context variable.
+Settings and profiles are per worker process.
+"""
+import asyncio
+import functools
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_DATABASE_OPERATIONS = 50
+MAX_STACK_DEPTH = 128
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    __slots__ = ("reason", "phases", "database", "database_calls", "database_operations", "stacks")
+
+    def __init__(self, reason: Optional[str]):
+        self.reason = reason  # "sampled", "requested" or None (kept only if slow)
+        self.phases: Dict[str, float] = {}
+        self.database = 0.0
+        self.database_calls = 0
+        self.database_operations = []
+        self.stacks: Optional[Counter] = Counter() if reason else None
+
+
+def timed(phase: str):
+    """Charge the decorated function's time to ``phase`` of the current profile."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.phases[phase] = profile.phases.get(phase, 0.0) + time.perf_counter() - start
+        return wrapper
+    return decorator
+
+
+def record_database(operation: str, duration: float):
+    """``DatabaseGuard`` observer: one awaited MongoDB operation."""
+    profile = _current.get()
+    if profile is None:
+        return
+    profile.database += duration
+    profile.database_calls += 1
+    if len(profile.database_operations) < MAX_DATABASE_OPERATIONS:
+        profile.database_operations.append((operation, duration))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def collapse(frame, root=None) -> str:
+    """'caller;callee;...' from ``root`` (the task's coroutine) down to ``frame``."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        if frame is root:
+            break
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Profiler:
+    def __init__(self, slow_threshold: float = 0.0, sample_rate: float = 0.0, token: Optional[str] = None,
+                 capacity: int = 200, interval: float = 0.005):
+        self.slow_threshold = slow_threshold  # seconds, 0 = off
+        self.sample_rate = sample_rate
+        self.token = token.encode("latin-1") if token else None
+        self.interval = interval
+        self.profiles = deque(maxlen=capacity)
+        self.captured = 0
+        self.active = False
+        self._update()
+
+        self._sampled: Dict[asyncio.Task, RequestProfile] = {}
+        self._loop = None
+        self._loop_thread = None
+        self._wakeup = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def configure(self, slow_threshold: Optional[float] = None, sample_rate: Optional[float] = None):
+        """Admin toggle; takes effect for the next request."""
+        if slow_threshold is not None:
+            self.slow_threshold = slow_threshold
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        self._update()
+
+    def _update(self):
+        self.active = bool(self.slow_threshold > 0 or self.sample_rate > 0 or self.token)
+
+    def settings(self) -> dict:
+        return {
+            "slow_threshold_ms": round(self.slow_threshold * 1000, 3),
+            "sample_rate": self.sample_rate,
+            "header": self.token is not None,
+            "capacity": self.profiles.maxlen,
+            "captured": self.captured,
+        }
+
+    def reason_for(self, scope) -> Optional[str]:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == b"x-profile":
+                    if hmac.compare_digest(value, self.token):
+                        return "requested"
+                    break
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    # Stack sampling
+
+    def start_sampling(self, profile: RequestProfile):
+        task = asyncio.current_task()
+        if task is None:
+            return
+        if self._sampler is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+            self._sampler.start()
+        self._sampled[task] = profile
+        self._wakeup.set()
+
+    def stop_sampling(self):
+        self._sampled.pop(asyncio.current_task(), None)
+        if not self._sampled:
+            self._wakeup.clear()
+
+    def _sample(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.interval)
+            task = asyncio.current_task(self._loop)
+            profile = self._sampled.get(task) if task is not None else None
+            if profile is None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                # The event loop's own frames sit below the task's coroutine
+                profile.stacks[collapse(frame, task.get_coro().cr_frame)] += 1
+
+    # Captured profiles
+
+    def finish(self, profile: RequestProfile, scope, status: int, duration: float):
+        if profile.reason is None and not (self.slow_threshold and duration >= self.slow_threshold):
+            return
+        route = getattr(scope.get("route"), "path", None) or scope["path"]
+        handler = scope.get("metrics.handler_time", 0.0)
+        phases = {name: seconds for name, seconds in profile.phases.items()}
+        breakdown = {
+            "middleware": duration - handler,
+            **phases,
+            "handler": max(0.0, handler - sum(phases.values()) - profile.database),
+            "database": profile.database,
+        }
+        self.captured += 1
+        record = {
+            "id": self.captured,
+            "time": datetime.utcnow().isoformat(),
+            "reason": profile.reason or "slow",
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": route,
+            "status": status,
+            "duration_ms": round(duration * 1000, 3),
+            "breakdown_ms": {name: round(seconds * 1000, 3) for name, seconds in breakdown.items()},
+            "database_calls": profile.database_calls,
+            "database_operations": [[operation, round(seconds * 1000, 3)]
+                                    for operation, seconds in profile.database_operations],
+            "samples": sum(profile.stacks.values()) if profile.stacks is not None else 0,
+            "stacks": dict(profile.stacks) if profile.stacks else {},
+        }
+        self.profiles.append(record)
+        if profile.reason is None:
+            logger.warning("Slow request %s %s: %.1f ms (%s)", scope["method"], route, duration * 1000,
+                           ", ".join(f"{name} {value:.1f} ms" for name, value in record["breakdown_ms"].items()))
+
+    def summaries(self) -> list:
+        return [{key: value for key, value in record.items() if key != "stacks"} for record in self.profiles]
+
+    def collapsed(self, ids: Optional[Iterable[int]] = None) -> str:
+        """Samples of the kept profiles as collapsed stacks, rooted at the route."""
+        wanted = set(ids) if ids is not None else None
+        stacks = Counter()
+        for record in self.profiles:
+            if wanted is not None and record["id"] not in wanted:
+                continue
+            root = f"{record['method']} {record['route']}"
+            for stack, count in record["stacks"].items():
+                stacks[f"{root};{stack}"] += count
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+class ProfilingMiddleware:
+    """Follows requests through a RequestProfile while the profiler is active."""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if scope["type"] != "http" or not profiler.active:
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(profiler.reason_for(scope))
+        token = _current.set(profile)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        if profile.reason:
+            profiler.start_sampling(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            if profile.reason:
+                profiler.stop_sampling()
+            _current.reset(token)
+            profiler.finish(profile, scope, status, duration)
@@ -0,0 +1,323 @@
+"""Rate limiting engine used by RateLimitMiddleware.
+
+Each client gets a sliding-window counter: the number of requests in the
+current fixed window plus a weighted share of the previous window.  Work per
+request is constant and every tracked client costs the same fixed amount of
+memory, whatever its request rate.  Idle clients are evicted in LRU order and
+the number of tracked clients is hard-capped.
+
+Three backends share that algorithm and are selected with RATE_LIMIT_BACKEND:
+
+* ``memory``: per-process state, limits are per worker.
+* ``shared``: an mmap'ed counter table shared by every worker on the host.
+* ``mongo``: time-bucketed documents in MongoDB, shared by every host.
+"""
+import asyncio
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+class _Window:
+    __slots__ = ("index", "previous", "current")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.previous = 0
+        self.current = 0
+
+
+class SlidingWindowLimiter:
+    """Sliding-window counter limiter with bounded, LRU-evicted state."""
+
+    def __init__(self, calls: int = 100, period: int = 60, max_clients: int = 100_000,
+                 clock=time.monotonic):
+        if calls < 1 or period <= 0 or max_clients < 1:
+            raise ValueError("calls, period and max_clients must be positive")
+        self.calls = calls
+        self.period = period
+        self.max_clients = max_clients
+        self._clock = clock
+        self._windows: "OrderedDict[str, _Window]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def hit(self, key: str) -> bool:
+        """Record a request for ``key``; return False if it is over the limit."""
+        now = self._clock()
+        index = int(now // self.period)
+        windows = self._windows
+
+        window = windows.get(key)
+        if window is None:
+            self._evict(index)
+            window = windows[key] = _Window(index)
+        else:
+            windows.move_to_end(key)
+            if window.index != index:
+                # One window later the current count becomes the previous one,
+                # anything older has fully expired.
+                window.previous = window.current if window.index == index - 1 else 0
+                window.current = 0
+                window.index = index
+
+        elapsed = (now % self.period) / self.period
+        if window.previous * (1.0 - elapsed) + window.current >= self.calls:
+            return False
+        window.current += 1
+        return True
+
+    def _evict(self, index: int):
+        """Drop idle clients from the LRU end, then enforce the hard cap."""
+        windows = self._windows
+        # Clients not seen for two windows carry no state worth keeping.  The
+        # dict is in LRU order, so the scan stops at the first live entry.
+        while windows:
+            oldest = next(iter(windows.values()))
+            if oldest.index >= index - 1:
+                break
+            windows.popitem(last=False)
+        while len(windows) >= self.max_clients:
+            windows.popitem(last=False)
+
+    def reset(self):
+        self._windows.clear()
+
+
+class MemoryRateLimitBackend:
+    """In-process backend: each worker enforces the limit on its own."""
+
+    def __init__(self, calls: int, period: int, max_clients: int = 100_000):
+        self.limiter = SlidingWindowLimiter(calls=calls, period=period, max_clients=max_clients)
+
+    async def setup(self):
+        pass
+
+    async def hit(self, key: str) -> bool:
+        return self.limiter.hit(key)
+
+
+def default_lanes(workers: int) -> int:
+    """Lanes for ``workers`` processes, with room for the replacements of a
+    rolling restart (the new worker starts before the old one exits) and a
+    few SIGTTIN workers."""
+    return max(16, workers + 4)
+
+
+class SharedMemoryRateLimitBackend:
+    """Host-wide backend backed by a counter table in a shared mmap file.
+
+    The table is a count-min sketch of ``depth`` rows by ``slots`` columns.
+    Every cell is split into one lane per worker process and a worker only
+    ever writes its own lane, so the hot path needs no locks: a request sums
+    the claimed lanes to get the host-wide count and increments its own.
+    Hash collisions can only over-count.  Workers racing on the same client
+    can each admit one request past the limit.  The file lock is only taken
+    when a worker claims its lane at startup.
+
+    A client is wrongly limited only when every one of its ``depth`` cells
+    is shared with other traffic that reaches the limit.  With ``h`` clients
+    at or over the limit in a window, that happens to a light client with a
+    probability of about ``(1 - exp(-h / slots)) ** depth``: with ``slots``
+    equal to the number of active clients and ``depth=2``, 1% of them over
+    the limit wrongly limits about 1 in 10,000 others, 10% about 1 in 100.
+    The table takes ``depth * slots * lanes * 12`` bytes (38 MB for 100,000
+    slots and 16 lanes), so size ``slots`` from ``RATE_LIMIT_MAX_CLIENTS``.
+    """
+
+    MAGIC = b"WMRL"
+    HEADER = struct.Struct("=4sIIII")  # magic, depth, slots, lanes, period
+    CELL_WORDS = 3  # window index, current count, previous count
+
+    def __init__(self, calls: int, period: int, path: Optional[str] = None,
+                 slots: int = 16384, lanes: int = 16, depth: int = 2, clock=time.time):
+        self.calls = calls
+        self.period = period
+        self.slots = slots
+        self.lanes = lanes
+        self.depth = depth
+        self._clock = clock
+        self.path = Path(path or self.default_path())
+
+        self._lane_stride = lanes * self.CELL_WORDS
+        self._columns = struct.Struct(f"={depth}I")
+        # Header, number of lanes ever claimed, then the owner pid of each lane.
+        self._used_word = (self.HEADER.size + 3) // 4
+        self._header_words = self._used_word + 1 + lanes
+        size = (self._header_words + depth * slots * self._lane_stride) * 4
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                self._map = self._open_table(fd, size)
+                self._words = memoryview(self._map).cast("I")
+                self.lane = self._claim_lane()
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def default_path() -> str:
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        return os.path.join(base, "webmatic-rate-limit")
+
+    def _open_table(self, fd: int, size: int) -> mmap.mmap:
+        header = self.HEADER.pack(self.MAGIC, self.depth, self.slots, self.lanes, self.period)
+        if os.fstat(fd).st_size != size or os.pread(fd, self.HEADER.size, 0) != header:
+            # New file or different geometry: start from an empty table.
+            os.ftruncate(fd, 0)
+            os.ftruncate(fd, size)
+            os.pwrite(fd, header, 0)
+        return mmap.mmap(fd, size)
+
+    def _claim_lane(self) -> int:
+        pids = self._words[self._header_words - self.lanes:self._header_words]
+        pid = os.getpid()
+        for lane in range(self.lanes):
+            owner = pids[lane]
+            if owner == 0 or owner == pid or not _pid_alive(owner):
+                pids[lane] = pid
+                self._words[self._used_word] = max(self._words[self._used_word], lane + 1)
+                return lane
+        raise RuntimeError(f"No free rate limit lane in {self.path}: all {self.lanes} lanes belong to live "
+                           f"workers; RATE_LIMIT_SHM_LANES must exceed the number of workers")
+
+    def _cells(self, key: str):
+        """Offsets of the cells ``key`` hashes to, one per sketch row."""
+        digest = hashlib.blake2b(key.encode(), digest_size=self._columns.size).digest()
+        slots, stride, first = self.slots, self._lane_stride, self._header_words
+        return [
+            first + (row * slots + column % slots) * stride
+            for row, column in enumerate(self._columns.unpack(digest))
+        ]
+
+    async def setup(self):
+        pass
+
+    async def hit(self, key: str) -> bool:
+        now = self._clock()
+        index = int(now // self.period)
+        weight = 1.0 - (now % self.period) / self.period
+        words = self._words
+        own = self.lane * self.CELL_WORDS
+
+        estimate = None
+        cells = self._cells(key)
+        # Only lanes claimed so far can hold counts.
+        stride = words[self._used_word] * self.CELL_WORDS
+        for base in cells:
+            lanes = words[base:base + stride].tolist()
+            current = previous = 0
+            for window, count, older in zip(lanes[0::3], lanes[1::3], lanes[2::3]):
+                if window == index:
+                    current += count
+                    previous += older
+                elif window == index - 1:
+                    previous += count
+            row_estimate = previous * weight + current
+            if estimate is None or row_estimate < estimate:
+                estimate = row_estimate
+
+        if estimate >= self.calls:
+            return False
+
+        for base in cells:
+            cell = base + own
+            window = words[cell]
+            if window != index:
+                words[cell + 2] = words[cell + 1] if window == index - 1 else 0
+                words[cell + 1] = 0
+                words[cell] = index
+            words[cell + 1] += 1
+        return True
+
+    def close(self):
+        self._words.release()
+        self._map.close()
+
+
+class MongoRateLimitBackend:
+    """Cluster-wide backend storing one counter document per client and window.
+
+    Counters are bumped with an atomic ``$inc`` upsert and expire through a
+    TTL index once they can no longer contribute to the sliding window.
+    """
+
+    def __init__(self, collection, calls: int, period: int, clock=time.time):
+        self.collection = collection
+        self.calls = calls
+        self.period = period
+        self._clock = clock
+
+    async def setup(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def hit(self, key: str) -> bool:
+        now = self._clock()
+        index = int(now // self.period)
+        weight = 1.0 - (now % self.period) / self.period
+        current_id = f"{key}:{index}"
+        try:
+            current, previous = await asyncio.gather(
+                self.collection.find_one_and_update(
+                    {"_id": current_id},
+                    {
+                        "$inc": {"count": 1},
+                        "$setOnInsert": {
+                            "expires_at": datetime.utcfromtimestamp((index + 2) * self.period)
+                        },
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                ),
+                self.collection.find_one({"_id": f"{key}:{index - 1}"}),
+            )
+            previous_count = previous["count"] if previous else 0
+            if previous_count * weight + current["count"] - 1 >= self.calls:
+                # Rejected requests do not count against the client.
+                await self.collection.update_one({"_id": current_id}, {"$inc": {"count": -1}})
+                return False
+        except Exception as e:
+            # Never turn a database hiccup into an outage: fail open.
+            logger.warning(f"Rate limit backend error: {str(e)}")
+        return True
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def create_rate_limit_backend(name: str, calls: int, period: int, max_clients: int = 100_000,
+                              collection=None, **options):
+    """Build the backend selected by ``RATE_LIMIT_BACKEND``."""
+    if name == "memory":
+        return MemoryRateLimitBackend(calls, period, max_clients)
+    if name == "shared":
+        return SharedMemoryRateLimitBackend(calls, period, **options)
+    if name == "mongo":
+        if collection is None:
+            raise ValueError("The mongo rate limit backend needs a collection")
+        return MongoRateLimitBackend(collection, calls, period)
+    raise ValueError(f"Unknown rate limit backend: {name}")
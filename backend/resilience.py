@@ -0,0 +1,303 @@
+"""Deadlines, load shedding and a circuit breaker for MongoDB operations.
+
+``GuardedDatabase`` wraps a Motor database.  Every awaited collection
+operation (``insert_one``, ``find_one_and_update``, ``bulk_write``,
+``find(...).to_list``, ``aggregate(...).to_list``...) goes through ``DatabaseGuard.run``:
+
+1. The circuit breaker is checked.  While it is open, calls fail at once.
+2. A slot is taken from the concurrency limiter: at most ``max_concurrent``
+   operations in flight, ``max_waiting`` more queued.  A full queue rejects
+   the call instead of letting requests pile up.
+3. The operation runs under a deadline (``timeout``, per method overrides in
+   ``timeouts``).  ``asyncio.wait_for`` abandons it client-side; Motor's
+   thread finishes it in the background.
+
+Every rejection raises a ``DatabaseUnavailable`` subclass with a
+``retry_after`` hint, which the API turns into 503 + ``Retry-After``.
+
+The breaker looks at the last ``window`` calls.  It opens once at least
+``min_calls`` are recorded and either the share that failed (deadline,
+connection or server selection errors; not duplicate keys or validation)
+reaches ``failure_rate``, or the share slower than ``slow_call`` seconds
+reaches ``slow_rate``.  After ``open_seconds`` it goes half-open and lets
+``half_open_calls`` probe calls through: all succeeding closes it, any
+failing reopens it.
+
+Cursor iteration (``async for``) is not guarded, so a streaming export that
+has started is never cut off midway; index and admin commands pass straight
+through as well.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, WTimeoutError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Errors that say something about the database's health
+INFRASTRUCTURE_ERRORS = (ConnectionFailure, ExecutionTimeout, WTimeoutError, asyncio.TimeoutError)
+
+GUARDED_METHODS = frozenset((
+    "insert_one", "insert_many", "find_one", "find_one_and_update", "find_one_and_delete",
+    "update_one", "update_many", "replace_one", "delete_one", "delete_many", "bulk_write",
+    "count_documents", "estimated_document_count", "distinct",
+))
+
+
+class DatabaseUnavailable(Exception):
+    reason = "unavailable"
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class CircuitOpen(DatabaseUnavailable):
+    reason = "circuit_open"
+
+
+class DatabaseOverloaded(DatabaseUnavailable):
+    reason = "overloaded"
+
+
+class DatabaseTimeout(DatabaseUnavailable):
+    reason = "timeout"
+
+
+class CircuitBreaker:
+    def __init__(self, window: int = 50, min_calls: int = 20, failure_rate: float = 0.5,
+                 slow_call: float = 1.0, slow_rate: float = 0.8, open_seconds: float = 10.0,
+                 half_open_calls: int = 3, clock=time.monotonic):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._outcomes = deque(maxlen=window)  # (failed, slow)
+        self.state = CLOSED
+        self.opened = 0
+        self._open_until = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go ahead now."""
+        if self.state == OPEN:
+            remaining = self._open_until - self._clock()
+            if remaining > 0:
+                raise CircuitOpen("Database circuit open", retry_after=remaining)
+            self.state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                raise CircuitOpen("Database circuit half-open, probes in flight", retry_after=1)
+            self._probes += 1
+
+    def cancel(self):
+        """A call let through by ``before_call`` did not run after all."""
+        if self.state == HALF_OPEN and self._probes:
+            self._probes -= 1
+
+    def record(self, failed: bool, duration: float):
+        slow = duration >= self.slow_call
+        if self.state == HALF_OPEN:
+            if failed or slow:
+                self._trip()
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+            return
+        if self.state == OPEN:
+            return  # a call that started before the breaker opened
+        self._outcomes.append((failed, slow))
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow_calls = sum(1 for _, slow in self._outcomes if slow)
+        if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_rate:
+            self._trip()
+
+    def _trip(self):
+        self.state = OPEN
+        self.opened += 1
+        self._open_until = self._clock() + self.open_seconds
+        self._outcomes.clear()
+
+    def snapshot(self) -> dict:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "opened": self.opened,
+            "window_calls": calls,
+            "window_failures": sum(1 for failed, _ in self._outcomes if failed),
+            "window_slow": sum(1 for _, slow in self._outcomes if slow),
+        }
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_concurrent: int = 50, max_waiting: int = 200):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.waiting = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self.max_concurrent - self._semaphore._value
+
+    async def acquire(self, timeout: float):
+        if self._semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                raise DatabaseOverloaded("Too many database operations queued")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise DatabaseOverloaded("Timed out waiting for a database slot") from None
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+    def release(self):
+        self._semaphore.release()
+
+
+class DatabaseGuard:
+    def __init__(self, breaker: CircuitBreaker, limiter: ConcurrencyLimiter, timeout: float = 2.0,
+                 timeouts: Optional[Dict[str, float]] = None, on_reject=None, observer=None):
+        self.breaker = breaker
+        self.limiter = limiter
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.on_reject = on_reject  # called with the rejection reason
+        self.observer = observer  # called with (operation, seconds) after each admitted call
+        self.rejected: Dict[str, int] = {}
+
+    async def run(self, operation: str, function, *args, **kwargs):
+        """Call ``function`` once admitted and await it under a deadline.
+
+        Motor starts an operation as soon as its method is called, so the
+        call itself is deferred until the breaker and the limiter allow it.
+        """
+        timeout = self.timeouts.get(operation, self.timeout)
+        try:
+            self.breaker.before_call()
+            try:
+                await self.limiter.acquire(timeout)
+            except (DatabaseUnavailable, asyncio.CancelledError):
+                self.breaker.cancel()
+                raise
+        except DatabaseUnavailable as e:
+            self._rejected(e.reason)
+            raise
+
+        start = time.perf_counter()
+        failed = True
+        cancelled = False
+        try:
+            result = await asyncio.wait_for(function(*args, **kwargs), timeout)
+            failed = False
+            return result
+        except asyncio.CancelledError:
+            cancelled = True  # the caller went away (client disconnect, handler timeout)
+            raise
+        except asyncio.TimeoutError:
+            self._rejected(DatabaseTimeout.reason)
+            raise DatabaseTimeout(f"Database operation {operation} exceeded {timeout:g} s") from None
+        except INFRASTRUCTURE_ERRORS:
+            raise
+        except Exception:
+            failed = False  # the database answered: duplicate key, validation...
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.limiter.release()
+            if cancelled:
+                # Says nothing about the database: neither a failure nor a success
+                self.breaker.cancel()
+            else:
+                self.breaker.record(failed, duration)
+            if self.observer:
+                self.observer(operation, duration)
+
+    def _rejected(self, reason: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        if self.on_reject:
+            self.on_reject(reason)
+
+    def snapshot(self) -> dict:
+        return {
+            **self.breaker.snapshot(),
+            "in_flight": self.limiter.in_flight,
+            "waiting": self.limiter.waiting,
+            "rejected": dict(self.rejected),
+        }
+
+
+class GuardedCursor:
+    def __init__(self, cursor, guard: DatabaseGuard, operation: str):
+        self._cursor = cursor
+        self._guard = guard
+        self._operation = operation
+
+    def __getattr__(self, name):
+        attribute = getattr(self._cursor, name)
+        if not callable(attribute):
+            return attribute
+
+        def chained(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            return self if result is self._cursor else result
+        return chained
+
+    async def to_list(self, length=None):
+        return await self._guard.run(self._operation, self._cursor.to_list, length)
+
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+
+class GuardedCollection:
+    def __init__(self, collection, guard: DatabaseGuard):
+        self._collection = collection
+        self._guard = guard
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name in ("find", "aggregate"):
+            return lambda *args, **kwargs: GuardedCursor(attribute(*args, **kwargs), self._guard, name)
+        if name not in GUARDED_METHODS:
+            return attribute
+        return lambda *args, **kwargs: self._guard.run(name, attribute, *args, **kwargs)
+
+
+class GuardedDatabase:
+    def __init__(self, database, guard: DatabaseGuard):
+        self._database = database
+        self._guard = guard
+        self._collections: Dict[str, GuardedCollection] = {}
+
+    def __getitem__(self, name: str) -> GuardedCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = GuardedCollection(self._database[name], self._guard)
+        return collection
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if hasattr(type(self._database), name):
+            return getattr(self._database, name)  # command(), name, client...
+        return self[name]
@@ -0,0 +1,251 @@
+"""In-memory cache of rendered GET responses, with ETags and early 304s.
+
+Routes opt in with the ``cache_response`` decorator, placed under the route
+decorator, which sets their TTL::
+
+    @api_router.get("/analytics/summary")
+    @cache_response(ttl=5, authenticated=True)
+    async def get_analytics_summary(...): ...
+
+``ResponseCacheMiddleware`` sits just outside GZipMiddleware.  On a miss the
+request runs normally and a 200 response is stored twice: identity and gzip
+(compressed once, or taken from GZipMiddleware's output).  Hits are served
+straight from memory, so the handler, gzip and inner middleware never run.
+A request whose ``If-None-Match`` matches gets a 304 with no body.
+
+Entries carry a strong ETag (a digest of the identity body, suffixed for the
+gzip variant) and ``Cache-Control: max-age`` matching the TTL, ``private``
+for authenticated routes.  Those routes are only served from cache after the
+``authenticate`` callback accepts the request; otherwise the request goes to
+the handler, which answers 401.
+
+Writes call ``invalidate(path)``.  Every path has a generation counter that
+invalidation bumps, and a response rendered before the write is not stored
+afterwards, so nothing cached predates the write it raced with.  The cache
+belongs to one worker process: other workers serve their copy until its TTL
+ends, so TTLs are kept to a few seconds on data that changes.
+"""
+import gzip
+import hashlib
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers
+
+# Headers recomputed for each variant instead of being stored
+_VARIANT_HEADERS = {b"content-length", b"content-encoding", b"vary", b"etag", b"cache-control"}
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    ttl: float
+    params: FrozenSet[str] = frozenset()
+    authenticated: bool = False
+
+
+def cache_response(ttl: float, params=(), authenticated: bool = False):
+    """Cache this GET route for ``ttl`` seconds.
+
+    Requests whose query string holds anything outside ``params`` bypass the
+    cache; ``authenticated`` routes are checked with the cache's callback.
+    """
+    def decorate(endpoint):
+        endpoint.__response_cache__ = CachePolicy(ttl, frozenset(params), authenticated)
+        return endpoint
+    return decorate
+
+
+@dataclass
+class _Entry:
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    identity: bytes
+    compressed: Optional[bytes]
+    etag: bytes
+    expires_at: float
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 256, max_body: int = 1 << 20, minimum_gzip_size: int = 1000,
+                 authenticate: Optional[Callable[[Headers], bool]] = None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_body = max_body
+        self.minimum_gzip_size = minimum_gzip_size
+        self.authenticate = authenticate
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._generations: Dict[str, int] = defaultdict(int)
+        self._routes: Optional[Dict[str, tuple]] = None
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def invalidate(self, path: str):
+        """Drop every cached response for ``path`` and any render in flight."""
+        self._generations[path] += 1
+        for key in [key for key in self._entries if key[0] == path]:
+            del self._entries[key]
+
+    def clear(self):
+        for path in list(self._generations):
+            self._generations[path] += 1
+        self._entries.clear()
+
+    def routes(self, app) -> Dict[str, tuple]:
+        """Map path -> (route, policy) for the decorated GET routes of ``app``."""
+        if self._routes is None:
+            routes = {}
+            for route in getattr(app, "routes", ()):
+                policy = getattr(getattr(route, "endpoint", None), "__response_cache__", None)
+                if policy and "GET" in getattr(route, "methods", ()) and not route.param_convertors:
+                    routes[route.path] = (route, policy)
+            self._routes = routes
+        return self._routes
+
+    def lookup(self, key) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def store(self, key, generation: int, policy: CachePolicy, status: int,
+              headers: List[Tuple[bytes, bytes]], body: bytes) -> Optional[_Entry]:
+        if self._generations[key[0]] != generation:
+            return None  # invalidated while rendering
+
+        encoding = Headers(raw=headers).get("content-encoding", "")
+        if encoding == "gzip":
+            compressed, identity = body, gzip.decompress(body)
+        elif encoding:
+            return None
+        else:
+            identity = body
+            compressed = gzip.compress(body, compresslevel=9) if len(body) >= self.minimum_gzip_size else None
+
+        digest = hashlib.blake2b(identity, digest_size=16).hexdigest()
+        control = f"{'private' if policy.authenticated else 'public'}, max-age={int(policy.ttl)}"
+        kept = [(name, value) for name, value in headers if name.lower() not in _VARIANT_HEADERS]
+        kept.append((b"cache-control", control.encode("latin-1")))
+        entry = _Entry(status, kept, identity, compressed, f'"{digest}"'.encode("latin-1"),
+                       self._clock() + policy.ttl)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+
+def _matches(if_none_match: str, entry: _Entry) -> bool:
+    if not if_none_match:
+        return False
+    etag = entry.etag.decode("latin-1")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        # Either variant's tag names the same version of the resource
+        if candidate == "*" or candidate == etag or candidate == etag[:-1] + '-gzip"':
+            return True
+    return False
+
+
+async def _send_entry(entry: _Entry, request_headers: Headers, send):
+    use_gzip = entry.compressed is not None and "gzip" in request_headers.get("accept-encoding", "")
+    etag = entry.etag[:-1] + b'-gzip"' if use_gzip else entry.etag
+    headers = list(entry.headers)
+    headers.append((b"etag", etag))
+    if entry.compressed is not None:
+        headers.append((b"vary", b"Accept-Encoding"))
+
+    if _matches(request_headers.get("if-none-match", ""), entry):
+        headers = [(name, value) for name, value in headers if name.lower() != b"content-type"]
+        await send({"type": "http.response.start", "status": 304, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+        return True
+
+    body = entry.compressed if use_gzip else entry.identity
+    if use_gzip:
+        headers.append((b"content-encoding", b"gzip"))
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+    return False
+
+
+class ResponseCacheMiddleware:
+    def __init__(self, app, cache: ResponseCache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        route_policy = self.cache.routes(scope.get("app")).get(scope["path"])
+        if route_policy is None:
+            return await self.app(scope, receive, send)
+
+        route, policy = route_policy
+        query = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+        if any(name not in policy.params for name, _ in query):
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        if policy.authenticated and not (self.cache.authenticate and self.cache.authenticate(headers)):
+            return await self.app(scope, receive, send)
+
+        key = (scope["path"], urlencode(sorted(query)))
+        entry = self.cache.lookup(key)
+        if entry is not None:
+            self.cache.hits += 1
+            scope["route"] = route  # for request metrics
+            if await _send_entry(entry, headers, send):
+                self.cache.not_modified += 1
+            return
+
+        self.cache.misses += 1
+        await self._render(scope, receive, send, key, policy, headers)
+
+    async def _render(self, scope, receive, send, key, policy, request_headers):
+        """Run the app, storing the response if it is a cacheable 200."""
+        generation = self.cache._generations[key[0]]
+        start = None
+        chunks = []
+        size = 0
+        passthrough = False
+
+        async def capture(message):
+            nonlocal start, size, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start = message
+                if message["status"] != 200:
+                    passthrough = True
+                    await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > self.cache.max_body:
+                passthrough = True
+                await send(start)
+                await send({"type": "http.response.body", "body": b"".join(chunks),
+                            "more_body": message.get("more_body", False)})
+
+        await self.app(scope, receive, capture)
+        if passthrough or start is None:
+            return
+
+        body = b"".join(chunks)
+        entry = self.cache.store(key, generation, policy, start["status"], list(start.get("headers", ())), body)
+        if entry is None:
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+        if await _send_entry(entry, request_headers, send):
+            self.cache.not_modified += 1
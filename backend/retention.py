@@ -0,0 +1,254 @@
+"""Retention for ``contacts`` and ``status_checks``: archive, then delete.
+
+Each collection has a retention period in days (0 keeps everything).  Two
+modes:
+
+* ``archive``: a background pass, every ``interval`` seconds, reads the
+  oldest expired documents ``batch_size`` at a time, writes each batch to
+  gzip-compressed NDJSON under ``archive_dir/<collection>/YYYY/MM/DD/`` (by
+  the document's own day) and only then deletes exactly those ``_id``\\ s.
+  Memory is bounded by the batch, whatever the backlog.
+* ``ttl``: a TTL index on the timestamp lets MongoDB delete expired
+  documents itself, with no archive.
+
+Archive files are written under a temporary name and renamed once complete,
+so a crash leaves no half-written file behind; documents whose batch was
+archived but not yet deleted are archived again on the next pass, so after
+a crash a document can appear in two files.  With several API workers only
+the holder of a lease in ``retention_locks`` runs the pass.
+
+``on_delete`` is awaited with each batch actually deleted, so derived data
+(the contact rollups) can be kept in step.  MongoDB's TTL monitor deletes
+without telling anyone, so ``ttl`` mode is refused for a collection whose
+policy sets ``ttl=False``.
+
+``export`` streams a collection back out as NDJSON for a range of days:
+archive files first, decompressed chunk by chunk, then the live documents
+through a batched cursor.  It only reads the archives under this host's
+``archive_dir``: a pass run by a worker on another host archived its batches
+there, so with several hosts ``archive_dir`` must be shared storage for the
+export to be complete.
+"""
+import asyncio
+import gzip
+import logging
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from serialization import dumps_lines
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "archive", "ttl")
+INDEX_OPTIONS_CONFLICT = (85, 86)
+READ_CHUNK = 64 * 1024
+
+
+@dataclass
+class RetentionPolicy:
+    days: int
+    field: str = "timestamp"
+    ttl: bool = True  # False when deletions must go through on_delete
+
+
+class RetentionManager:
+    def __init__(self, database, policies: Dict[str, RetentionPolicy], mode: str = "archive",
+                 archive_dir="archive", batch_size: int = 1000, interval: float = 3600,
+                 lease_seconds: float = 300, compresslevel: int = 6, on_delete=None,
+                 clock=datetime.utcnow):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}, got {mode!r}")
+        if mode == "ttl":
+            for name, policy in policies.items():
+                if policy.days and not policy.ttl:
+                    raise ValueError(f"{name} cannot expire through a TTL index: its deletions "
+                                     f"must be reported to on_delete; use archive mode or set its days to 0")
+        self.database = database
+        self.policies = policies
+        self.mode = mode
+        self.archive_dir = Path(archive_dir)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.compresslevel = compresslevel
+        self.on_delete = on_delete  # awaited with (collection name, documents deleted)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._clock = clock
+        self.archived = 0
+        self.deleted = 0
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def setup(self):
+        """Create or remove the TTL indexes the mode calls for."""
+        if self.mode == "off":
+            return
+        for name, policy in self.policies.items():
+            collection = self.database[name]
+            if self.mode == "ttl" and policy.days:
+                await self._ensure_ttl(collection, policy)
+            else:
+                await self._drop_ttl(collection, policy)
+
+    async def _ensure_ttl(self, collection, policy: RetentionPolicy):
+        seconds = policy.days * 86400
+        try:
+            await collection.create_index(policy.field, expireAfterSeconds=seconds)
+        except OperationFailure as e:
+            if e.code not in INDEX_OPTIONS_CONFLICT:
+                raise
+            # The plain timestamp index already exists: add the TTL in place
+            await self.database.command("collMod", collection.name, index={
+                "keyPattern": {policy.field: 1}, "expireAfterSeconds": seconds})
+
+    async def _drop_ttl(self, collection, policy: RetentionPolicy):
+        # A TTL index left from ttl mode would delete documents before they are archived
+        for name, index in (await collection.index_information()).items():
+            if "expireAfterSeconds" in index and [field for field, _ in index["key"]] == [policy.field]:
+                logger.warning(f"Dropping TTL index {collection.name}.{name}: retention mode is {self.mode}")
+                await collection.drop_index(name)
+                await collection.create_index(policy.field)
+
+    def start(self):
+        if self.mode == "archive":
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            # Flag rather than cancel(), as in ContactWriter.stop
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Retention pass error: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> Dict[str, int]:
+        """Archive and delete everything expired; returns documents removed per collection."""
+        removed = {}
+        for name, policy in self.policies.items():
+            if not policy.days:
+                continue
+            count = 0
+            while not self._stopping:
+                if not await self._acquire():
+                    logger.info("Retention pass skipped: another worker holds the lease")
+                    return removed
+                batch = await self._archive_batch(name, policy)
+                count += batch
+                if batch < self.batch_size:
+                    break
+            if count:
+                logger.info(f"Retention: archived and deleted {count} {name} older than {policy.days} days")
+            removed[name] = count
+        return removed
+
+    async def _acquire(self) -> bool:
+        now = self._clock()
+        try:
+            await self.database.retention_locks.find_one_and_update(
+                {"_id": "retention", "$or": [{"owner": self.owner}, {"until": {"$lte": now}}]},
+                {"$set": {"owner": self.owner, "until": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _archive_batch(self, name: str, policy: RetentionPolicy) -> int:
+        cutoff = self._clock() - timedelta(days=policy.days)
+        collection = self.database[name]
+        documents = await collection.find({policy.field: {"$lt": cutoff}}) \
+            .sort([(policy.field, 1), ("_id", 1)]).limit(self.batch_size).to_list(self.batch_size)
+        if not documents:
+            return 0
+
+        ids = [document.pop("_id") for document in documents]
+        by_day: Dict[date, List[dict]] = {}
+        for document in documents:
+            by_day.setdefault(document[policy.field].date(), []).append(document)
+        stamp = f"{time.time_ns():020d}-{uuid.uuid4().hex[:6]}"
+        for day, group in by_day.items():
+            await asyncio.to_thread(self._write, self.day_dir(name, day) / f"{stamp}.ndjson.gz", group)
+        self.archived += len(documents)
+
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        self.deleted += result.deleted_count
+        if result.deleted_count < len(ids):
+            # Some were deleted by someone else meanwhile: report only ours
+            remaining = {document["_id"] for document in
+                         await collection.find({"_id": {"$in": ids}}, {"_id": 1}).to_list(None)}
+            documents = [document for _id, document in zip(ids, documents) if _id not in remaining]
+        await self._deleted(name, documents)
+        return len(ids)
+
+    async def _deleted(self, name: str, documents: List[dict]):
+        if not self.on_delete or not documents:
+            return
+        try:
+            await self.on_delete(name, documents)
+        except Exception as e:
+            # The documents are archived and gone; a failing hook must not stop the pass.
+            logger.warning(f"Retention delete hook error: {str(e)}")
+
+    def day_dir(self, name: str, day: date) -> Path:
+        return self.archive_dir / name / f"{day.year:04d}" / f"{day.month:02d}" / f"{day.day:02d}"
+
+    def _write(self, path: Path, documents: List[dict]):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(path.name + ".part")
+        with gzip.open(partial, "wb", compresslevel=self.compresslevel) as archive:
+            archive.write(dumps_lines(documents))
+        os.replace(partial, path)
+
+    def archive_files(self, name: str, first: date, last: date) -> Iterable[Path]:
+        """Complete archive files for days ``first`` to ``last``, oldest first."""
+        day = first
+        while day <= last:
+            directory = self.day_dir(name, day)
+            if directory.is_dir():
+                yield from sorted(directory.glob("*.ndjson.gz"))
+            day += timedelta(days=1)
+
+    async def export(self, name: str, first: date, last: date, batch_size: int = 1000) -> AsyncIterator[bytes]:
+        """NDJSON for ``first`` to ``last`` inclusive: archived, then live documents."""
+        policy = self.policies[name]
+        if self.archive_dir.is_dir():
+            for path in self.archive_files(name, first, last):
+                archive = await asyncio.to_thread(gzip.open, path, "rb")
+                try:
+                    while chunk := await asyncio.to_thread(archive.read, READ_CHUNK):
+                        yield chunk
+                finally:
+                    archive.close()
+
+        start = datetime.combine(first, datetime.min.time())
+        end = datetime.combine(last + timedelta(days=1), datetime.min.time())
+        cursor = self.database[name].find({policy.field: {"$gte": start, "$lt": end}}, {"_id": 0}) \
+            .sort([(policy.field, 1)]).batch_size(batch_size)
+        documents = []
+        async for document in cursor:
+            documents.append(document)
+            if len(documents) >= batch_size:
+                yield dumps_lines(documents)
+                documents = []
+        if documents:
+            yield dumps_lines(documents)
@@ -0,0 +1,197 @@
+"""Incrementally maintained contact counters for the analytics summary.
+
+Every stored contact bumps three counter documents in ``contact_rollups``
+with atomic upserts: the overall total, its UTC day (which also counts it
+under ``services``) and its service.  The summary then reads at most ~32
+small documents instead of counting ``contacts``, and is cached in-process
+for a few seconds on top of that.  The last 30 days are a rolling window, as
+when the summary counted ``contacts``: the days it covers minus a count of
+the contacts of its first day that fall before it, which is bounded by a
+day's contacts and served by the ``timestamp`` index.  The summary can read
+both from a secondary (``reads``, ``contacts``); counter updates and the
+backfill always go to ``collection``.  Contacts deleted by retention are
+uncounted the same way, so the total is of the contacts still stored.
+
+Rebuild the counters from existing contacts with::
+
+    python rollups.py backfill
+
+The backfill runs next to live traffic.  It rebuilds the days before the
+current UTC day, which live inserts no longer touch, with ``$set``, and
+corrects the total and service counters by the difference with ``$inc``,
+so increments made meanwhile are neither lost nor counted twice.  The
+current day is left to the live counters: contacts stored today before the
+counters existed are counted by a backfill run tomorrow.  A contact stored
+for a past day during the run (a spool replayed late) can be miscounted;
+run the backfill again.  Days counted before day documents carried
+``services`` are taken as right for the service counters.
+"""
+import asyncio
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from pymongo import UpdateOne
+
+TOTAL_ID = "total"
+
+
+def day_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, moment.day)
+
+
+class ContactRollups:
+    def __init__(self, collection, contacts=None, reads=None, cache_ttl: float = 5.0, clock=time.monotonic):
+        self.collection = collection
+        self.reads = reads if reads is not None else collection  # summary reads; writes use collection
+        self.contacts = contacts  # for the partial first day of the window; None counts whole days
+        self.cache_ttl = cache_ttl
+        self._clock = clock
+        self._cached: Optional[dict] = None
+        self._cached_at = 0.0
+
+    async def setup(self):
+        await self.collection.create_index([("kind", 1), ("day", 1)])
+
+    async def record(self, records: Iterable[dict]):
+        """Count freshly stored contact records (one round trip per batch)."""
+        await self._add(records, 1)
+
+    async def remove(self, records: Iterable[dict]):
+        """Uncount contact records deleted by retention."""
+        await self._add(records, -1)
+
+    async def _add(self, records: Iterable[dict], sign: int):
+        days = defaultdict(Counter)
+        for record in records:
+            days[day_start(record["timestamp"])][record["service"]] += sign
+        if not days:
+            return
+
+        services = Counter()
+        for by_service in days.values():
+            services.update(by_service)
+        await self.collection.bulk_write(
+            [self._counter(TOTAL_ID, None, sum(services.values()))]
+            + [self._counter("day", day, sum(by_service.values()), by_service) for day, by_service in days.items()]
+            + [self._counter("service", service, count) for service, count in services.items()],
+            ordered=False
+        )
+        self._cached = None
+
+    @staticmethod
+    def _key(kind: str, value) -> str:
+        if kind == TOTAL_ID:
+            return TOTAL_ID
+        if kind == "day":
+            return f"day:{value:%Y-%m-%d}"
+        return f"service:{value}"
+
+    @classmethod
+    def _counter(cls, kind: str, value, count: int, services: Optional[Dict[str, int]] = None) -> UpdateOne:
+        if kind == TOTAL_ID:
+            fields = {"kind": TOTAL_ID}
+        elif kind == "day":
+            fields = {"kind": "day", "day": value}
+        else:
+            fields = {"kind": "service", "service": value}
+        increments = {"count": count}
+        for service, number in (services or {}).items():
+            increments[f"services.{service}"] = number
+        return UpdateOne({"_id": cls._key(kind, value)}, {"$inc": increments, "$set": fields}, upsert=True)
+
+    async def summary(self, now: Optional[datetime] = None) -> dict:
+        """Total contacts and contacts over the last 30 days."""
+        if self._cached is not None and self._clock() - self._cached_at < self.cache_ttl:
+            return self._cached
+
+        now = now or datetime.utcnow()
+        since = now - timedelta(days=30)
+        first_day = day_start(since)
+        counters = self.reads.find(
+            {"$or": [{"_id": TOTAL_ID}, {"kind": "day", "day": {"$gte": first_day}}]},
+            {"_id": 1, "count": 1}
+        ).to_list(None)
+        if self.contacts is not None:
+            documents, before_window = await asyncio.gather(
+                counters, self.contacts.count_documents({"timestamp": {"$gte": first_day, "$lt": since}}))
+        else:
+            documents, before_window = await counters, 0
+
+        summary = {"total_contacts": 0, "recent_contacts_30d": -before_window}
+        for document in documents:
+            key = "total_contacts" if document["_id"] == TOTAL_ID else "recent_contacts_30d"
+            summary[key] += document["count"]
+
+        self._cached = summary
+        self._cached_at = self._clock()
+        return summary
+
+    async def backfill(self, contacts, now: Optional[datetime] = None) -> int:
+        """Rebuild the counters of past days from ``contacts``; returns the contacts counted."""
+        watermark = day_start(now or datetime.utcnow())
+        counted = defaultdict(Counter)
+        async for group in contacts.aggregate([
+            {"$match": {"timestamp": {"$lt": watermark}}},
+            {"$group": {
+                "_id": {
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+                    "service": "$service",
+                },
+                "count": {"$sum": 1},
+            }},
+        ]):
+            counted[datetime.strptime(group["_id"]["day"], "%Y-%m-%d")][group["_id"]["service"]] += group["count"]
+        stored = {
+            document["day"]: document
+            for document in await self.collection.find({"kind": "day", "day": {"$lt": watermark}}).to_list(None)
+        }
+
+        operations = []
+        contacts_counted = difference = 0
+        services = Counter()  # per service, counted minus stored
+        for day in counted.keys() | stored.keys():
+            by_service = counted.get(day, Counter())
+            document = stored.get(day, {"count": 0, "services": {}})
+            previous = document.get("services", by_service)
+            contacts_counted += sum(by_service.values())
+            difference += sum(by_service.values()) - document["count"]
+            for service in by_service.keys() | previous.keys():
+                services[service] += by_service.get(service, 0) - previous.get(service, 0)
+            operations.append(UpdateOne(
+                {"_id": self._key("day", day)},
+                {"$set": {"kind": "day", "day": day, "count": sum(by_service.values()), "services": dict(by_service)}},
+                upsert=True
+            ))
+        if difference:
+            operations.append(self._counter(TOTAL_ID, None, difference))
+        operations.extend(self._counter("service", service, number) for service, number in services.items() if number)
+
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+        self._cached = None
+        return contacts_counted
+
+
+async def _backfill():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    rollups = ContactRollups(db.contact_rollups)
+    await rollups.setup()
+    total = await rollups.backfill(db.contacts)
+    print(f"Rebuilt contact rollups of past days from {total} contacts")
+    client.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python rollups.py backfill")
+    asyncio.run(_backfill())
@@ -0,0 +1,38 @@
+"""JSON encoding for responses built straight from MongoDB documents.
+
+Uses orjson when it is installed, which encodes ``datetime`` natively (naive
+values as ``YYYY-MM-DDTHH:MM:SS[.ffffff]``, the same text Pydantic produces)
+and returns bytes ready to send.  Without orjson the standard library encoder
+is used with FastAPI's JSONResponse settings, so the output is the same.
+"""
+import json
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+FAST_JSON = orjson is not None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(value) -> bytes:
+        return orjson.dumps(value)
+else:
+    def dumps(value) -> bytes:
+        return json.dumps(value, default=_default, ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":")).encode("utf-8")
+
+
+def dumps_lines(documents) -> bytes:
+    """NDJSON: one document per line, newline terminated."""
+    if not documents:
+        return b""
+    return b"\n".join(dumps(document) for document in documents) + b"\n"
@@ -0,0 +1,161 @@
+"""Spam classification for contact messages.
+
+Rules live in a text file (``spam_rules.txt`` by default), one per line as
+``<weight> <rule>``; a rule is a literal term, or a regular expression when
+prefixed with ``re:``.  Blank lines and ``#`` comments are ignored::
+
+    1.0  casino
+    0.5  gagner de l'argent
+    2    re:b[i1]tc[o0]in
+
+Messages and terms are compared after Unicode normalization (accents
+stripped, case folded).  All literal terms are compiled into a single regex
+shaped like a trie, so a message is scanned once in C whatever the number of
+terms; ``re:`` rules are combined into one alternation.  A message is spam
+when the weights of the distinct rules it matches add up to the threshold.
+Overlapping terms only count the longest match at a given position.
+
+The file is re-read when its modification time changes, checked at most
+every ``check_interval`` seconds; a file that fails to parse is logged and
+the previous rules stay in force.
+"""
+import logging
+import os
+import re
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_COMBINING_MARKS = re.compile("[\u0300-\u036f]")
+_END = ""
+
+
+def normalize(text: str) -> str:
+    """Strip accents and fold case: 'Crypto-Monnaie' -> 'crypto-monnaie'."""
+    if text.isascii():
+        return text.lower()
+    return _COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", text)).casefold()
+
+
+def _trie_pattern(node: dict) -> str:
+    """Regex matching exactly the words stored in a character trie."""
+    branches = []
+    leaves = []
+    for char in sorted(key for key in node if key != _END):
+        child = node[char]
+        if list(child) == [_END]:
+            leaves.append(re.escape(char))
+        else:
+            branches.append(re.escape(char) + _trie_pattern(child))
+    if leaves:
+        branches.append(leaves[0] if len(leaves) == 1 else "[" + "".join(leaves) + "]")
+
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if _END in node:
+        # A shorter word ends here: the rest is optional (greedy, so longest wins).
+        pattern = "(?:" + pattern + ")?"
+    return pattern
+
+
+class SpamRules:
+    """An immutable, compiled rule set."""
+
+    def __init__(self, rules: List[Tuple[float, str]]):
+        self.count = len(rules)
+        self.terms: Dict[str, float] = {}
+        self.patterns: Dict[str, float] = {}
+        pattern_sources = []
+
+        trie: dict = {}
+        for weight, rule in rules:
+            if rule.startswith("re:"):
+                group = f"p{len(pattern_sources)}"
+                re.compile(rule[3:])  # report bad rules on their own
+                pattern_sources.append(f"(?P<{group}>{rule[3:]})")
+                self.patterns[group] = weight
+                continue
+            term = normalize(rule)
+            if not term:
+                continue
+            self.terms[term] = self.terms.get(term, 0.0) + weight
+            node = trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[_END] = {}
+
+        self._terms = re.compile(_trie_pattern(trie)) if trie else None
+        self._patterns = re.compile("|".join(pattern_sources)) if pattern_sources else None
+
+    @classmethod
+    def parse(cls, text: str) -> "SpamRules":
+        rules = []
+        for number, line in enumerate(text.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                weight, rule = line.split(None, 1)
+                rules.append((float(weight), rule.strip()))
+            except ValueError:
+                raise ValueError(f"line {number}: expected '<weight> <rule>', got {line!r}")
+        return cls(rules)
+
+    def score(self, message: str) -> float:
+        text = normalize(message)
+        matched = set()
+        score = 0.0
+        if self._terms:
+            for match in self._terms.finditer(text):
+                term = match.group()
+                if term not in matched:
+                    matched.add(term)
+                    score += self.terms[term]
+        if self._patterns:
+            for match in self._patterns.finditer(text):
+                group = match.lastgroup
+                if group not in matched:
+                    matched.add(group)
+                    score += self.patterns[group]
+        return score
+
+
+class SpamFilter:
+    """Scores messages against a hot-reloaded rule file."""
+
+    def __init__(self, path, threshold: float = 1.0, check_interval: float = 5.0, clock=time.monotonic):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.check_interval = check_interval
+        self._clock = clock
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self.rules = SpamRules([])
+        self.reload()
+
+    def reload(self) -> bool:
+        """Load the rule file if it changed; keep the current rules on error."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self._mtime:
+                return False
+            rules = SpamRules.parse(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError, re.error) as e:
+            logger.error(f"Spam rules not loaded from {self.path}: {str(e)}")
+            return False
+        self.rules = rules
+        self._mtime = mtime
+        logger.info(f"Loaded {rules.count} spam rules from {self.path}")
+        return True
+
+    def score(self, message: str) -> float:
+        now = self._clock()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self.reload()
+        return self.rules.score(message)
+
+    def is_spam(self, message: str) -> bool:
+        return self.score(message) >= self.threshold
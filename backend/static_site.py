@@ -0,0 +1,214 @@
+"""Serving the built React frontend (``frontend/build``) from the API process.
+
+``load`` walks the build directory once and keeps an index of every file
+with its precomputed headers: content type, a strong ETag from the content
+hash, ``Cache-Control`` and the precompressed variants found next to it
+(see ``compression.precompress``).  Requests never touch the filesystem to
+find a file, so paths cannot escape the root.
+
+* Files up to ``memory_max_file`` bytes are held in memory, smallest first,
+  until ``memory_budget`` is used: that is the whole of a typical build
+  except source maps and large media.
+* Larger files are sent through the ASGI zero-copy extension (``sendfile``)
+  when the server offers it, then ``pathsend``, else read in chunks on a
+  thread.
+* Content-hashed build outputs (``main.3f2a1b4c.js``) never change under
+  their name and are cached as ``immutable`` for a year; everything else,
+  ``index.html`` included, is revalidated with ``If-None-Match``.
+* Paths without an extension that match no file get ``index.html``, for
+  client-side routes, except under ``passthrough`` prefixes (``/api/``).
+
+Install it as the router's default app, so it only sees requests no route
+matched (405s for known routes are unchanged); misses go to ``not_found``.
+
+Reload after a deploy by restarting, or by calling ``load`` again.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import posixpath
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import unquote
+
+from compression import ENCODINGS, SUFFIXES, accepted_encodings
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.(chunk\.)?[a-z0-9]+$")
+TEXT_TYPES = re.compile(r"^(text/|application/(javascript|json|manifest\+json|xml)|image/svg\+xml)")
+CHUNK_SIZE = 256 * 1024
+
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+mimetypes.add_type("application/javascript", ".js")
+mimetypes.add_type("application/json", ".map")
+
+
+@dataclass
+class Variant:
+    path: Path
+    size: int
+    etag: bytes
+    body: Optional[bytes] = None
+
+
+@dataclass
+class StaticAsset:
+    content_type: bytes
+    cache_control: bytes
+    variants: Dict[str, Variant] = field(default_factory=dict)  # "identity", "gzip", "br"
+
+
+class StaticSite:
+    path = "<static>"  # route label for MetricsMiddleware
+
+    def __init__(self, root, not_found, memory_max_file: int = 256 * 1024,
+                 memory_budget: int = 32 * 1024 * 1024, index: str = "index.html",
+                 passthrough: Iterable[str] = ("/api/",)):
+        self.root = Path(root)
+        self.not_found = not_found
+        self.memory_max_file = memory_max_file
+        self.memory_budget = memory_budget
+        self.index = index
+        self.passthrough = tuple(passthrough)
+        self.assets: Dict[str, StaticAsset] = {}
+        self.memory_used = 0
+
+    def load(self):
+        """(Re)build the index; blocking, run it on a thread."""
+        assets = {}
+        variants = []
+        for path in sorted(self.root.rglob("*")):
+            if not path.is_file() or path.suffix in (".gz", ".br", ".part"):
+                continue
+            relative = "/" + path.relative_to(self.root).as_posix()
+            content_type, _ = mimetypes.guess_type(path.name)
+            content_type = content_type or "application/octet-stream"
+            if TEXT_TYPES.match(content_type):
+                content_type += "; charset=utf-8"
+            asset = StaticAsset(
+                content_type=content_type.encode("latin-1"),
+                cache_control=(IMMUTABLE if HASHED_NAME.search(path.name) else REVALIDATE).encode("latin-1"),
+            )
+            digest = _file_digest(path)
+            for encoding in ("identity",) + tuple(SUFFIXES):
+                candidate = path if encoding == "identity" else path.with_name(path.name + SUFFIXES[encoding])
+                if encoding != "identity" and (encoding not in ENCODINGS or not candidate.is_file()):
+                    continue
+                suffix = "" if encoding == "identity" else f"-{encoding}"
+                variant = Variant(candidate, candidate.stat().st_size, f'"{digest}{suffix}"'.encode("latin-1"))
+                asset.variants[encoding] = variant
+                variants.append(variant)
+            assets[relative] = asset
+
+        memory_used = 0
+        for variant in sorted(variants, key=lambda v: v.size):
+            if variant.size > self.memory_max_file or memory_used + variant.size > self.memory_budget:
+                break
+            variant.body = variant.path.read_bytes()
+            memory_used += variant.size
+        self.assets = assets
+        self.memory_used = memory_used
+        return len(assets)
+
+    def lookup(self, path: str) -> Optional[StaticAsset]:
+        path = posixpath.normpath(unquote(path)) if path != "/" else "/" + self.index
+        asset = self.assets.get(path)
+        if asset is None and "." not in path.rsplit("/", 1)[-1]:
+            asset = self.assets.get("/" + self.index)  # client-side route
+        return asset
+
+    async def __call__(self, scope, receive, send):
+        asset = None
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD") \
+                and not scope["path"].startswith(self.passthrough):
+            asset = self.lookup(scope["path"])
+        if asset is None:
+            return await self.not_found(scope, receive, send)
+        scope["route"] = self
+
+        headers = dict(scope["headers"])
+        encoding = "identity"
+        for candidate in accepted_encodings(headers.get(b"accept-encoding", b"").decode("latin-1")):
+            if candidate in asset.variants:
+                encoding = candidate
+                break
+        variant = asset.variants[encoding]
+
+        response_headers = [
+            (b"etag", variant.etag),
+            (b"cache-control", asset.cache_control),
+        ]
+        if len(asset.variants) > 1:
+            response_headers.append((b"vary", b"Accept-Encoding"))
+        if variant.etag in _etags(headers.get(b"if-none-match", b"")):
+            return await _send_status(send, 304, response_headers)
+
+        response_headers += [
+            (b"content-type", asset.content_type),
+            (b"content-length", str(variant.size).encode("latin-1")),
+        ]
+        if encoding != "identity":
+            response_headers.append((b"content-encoding", encoding.encode("latin-1")))
+        await send({"type": "http.response.start", "status": 200, "headers": response_headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+        elif variant.body is not None:
+            await send({"type": "http.response.body", "body": variant.body})
+        else:
+            await _send_file(scope, send, variant)
+
+
+async def _send_file(scope, send, variant: Variant):
+    extensions = scope.get("extensions") or {}
+    if "http.response.zerocopysend" in extensions:
+        with open(variant.path, "rb") as file:
+            await send({"type": "http.response.zerocopysend", "file": file, "count": variant.size})
+        return
+    if "http.response.pathsend" in extensions:
+        await send({"type": "http.response.pathsend", "path": str(variant.path)})
+        return
+    file = await asyncio.to_thread(open, variant.path, "rb")
+    try:
+        remaining = variant.size
+        while remaining > 0:
+            chunk = await asyncio.to_thread(file.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # Truncated on disk since load(): end the response rather than hang
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        file.close()
+
+
+async def _send_status(send, status: int, headers=()):
+    await send({"type": "http.response.start", "status": status, "headers": list(headers)})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def _etags(header: bytes):
+    return {tag.strip().removeprefix(b"W/") for tag in header.split(b",")}
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        while chunk := file.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+if __name__ == "__main__":
+    import sys
+    from compression import precompress
+
+    if len(sys.argv) != 3 or sys.argv[1] != "precompress":
+        sys.exit("usage: python static_site.py precompress <build directory>")
+    counts = precompress(sys.argv[2])
+    print(f"{counts['variants']} variants written for {counts['files']} files "
+          f"({counts['skipped']} not worth keeping)")
@@ -0,0 +1,245 @@
+"""Contacts and status checks over time, bucketed by hour, day or week.
+
+``TimeSeries.series`` counts a source collection per UTC bucket (weeks start
+on Monday), and per ``service`` for contacts, with one aggregation pipeline
+that ranges over the ``timestamp`` index::
+
+    $match  timestamp in [start, end)
+    $group  {bucket: timestamp - (timestamp - origin) mod width, service}
+
+The bucket is computed arithmetically rather than with ``$dateTrunc``, so
+any MongoDB version serves it.  A requested range is widened to whole
+buckets.
+
+A bucket is *closed* once it ended more than ``settle`` seconds ago, which
+leaves room for write-behind batches and spool replays to land.  Closed
+buckets do not change any more: the first time one is computed it is stored
+in ``analytics_buckets`` (one small document, ``_id``
+``<source>:<granularity>:<start>``) and kept in memory, up to
+``memory_entries`` of them.  An open day or week is added up from its
+hours or days, closed ones cached the same way, so a request aggregates the
+buckets no worker has computed yet and the open hour (two, within
+``settle`` of the hour): its cost follows the number of buckets asked for,
+not the size of the collection.
+
+Documents that land in a bucket after it closed (a spool replayed late) and
+documents deleted by retention do not change the cached counts.  Drop the
+cached buckets to recompute them::
+
+    python timeseries.py clear [contacts|status_checks]
+"""
+import asyncio
+import os
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+GRANULARITIES = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+# Open buckets are split into these to reuse their closed parts
+FINER = {"day": "hour", "week": "day"}
+# Weeks count from a Monday, hours and days from the epoch
+ORIGINS = {
+    "hour": datetime(1970, 1, 1),
+    "day": datetime(1970, 1, 1),
+    "week": datetime(1970, 1, 5),
+}
+
+
+@dataclass
+class SeriesSource:
+    field: str = "timestamp"
+    breakdown: Optional[str] = None  # counted per value of this field too
+
+
+def utc_naive(moment: datetime) -> datetime:
+    """Stored timestamps are naive UTC; convert aware datetimes to match."""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    return moment - (moment - ORIGINS[granularity]) % GRANULARITIES[granularity]
+
+
+class TimeSeries:
+    def __init__(self, database, sources: Dict[str, SeriesSource], settle: float = 300,
+                 max_buckets: int = 2000, memory_entries: int = 100_000, clock=datetime.utcnow):
+        self.database = database
+        self.sources = sources
+        self.settle = timedelta(seconds=settle)
+        self.max_buckets = max_buckets
+        self.memory_entries = memory_entries
+        self._clock = clock
+        self._closed: Dict[str, dict] = {}
+        self.aggregations = 0
+
+    @staticmethod
+    def _key(source: str, granularity: str, start: datetime) -> str:
+        # Fixed width, so _id order is time order within a series
+        return f"{source}:{granularity}:{start:%Y-%m-%dT%H}"
+
+    def _empty(self, source: str) -> dict:
+        breakdown = self.sources[source].breakdown
+        return {"total": 0, f"by_{breakdown}": {}} if breakdown else {"total": 0}
+
+    async def series(self, source: str, granularity: str, start: datetime, end: datetime) -> dict:
+        """Counts per bucket from the bucket holding ``start`` up to ``end``."""
+        if end <= start:
+            raise ValueError("end must be after start")
+        width = GRANULARITIES[granularity]
+        first = bucket_start(start, granularity)
+        count = -(-(end - first) // width)
+        if count > self.max_buckets:
+            raise ValueError(f"{count} buckets requested, at most {self.max_buckets}")
+        starts = [first + index * width for index in range(count)]
+        counts = await self._counts(source, granularity, starts)
+
+        buckets = [{"start": bucket.isoformat(), **(counts.get(bucket) or self._empty(source))}
+                   for bucket in starts]
+        result = {
+            "source": source,
+            "granularity": granularity,
+            "start": first.isoformat(),
+            "end": (starts[-1] + width).isoformat(),
+            **self._empty(source),
+            "buckets": buckets,
+        }
+        for bucket in buckets:
+            self._add(source, result, bucket)
+        return result
+
+    def _add(self, source: str, into: dict, counts: dict):
+        into["total"] += counts["total"]
+        breakdown = self.sources[source].breakdown
+        if breakdown:
+            totals = into[f"by_{breakdown}"]
+            for value, number in counts[f"by_{breakdown}"].items():
+                totals[value] = totals.get(value, 0) + number
+
+    async def _counts(self, source: str, granularity: str, starts: List[datetime]) -> Dict[datetime, dict]:
+        width = GRANULARITIES[granularity]
+        now = self._clock()
+        settled = now - self.settle
+        counts = {}
+        missing: List[datetime] = []
+        current: List[datetime] = []
+        for bucket in starts:
+            if bucket + width <= settled:
+                cached = self._closed.get(self._key(source, granularity, bucket))
+                if cached is None:
+                    missing.append(bucket)
+                else:
+                    counts[bucket] = cached
+            elif bucket <= now:
+                current.append(bucket)
+            # Buckets in the future stay empty without a query
+
+        if missing:
+            stored = await self._load(source, granularity, missing[0], missing[-1])
+            missing = [bucket for bucket in missing if bucket not in stored]
+            if missing:
+                computed = await self._aggregate(source, granularity, missing[0], missing[-1] + width)
+                stored.update(await self._store(source, granularity, {
+                    bucket: computed.get(bucket) or self._empty(source) for bucket in missing
+                }))
+            for bucket, value in stored.items():
+                self._remember(self._key(source, granularity, bucket), value)
+            counts.update(stored)
+        if current:
+            counts.update(await self._current(source, granularity, current[0], current[-1] + width))
+        return counts
+
+    async def _current(self, source: str, granularity: str, start: datetime, end: datetime) -> Dict[datetime, dict]:
+        """Open buckets, added up from finer buckets: in the end only open hours are aggregated."""
+        finer = FINER.get(granularity)
+        if finer is None:
+            return await self._aggregate(source, granularity, start, end)
+        width = GRANULARITIES[finer]
+        now = self._clock()
+        parts = await self._counts(source, finer, [start + index * width for index in range((end - start) // width)
+                                                   if start + index * width <= now])
+        counts = {}
+        for part, value in parts.items():
+            self._add(source, counts.setdefault(bucket_start(part, granularity), self._empty(source)), value)
+        return counts
+
+    async def _aggregate(self, source: str, granularity: str, start: datetime, end: datetime) -> Dict[datetime, dict]:
+        spec = self.sources[source]
+        field = f"${spec.field}"
+        width = int(GRANULARITIES[granularity].total_seconds() * 1000)
+        group = {"bucket": {"$subtract": [field, {"$mod": [{"$subtract": [field, ORIGINS[granularity]]}, width]}]}}
+        if spec.breakdown:
+            group["value"] = f"${spec.breakdown}"
+        groups = await self.database[source].aggregate([
+            {"$match": {spec.field: {"$gte": start, "$lt": end}}},
+            {"$group": {"_id": group, "count": {"$sum": 1}}},
+        ]).to_list(None)
+        self.aggregations += 1
+
+        counts = {}
+        for row in groups:
+            bucket = counts.setdefault(row["_id"]["bucket"], self._empty(source))
+            bucket["total"] += row["count"]
+            value = row["_id"].get("value")
+            if spec.breakdown and value is not None:
+                totals = bucket[f"by_{spec.breakdown}"]
+                totals[str(value)] = totals.get(str(value), 0) + row["count"]
+        return counts
+
+    async def _load(self, source: str, granularity: str, first: datetime, last: datetime) -> Dict[datetime, dict]:
+        """Closed buckets another request or worker already stored, on the _id index."""
+        documents = await self.database.analytics_buckets.find(
+            {"_id": {"$gte": self._key(source, granularity, first), "$lte": self._key(source, granularity, last)}},
+            {"_id": 0, "source": 0, "granularity": 0}
+        ).to_list(None)
+        return {document.pop("start"): document for document in documents}
+
+    async def _store(self, source: str, granularity: str, buckets: Dict[datetime, dict]) -> Dict[datetime, dict]:
+        await self.database.analytics_buckets.bulk_write([
+            UpdateOne(
+                {"_id": self._key(source, granularity, bucket)},
+                {"$set": {"source": source, "granularity": granularity, "start": bucket, **value}},
+                upsert=True
+            )
+            for bucket, value in buckets.items()
+        ], ordered=False)
+        return buckets
+
+    def _remember(self, key: str, value: dict):
+        if key not in self._closed and len(self._closed) >= self.memory_entries:
+            del self._closed[next(iter(self._closed))]  # oldest first
+        self._closed[key] = value
+
+    async def clear(self, source: Optional[str] = None) -> int:
+        """Forget cached buckets (all sources by default); returns how many."""
+        self._closed = {key: value for key, value in self._closed.items()
+                        if source is not None and not key.startswith(f"{source}:")}
+        result = await self.database.analytics_buckets.delete_many({"source": source} if source else {})
+        return result.deleted_count
+
+
+async def _clear(source: Optional[str]):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    series = TimeSeries(client[os.environ['DB_NAME']], {})
+    deleted = await series.clear(source)
+    print(f"Dropped {deleted} cached analytics buckets")
+    client.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["clear"] or len(sys.argv) > 3:
+        sys.exit("usage: python timeseries.py clear [contacts|status_checks]")
+    asyncio.run(_clear(sys.argv[2] if len(sys.argv) > 2 else None))
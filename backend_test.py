@@ -1,19 +1,24 @@
 import requests
+import os
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import time
 
 class WebmaticAPITester:
-    def __init__(self, base_url="https://review-update.preview.emergentagent.com"):
+    def __init__(self, base_url="https://review-update.preview.emergentagent.com", token=None):
         self.base_url = base_url
+        # Bearer token for the read endpoints, signed with the server's JWT_SECRET_KEY
+        self.token = token or os.environ.get('WEBMATIC_API_TOKEN')
         self.tests_run = 0
         self.tests_passed = 0
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, check_headers=False):
+    def run_test(self, name, method, endpoint, expected_status, data=None, check_headers=False, extra_headers=None):
         """Run a single API test"""
         url = f"{self.base_url}/{endpoint}"
         headers = {'Content-Type': 'application/json'}
+        if extra_headers:
+            headers.update(extra_headers)
 
         self.tests_run += 1
         print(f"\n🔍 Testing {name}...")
@@ -76,6 +81,25 @@ class WebmaticAPITester:
         """Test health endpoint"""
         return self.run_test("Health Check Endpoint", "GET", "health", 200)
 
+    def test_readiness_endpoint(self):
+        """Test readiness endpoint reports a connected database"""
+        success, data, response = self.run_test("Readiness Endpoint", "GET", "ready", 200)
+        if success and data.get("services", {}).get("database") != "connected":
+            print(f"❌ Database not reported as connected: {data.get('database')}")
+            return False, data, response
+        return success, data, response
+
+    def test_conditional_get(self):
+        """Test that a cached route answers If-None-Match with 304"""
+        success, _, response = self.run_test("Root API Endpoint - ETag", "GET", "api/", 200)
+        etag = response.headers.get('ETag') if success else None
+        if not etag:
+            print("❌ No ETag on cached route")
+            return False
+        success, _, _ = self.run_test("Root API Endpoint - Not Modified", "GET", "api/", 304,
+                                      extra_headers={'If-None-Match': etag})
+        return success
+
     def test_security_check(self):
         """Test security check endpoint"""
         return self.run_test("Security Check Endpoint", "GET", "api/security/check", 200)
@@ -113,6 +137,46 @@ class WebmaticAPITester:
         }
         return self.run_test("Contact Form - Spam Detection", "POST", "api/contact", 422, data=test_data)
 
+    def test_contact_form_duplicate(self):
+        """Test that an identical resubmission returns the original reference"""
+        test_data = {
+            "name": "Marie Martin",
+            "email": "marie.martin@example.com",
+            "service": "Maintenance informatique",
+            "message": f"Mon ordinateur ne démarre plus depuis ce matin ({datetime.now().strftime('%H%M%S')})."
+        }
+        success, first, _ = self.run_test("Contact Form - First Submission", "POST", "api/contact", 200, data=test_data)
+        if not success:
+            return False
+        success, second, _ = self.run_test("Contact Form - Duplicate Submission", "POST", "api/contact", 200, data=test_data)
+        if success and second.get('reference') != first.get('reference'):
+            print(f"❌ Duplicate got a new reference: {second.get('reference')} != {first.get('reference')}")
+            return False
+        return success
+
+    def test_contact_form_idempotency_key(self):
+        """Test Idempotency-Key replays and conflicts"""
+        key = f"test-{datetime.now().strftime('%H%M%S%f')}"
+        test_data = {
+            "name": "Paul Bernard",
+            "email": "paul.bernard@example.com",
+            "service": "Support mobile",
+            "message": "Mon téléphone ne charge plus, pouvez-vous m'aider ?"
+        }
+        success, first, _ = self.run_test("Contact Form - Idempotency Key", "POST", "api/contact", 200,
+                                          data=test_data, extra_headers={"Idempotency-Key": key})
+        if not success:
+            return False
+        success, replay, _ = self.run_test("Contact Form - Idempotency Key Replay", "POST", "api/contact", 200,
+                                           data=test_data, extra_headers={"Idempotency-Key": key})
+        if success and replay.get('reference') != first.get('reference'):
+            print(f"❌ Replay got a new reference: {replay.get('reference')} != {first.get('reference')}")
+            return False
+        conflicting = dict(test_data, message="Un tout autre message avec la même clé.")
+        success, _, _ = self.run_test("Contact Form - Idempotency Key Conflict", "POST", "api/contact", 409,
+                                      data=conflicting, extra_headers={"Idempotency-Key": key})
+        return success
+
     def test_rate_limiting(self):
         """Test rate limiting by making multiple requests quickly"""
         print(f"\n🔍 Testing Rate Limiting...")
@@ -150,13 +214,57 @@ class WebmaticAPITester:
         )
         return success, response.get('id') if success else None
 
+    def auth_headers(self):
+        return {'Authorization': f'Bearer {self.token}'} if self.token else None
+
     def test_get_status_checks(self):
         """Test getting all status checks"""
-        return self.run_test("Get Status Checks", "GET", "api/status", 200)
+        if not self.token:
+            print("\n⚠️  WEBMATIC_API_TOKEN not set, skipping authenticated Get Status Checks")
+            return False, {}, None
+        return self.run_test("Get Status Checks", "GET", "api/status", 200, extra_headers=self.auth_headers())
 
     def test_analytics_summary(self):
         """Test analytics summary endpoint"""
-        return self.run_test("Analytics Summary", "GET", "api/analytics/summary", 200)
+        if not self.token:
+            print("\n⚠️  WEBMATIC_API_TOKEN not set, skipping authenticated Analytics Summary")
+            return False, {}, None
+        return self.run_test("Analytics Summary", "GET", "api/analytics/summary", 200, extra_headers=self.auth_headers())
+
+    def test_analytics_timeseries(self):
+        """Test the bucketed analytics time series"""
+        if not self.token:
+            print("\n⚠️  WEBMATIC_API_TOKEN not set, skipping authenticated Analytics Time Series")
+            return False, {}, None
+        since = (datetime.utcnow() - timedelta(days=7)).isoformat()
+        success, data, _ = self.run_test("Analytics Time Series", "GET",
+                                         f"api/analytics/timeseries?granularity=day&start={since}", 200,
+                                         extra_headers=self.auth_headers())
+        if success and data.get("total") != sum(bucket["total"] for bucket in data.get("buckets", [])):
+            print("❌ Bucket counts do not add up to the total")
+            return False, data, None
+        return success, data, None
+
+    def test_read_endpoints_require_token(self):
+        """Test that the read endpoints reject missing and invalid tokens"""
+        results = [
+            self.run_test("Get Status Checks - No Token", "GET", "api/status", 401)[0],
+            self.run_test("Analytics Summary - No Token", "GET", "api/analytics/summary", 401)[0],
+            self.run_test("Analytics Summary - Invalid Token", "GET", "api/analytics/summary", 401,
+                          extra_headers={'Authorization': 'Bearer not-a-valid-token'})[0],
+            self.run_test("Analytics Time Series - No Token", "GET",
+                          "api/analytics/timeseries?start=2025-01-01T00:00:00", 401)[0],
+            self.run_test("Admin Export - No Token", "GET", "api/admin/export/contacts?since=2025-01-01", 401)[0],
+            self.run_test("Admin Profiling - No Token", "GET", "api/admin/profiling", 401)[0],
+            self.run_test("Admin Database - No Token", "GET", "api/admin/database", 401)[0],
+        ]
+        if self.token:
+            # The smoke test token has no admin scope
+            results.append(self.run_test("Admin Export - Not Admin", "GET", "api/admin/export/contacts?since=2025-01-01",
+                                         403, extra_headers=self.auth_headers())[0])
+            results.append(self.run_test("Admin Profiling - Not Admin", "POST", "api/admin/profiling", 403,
+                                         data={"sample_rate": 1}, extra_headers=self.auth_headers())[0])
+        return all(results)
 
 def main():
     print("🚀 Starting Comprehensive Webmatic Backend API Tests")
@@ -170,6 +278,8 @@ def main():
     print("-" * 30)
     tester.test_root_endpoint()
     tester.test_health_endpoint()
+    tester.test_readiness_endpoint()
+    tester.test_conditional_get()
     
     # Test security features
     print("\n🔒 SECURITY FEATURES")
@@ -183,13 +293,17 @@ def main():
     tester.test_contact_form_valid()
     tester.test_contact_form_invalid_email()
     tester.test_contact_form_spam_detection()
+    tester.test_contact_form_duplicate()
+    tester.test_contact_form_idempotency_key()
     
     # Test status and analytics
     print("\n📊 STATUS & ANALYTICS")
     print("-" * 30)
     success, status_id = tester.test_create_status_check()
+    tester.test_read_endpoints_require_token()
     tester.test_get_status_checks()
     tester.test_analytics_summary()
+    tester.test_analytics_timeseries()
 
     # Print final results
     print("\n" + "=" * 60)
@@ -0,0 +1,51 @@
+import asyncio
+
+from client_address import TrustedProxies
+from rate_limit import MemoryRateLimitBackend
+
+
+def scope(peer, *forwarded_for):
+    return {
+        "type": "http",
+        "path": "/api/",
+        "client": (peer, 50000),
+        "headers": [(b"x-forwarded-for", value.encode("latin-1")) for value in forwarded_for],
+    }
+
+
+def test_header_ignored_without_trusted_proxies():
+    proxies = TrustedProxies()
+    assert proxies.client_ip(scope("203.0.113.7", "198.51.100.1")) == "203.0.113.7"
+
+
+def test_rightmost_untrusted_hop_with_proxy_networks():
+    proxies = TrustedProxies(["10.0.0.0/8"])
+    assert proxies.client_ip(scope("10.0.0.2", "198.51.100.1, 203.0.113.7, 10.0.0.1")) == "203.0.113.7"
+    # The header is only believed when the peer is a proxy
+    assert proxies.client_ip(scope("203.0.113.7", "198.51.100.1")) == "203.0.113.7"
+    # Repeated headers are one list, in order
+    assert proxies.client_ip(scope("10.0.0.2", "198.51.100.1", "203.0.113.7")) == "203.0.113.7"
+    assert proxies.client_ip(scope("::ffff:10.0.0.2", "203.0.113.7")) == "203.0.113.7"
+
+
+def test_hop_count():
+    proxies = TrustedProxies(hops=2)
+    assert proxies.client_ip(scope("10.0.0.2", "198.51.100.1, 203.0.113.7, 10.0.0.1")) == "203.0.113.7"
+    assert proxies.client_ip(scope("10.0.0.2")) == "10.0.0.2"
+
+
+def test_spoofed_header_keeps_rate_limit_key():
+    proxies = TrustedProxies(["10.0.0.0/8"])
+    backend = MemoryRateLimitBackend(calls=5, period=60)
+
+    async def hits():
+        results = []
+        for number in range(10):
+            # A client behind the load balancer makes up a new address every time
+            client_ip = proxies.client_ip(scope("10.0.0.2", f"198.51.100.{number}, 203.0.113.7"))
+            assert client_ip == "203.0.113.7"
+            results.append(await backend.hit(client_ip))
+        return results
+
+    assert asyncio.run(hits()) == [True] * 5 + [False] * 5
+    assert len(backend.limiter) == 1
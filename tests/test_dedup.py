@@ -0,0 +1,178 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from benchmarks import common
+from benchmarks.mongo_standin import StandinClient, StandinCollection
+from dedup import ClaimPending, ContactDeduplicator, IdempotencyConflict
+
+CONTACT = {
+    "name": "Jean Dupont",
+    "email": "jean.dupont@example.com",
+    "service": "Création de site web",
+    "message": "Bonjour, je souhaiterais créer un site web pour mon entreprise.",
+}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fingerprints():
+    return StandinClient(latency=0)["test"].contact_fingerprints
+
+
+async def stored(deduplicator, key, fingerprint, reference):
+    assert await deduplicator.claim(key, fingerprint, reference) is None
+    await deduplicator.confirm(key, fingerprint, reference)
+
+
+def test_expired_claim_is_taken_over():
+    async def run():
+        collection = fingerprints()
+        await stored(ContactDeduplicator(collection, ttl=3600), "content:a", "a", "first")
+        # Past the TTL, not yet removed by the TTL monitor
+        await collection.update_one({"_id": "content:a"},
+                                    {"$set": {"created_at": datetime.utcnow() - timedelta(hours=2)}})
+
+        other_workers = [ContactDeduplicator(collection, ttl=3600) for _ in range(2)]
+        return await asyncio.gather(
+            *(worker.claim("content:a", "a", reference) for worker, reference in zip(other_workers, ("new1", "new2"))),
+            return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    # One racing request takes the claim over; the other sees it in progress
+    assert first is None
+    assert isinstance(second, ClaimPending)
+
+
+def test_only_confirmed_claims_answer_duplicates():
+    async def run():
+        deduplicator = ContactDeduplicator(fingerprints())
+        assert await deduplicator.claim("content:a", "a", "first") is None
+        with pytest.raises(ClaimPending):
+            await deduplicator.claim("content:a", "a", "second")
+        await deduplicator.confirm("content:a", "a", "first")
+        return await deduplicator.claim("content:a", "a", "third")
+
+    assert asyncio.run(run()) == "first"
+
+
+def test_abandoned_pending_claim_is_free_after_deadline():
+    async def run():
+        collection = fingerprints()
+        assert await ContactDeduplicator(collection).claim("content:a", "a", "lost") is None
+        await collection.update_one({"_id": "content:a"},
+                                    {"$set": {"created_at": datetime.utcnow() - timedelta(minutes=1)}})
+        return await ContactDeduplicator(collection, pending_ttl=30).claim("content:a", "a", "retry")
+
+    assert asyncio.run(run()) is None
+
+
+def test_reused_idempotency_key_conflicts():
+    async def run():
+        collection = fingerprints()
+        key = ContactDeduplicator.key_for("a", "client-key")
+        await stored(ContactDeduplicator(collection), key, "a", "first")
+        for deduplicator in (ContactDeduplicator(collection), ContactDeduplicator(collection)):
+            with pytest.raises(IdempotencyConflict):
+                await deduplicator.claim(key, "b", "second")
+
+    asyncio.run(run())
+
+
+def test_memory_entries_expire_and_are_bounded():
+    async def run():
+        clock = Clock()
+        collection = fingerprints()
+        deduplicator = ContactDeduplicator(collection, ttl=60, max_entries=2, clock=clock)
+        for name in "abc":
+            await stored(deduplicator, f"content:{name}", name, name)
+        assert list(deduplicator._cache) == ["content:b", "content:c"]
+
+        await collection.delete_many({})  # the TTL monitor ran
+        assert await deduplicator.claim("content:c", "c", "again") == "c"
+        clock.now = 61
+        assert await deduplicator.claim("content:c", "c", "again") is None
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def server():
+    server = common.use_database(StandinClient(latency=0)["test"])
+    writer, server.contact_writer = server.contact_writer, None
+    server.contact_dedup._cache.clear()  # claims remembered from another database
+    yield server
+    server.contact_writer = writer
+
+
+async def post_contact(server, headers=None, contact=CONTACT):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as http:
+        return await http.post("/api/contact", json=contact, headers=headers or {})
+
+
+def fail(name, method):
+    original = getattr(StandinCollection, method)
+
+    async def failing(self, *args, **kwargs):
+        if self.name == name:
+            raise RuntimeError(f"{name}.{method} failed")
+        return await original(self, *args, **kwargs)
+    return failing
+
+
+def test_api_conflict_on_reused_idempotency_key(server):
+    async def run():
+        first = await post_contact(server, {"Idempotency-Key": "k1"})
+        replay = await post_contact(server, {"Idempotency-Key": "k1"})
+        conflict = await post_contact(server, {"Idempotency-Key": "k1"},
+                                      dict(CONTACT, message=CONTACT["message"] + " Merci."))
+        return first, replay, conflict
+
+    first, replay, conflict = asyncio.run(run())
+    assert first.status_code == replay.status_code == 200
+    assert replay.json()["reference"] == first.json()["reference"]
+    assert conflict.status_code == 409
+
+
+def test_api_releases_claim_when_insert_fails(server, monkeypatch):
+    async def run():
+        with monkeypatch.context() as patch:
+            patch.setattr(StandinCollection, "insert_one", fail("contacts", "insert_one"))
+            failed = await post_contact(server)
+        retry = await post_contact(server)
+        return failed, retry, await server.db.contacts.count_documents({})
+
+    failed, retry, count = asyncio.run(run())
+    assert failed.status_code == 500
+    assert retry.status_code == 200
+    assert count == 1
+
+
+def test_api_never_reports_unstored_contact(server, monkeypatch):
+    async def run():
+        with monkeypatch.context() as patch:
+            patch.setattr(StandinCollection, "insert_one", fail("contacts", "insert_one"))
+            patch.setattr(StandinCollection, "delete_one", fail("contact_fingerprints", "delete_one"))
+            failed = await post_contact(server)
+        # The claim is left pending: a retry is asked to wait, not told it was stored
+        early = await post_contact(server)
+        server.contact_dedup.pending_ttl = 0
+        try:
+            late = await post_contact(server)
+        finally:
+            server.contact_dedup.pending_ttl = 30
+        return failed, early, late, await server.db.contacts.count_documents({})
+
+    failed, early, late, count = asyncio.run(run())
+    assert failed.status_code == 500
+    assert early.status_code == 409
+    assert late.status_code == 200
+    assert count == 1
@@ -0,0 +1,52 @@
+import asyncio
+
+from client_address import TrustedProxies
+from ip_reputation import IPReputation, IPReputationMiddleware
+
+
+def request(middleware, peer, forwarded_for=None):
+    scope = {
+        "type": "http",
+        "path": "/api/contact",
+        "client": (peer, 50000),
+        "headers": [(b"x-forwarded-for", forwarded_for.encode("latin-1"))] if forwarded_for else [],
+    }
+    statuses = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    asyncio.run(middleware(scope, None, send))
+    return statuses[0]
+
+
+def middleware(tmp_path, proxies):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    blocklist = tmp_path / "drop.txt"
+    blocklist.write_text("203.0.113.0/24 ; SBL000001\n")
+    allowlist = tmp_path / "allow.txt"
+    allowlist.write_text("192.0.2.10\n")
+    reputation = IPReputation([blocklist], [allowlist])
+    reputation.reload()
+    return IPReputationMiddleware(app, reputation, client_ip=proxies.client_ip)
+
+
+def test_spoofed_header_still_blocked_direct(tmp_path):
+    blocking = middleware(tmp_path, TrustedProxies())
+    assert request(blocking, "203.0.113.7") == 403
+    assert request(blocking, "203.0.113.7", "198.51.100.1") == 403
+    # An allowlisted address in the header does not lift the block
+    assert request(blocking, "203.0.113.7", "192.0.2.10") == 403
+    assert request(blocking, "198.51.100.1", "203.0.113.7") == 200
+
+
+def test_spoofed_header_still_blocked_behind_proxy(tmp_path):
+    blocking = middleware(tmp_path, TrustedProxies(["10.0.0.0/8"]))
+    assert request(blocking, "10.0.0.2", "203.0.113.7") == 403
+    assert request(blocking, "10.0.0.2", "192.0.2.10, 203.0.113.7") == 403
+    assert request(blocking, "10.0.0.2", "198.51.100.1, 203.0.113.7") == 403
+    assert request(blocking, "10.0.0.2", "203.0.113.7, 198.51.100.1") == 200
@@ -0,0 +1,19 @@
+import asyncio
+
+from resilience import CLOSED, CircuitBreaker, ConcurrencyLimiter, DatabaseGuard
+
+
+def test_cancelled_calls_do_not_open_the_breaker():
+    async def run():
+        guard = DatabaseGuard(CircuitBreaker(min_calls=5), ConcurrencyLimiter())
+        calls = [asyncio.create_task(guard.run("find", asyncio.sleep, 10)) for _ in range(20)]
+        await asyncio.sleep(0)
+        for call in calls:
+            call.cancel()  # clients that disconnected mid-query
+        await asyncio.gather(*calls, return_exceptions=True)
+        return guard
+
+    guard = asyncio.run(run())
+    assert guard.breaker.state == CLOSED
+    assert not guard.breaker._outcomes
+    assert guard.limiter.waiting == 0